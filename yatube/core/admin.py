@@ -0,0 +1,16 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    '''Очередь задач: состояние, попытки и последняя ошибка.'''
+    list_display = (
+        'pk', 'name', 'status', 'attempts', 'run_at', 'duration', 'dedup_key'
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('dedup_key',)
+    readonly_fields = ('created', 'started', 'duration', 'error')
+
+
+admin.site.register(Job, JobAdmin)
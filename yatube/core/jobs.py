@@ -0,0 +1,228 @@
+import datetime as dt
+import json
+import logging
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Avg, Count, F, Max
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором растёт вдвое с каждой неудачной попыткой.
+RETRY_DELAY = 30
+# Задача, которая выполняется дольше, считается брошенной упавшим
+# воркером и снова ставится в очередь.
+STALE_AFTER = 60 * 60
+
+TASKS = {}
+# Счётчики этого процесса: задачи в режиме 'thread' не попадают в базу.
+STATS = Counter()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def task(name=None, max_attempts=3):
+    '''Зарегистрировать функцию как задачу.
+
+    У функции появляется метод delay(*args, dedup_key=None, delay=0,
+    **kwargs), который ставит её в очередь. Аргументы должны
+    сериализоваться в JSON, поэтому вместо объектов передают их id.
+    '''
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        TASKS[task_name] = func
+        func.task_name = task_name
+        func.max_attempts = max_attempts
+
+        def delay(*args, **kwargs):
+            return enqueue(task_name, *args, **kwargs)
+
+        func.delay = delay
+        return func
+    return register
+
+
+def enqueue(name, *args, dedup_key=None, delay=0, **kwargs):
+    '''Поставить задачу name в очередь способом из settings.JOBS_BACKEND.
+
+    'database' сохраняет строку Job для воркера run_jobs; если задача
+    с тем же dedup_key ещё ждёт в очереди, возвращается она.
+    'thread' выполняет задачу после коммита в пуле потоков этого
+    процесса: быстро, но задача теряется при перезапуске.
+    'eager' выполняет её сразу, как в тестах.
+    '''
+    func = TASKS[name]
+    backend = settings.JOBS_BACKEND
+    if backend == 'eager':
+        func(*args, **kwargs)
+        return None
+    if backend == 'thread':
+        transaction.on_commit(
+            lambda: executor().submit(run_in_thread, name, args, kwargs)
+        )
+        return None
+    job = Job(
+        name=name,
+        payload=json.dumps({'args': args, 'kwargs': kwargs}),
+        dedup_key=dedup_key,
+        max_attempts=func.max_attempts,
+        run_at=timezone.now() + dt.timedelta(seconds=delay),
+    )
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        if dedup_key is None:
+            raise
+        STATS['deduplicated'] += 1
+        return Job.objects.filter(
+            dedup_key=dedup_key, status=Job.QUEUED
+        ).first()
+    STATS['enqueued'] += 1
+    return job
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.JOBS_THREADS,
+                thread_name_prefix='jobs',
+            )
+        return _executor
+
+
+def run_in_thread(name, args, kwargs):
+    started = time.monotonic()
+    try:
+        TASKS[name](*args, **kwargs)
+        STATS['done'] += 1
+    except Exception:
+        STATS['failed'] += 1
+        logger.exception('Задача %s не выполнена', name)
+    finally:
+        STATS['seconds'] += time.monotonic() - started
+        # У каждого потока своё соединение с базой, его нужно закрыть.
+        connections.close_all()
+
+
+def claim(limit):
+    '''Взять до limit готовых к запуску задач.
+
+    Задача переводится в RUNNING условным UPDATE, поэтому несколько
+    воркеров не получат одну и ту же задачу.
+    '''
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now
+    ).values_list('pk', flat=True)[:limit]
+    claimed = [
+        pk for pk in candidates
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started=now, attempts=F('attempts') + 1
+        )
+    ]
+    return list(Job.objects.filter(pk__in=claimed))
+
+
+def run(job):
+    '''Выполнить задачу и записать результат.
+
+    Упавшая задача возвращается в очередь с растущей паузой, пока не
+    исчерпает max_attempts.
+    '''
+    started = time.monotonic()
+    try:
+        payload = json.loads(job.payload)
+        TASKS[job.name](*payload['args'], **payload['kwargs'])
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + dt.timedelta(
+                seconds=RETRY_DELAY * 2 ** (job.attempts - 1)
+            )
+            STATS['retried'] += 1
+        else:
+            job.status = Job.FAILED
+            STATS['failed'] += 1
+    else:
+        job.status = Job.DONE
+        STATS['done'] += 1
+    job.duration = time.monotonic() - started
+    STATS['seconds'] += job.duration
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        # В очереди уже ждёт задача с тем же ключом, она и повторит работу.
+        job.status = Job.FAILED
+        job.save()
+    return job
+
+
+def run_pending(limit=100):
+    '''Выполнить задачи, готовые к запуску, вернуть их число.'''
+    jobs = claim(limit)
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+def requeue_stale(seconds=STALE_AFTER):
+    '''Вернуть в очередь задачи, брошенные упавшим воркером.
+
+    Если задача с тем же ключом уже ждёт в очереди, брошенная
+    помечается ошибкой: работу повторит ожидающая.
+    '''
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        started__lt=timezone.now() - dt.timedelta(seconds=seconds),
+    )
+    waiting = Job.objects.filter(
+        status=Job.QUEUED, dedup_key__isnull=False
+    ).values('dedup_key')
+    with transaction.atomic():
+        stale.filter(dedup_key__in=waiting).update(status=Job.FAILED)
+        return stale.update(status=Job.QUEUED)
+
+
+def purge(days):
+    '''Удалить выполненные задачи старше days дней.'''
+    return Job.objects.filter(
+        status=Job.DONE,
+        created__lt=timezone.now() - dt.timedelta(days=days),
+    ).delete()[0]
+
+
+def metrics():
+    '''Сводка очереди по задачам: число в каждом состоянии и время.'''
+    found = {}
+    rows = Job.objects.order_by().values('name', 'status').annotate(
+        count=Count('pk'),
+        avg_duration=Avg('duration'),
+        most_attempts=Max('attempts'),
+    )
+    for row in rows:
+        item = found.setdefault(row['name'], {
+            'avg_duration': None, 'most_attempts': 0,
+            **{status: 0 for status, label in Job.STATUSES},
+        })
+        item[row['status']] = row['count']
+        item['most_attempts'] = max(
+            item['most_attempts'], row['most_attempts']
+        )
+        if row['status'] == Job.DONE:
+            item['avg_duration'] = row['avg_duration']
+    return found
@@ -0,0 +1,60 @@
+import time
+
+from django.contrib.auth import SESSION_KEY
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from core.ratelimit import rate_limit
+
+
+REQUESTS = 10000
+BUDGET = 100
+
+
+class Command(BaseCommand):
+    help = (
+        'Замерить накладные расходы ограничения частоты запросов на один '
+        'запрос: пропущенный, отклонённый и без лимитов. '
+        'Кеш ограничений берётся из настроек.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=REQUESTS,
+            help='Сколько запросов отправить в каждом замере.'
+        )
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        factory = RequestFactory()
+        request = factory.post('/', REMOTE_ADDR='10.0.0.1')
+        request.session = {SESSION_KEY: '1'}
+        response = HttpResponse()
+        # Представление почти ничего не делает: замер показывает цену
+        # самой проверки, а для отказа - ещё и ответа 429.
+        view = rate_limit('benchmark')(lambda request: response)
+        baseline = self.measure(lambda request: response, request, count)
+        seed = time.time()
+        cases = (
+            ('Пропущенные', ((count * 2, 3600), (count * 2, 3600))),
+            ('Отклонённые', ((1, 3600), (1, 3600))),
+            ('Без лимитов', None),
+        )
+        for index, (label, limits) in enumerate(cases):
+            with override_settings(RATE_LIMITS={'benchmark': limits}):
+                # Свежие ведра при каждом запуске, даже в общем кеше.
+                request.META['REMOTE_ADDR'] = f'benchmark-{index}-{seed}'
+                elapsed = self.measure(view, request, count) - baseline
+            micros = elapsed / count * 1e6
+            style = self.style.SUCCESS if micros < BUDGET else self.style.ERROR
+            self.stdout.write(style(
+                f'{label}: {micros:.1f} мкс на запрос (бюджет {BUDGET} мкс)'
+            ))
+
+    def measure(self, view, request, count):
+        started = time.perf_counter()
+        for _ in range(count):
+            view(request)
+        return time.perf_counter() - started
@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import jobs
+
+
+BATCH_SIZE = 100
+POLL_INTERVAL = 1.0
+KEEP_DAYS = 7
+
+
+class Command(BaseCommand):
+    help = (
+        'Воркер очереди задач core.jobs: забирает готовые задачи пачками '
+        'и выполняет их, повторяя упавшие. Воркеров можно запустить '
+        'несколько, задача достаётся только одному.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и выйти.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько задач забирать за один запрос.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, с.'
+        )
+        parser.add_argument(
+            '--keep-days', type=int, default=KEEP_DAYS,
+            help='Сколько дней хранить выполненные задачи.'
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Показать сводку очереди и выйти.'
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.show_stats()
+            return
+        jobs.requeue_stale()
+        jobs.purge(options['keep_days'])
+        started = time.monotonic()
+        done = 0
+        try:
+            while True:
+                close_old_connections()
+                count = jobs.run_pending(options['batch_size'])
+                done += count
+                if count:
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f'Выполнено задач: {done} '
+                        f'({done / elapsed:.1f} задач/с)'
+                    )
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(
+            f'Итого: выполнено {jobs.STATS["done"]}, '
+            f'повторов {jobs.STATS["retried"]}, '
+            f'ошибок {jobs.STATS["failed"]}.'
+        )
+
+    def show_stats(self):
+        for name, item in sorted(jobs.metrics().items()):
+            duration = item['avg_duration']
+            self.stdout.write(
+                f'{name}: в очереди {item["queued"]}, '
+                f'выполняется {item["running"]}, '
+                f'выполнено {item["done"]}, ошибок {item["failed"]}, '
+                f'среднее время '
+                f'{"-" if duration is None else f"{duration:.3f} с"}, '
+                f'попыток до {item["most_attempts"]}'
+            )
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class CreatedModel(models.Model):
@@ -6,8 +7,97 @@ class CreatedModel(models.Model):
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True,
+        db_index=True,
         help_text='Отображает дату'
     )
 
     class Meta:
         abstract = True
+
+
+class Job(models.Model):
+    '''Отложенная задача для воркера run_jobs.'''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        max_length=100,
+        verbose_name='Задача',
+        help_text='Имя задачи из реестра core.jobs'
+    )
+    payload = models.TextField(
+        default='{}',
+        verbose_name='Аргументы',
+        help_text='Аргументы задачи в JSON'
+    )
+    dedup_key = models.CharField(
+        max_length=200,
+        blank=True,
+        null=True,
+        verbose_name='Ключ дедупликации',
+        help_text='В очереди может ждать только одна задача с этим ключом'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+        verbose_name='Состояние'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток'
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3,
+        verbose_name='Максимум попыток'
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Запустить не раньше'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Поставлена'
+    )
+    started = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name='Начата'
+    )
+    duration = models.FloatField(
+        blank=True,
+        null=True,
+        verbose_name='Длительность, с'
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка'
+    )
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+    class Meta:
+        ordering = ('run_at',)
+        indexes = (
+            models.Index(
+                fields=('status', 'run_at'), name='core_job_status_run_at'
+            ),
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('dedup_key',),
+                condition=models.Q(status='queued'),
+                name='core_job_queued_dedup_key',
+            ),
+        )
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
@@ -0,0 +1,127 @@
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+TOO_MANY_REQUESTS = 429
+MESSAGE = 'Слишком много запросов, попробуйте позже.'
+
+
+def client_ip(request):
+    '''Адрес клиента из REMOTE_ADDR или заголовка прокси.
+
+    Начало X-Forwarded-For присылает сам клиент, и ему нельзя верить:
+    берётся последний адрес, который дописал наш прокси. Поэтому
+    перед приложением должен стоять ровно один прокси; заголовок,
+    который прокси выставляет целиком (X-Real-IP), надёжнее. Запрос
+    без заголовка (мимо прокси) считается по REMOTE_ADDR, иначе все
+    такие клиенты делили бы одно ведро с пустым адресом.
+    '''
+    header = settings.RATE_LIMIT_IP_HEADER
+    address = request.META.get(header, '') if header else ''
+    return (
+        address.split(',')[-1].strip() or request.META.get('REMOTE_ADDR', '')
+    )
+
+
+def take(key, count, seconds, cache=None):
+    '''Взять жетон из ведра key, вернуть паузу в секундах или 0.
+
+    Ведро вмещает count жетонов и наполняется целиком за seconds.
+    В кеше хранится момент в мс, когда ведро снова станет полным
+    (GCRA): каждый запрос атомарно сдвигает его incr на цену жетона,
+    отказ возвращает сдвиг decr. Пока ведро полное, ключа нет - он
+    живёт не дольше seconds. Гонка возможна только при
+    переустановке устаревшего момента и стоит одного лишнего жетона.
+    '''
+    cache = cache or caches[settings.RATE_LIMIT_CACHE]
+    price = seconds * 1000 // count
+    now = int(time.time() * 1000)
+    try:
+        full_at = cache.incr(key, price)
+    except ValueError:
+        if cache.add(key, now + price, seconds + 1):
+            return 0
+        full_at = cache.incr(key, price)
+    if full_at - price < now:
+        # Ведро успело наполниться: отсчёт идёт от текущего момента.
+        cache.set(key, now + price, seconds + 1)
+        return 0
+    wait = full_at - now - seconds * 1000
+    if wait > 0:
+        cache.decr(key, price)
+        return math.ceil(wait / 1000)
+    cache.touch(key, seconds + 1)
+    return 0
+
+
+def give_back(key, count, seconds, cache=None):
+    '''Вернуть в ведро key жетон, взятый take.'''
+    cache = cache or caches[settings.RATE_LIMIT_CACHE]
+    try:
+        cache.decr(key, seconds * 1000 // count)
+    except ValueError:
+        # Ключ истёк: ведро и так полное.
+        pass
+
+
+def check(request, name):
+    '''Пауза до следующего разрешённого запроса к name или 0.
+
+    Сначала проверяется ведро адреса клиента: отказ по нему не
+    обращается к базе. Ведро пользователя берёт id из сессии, не
+    загружая самого пользователя, но с сессиями в базе (по умолчанию)
+    это один SELECT сессии до отказа. Если отказывает ведро
+    пользователя, жетон адреса возвращается: соседи по адресу за чужой
+    отказ не платят.
+    '''
+    limits = settings.RATE_LIMITS.get(name)
+    if not limits:
+        return 0
+    user_limit, ip_limit = limits
+    ip_key = f'rl:{name}:ip:{client_ip(request)}'
+    if ip_limit:
+        wait = take(ip_key, *ip_limit)
+        if wait:
+            return wait
+    if user_limit and hasattr(request, 'session'):
+        user_id = request.session.get(SESSION_KEY)
+        if user_id is not None:
+            wait = take(f'rl:{name}:user:{user_id}', *user_limit)
+            if wait and ip_limit:
+                give_back(ip_key, *ip_limit)
+            return wait
+    return 0
+
+
+def too_many_requests(wait):
+    response = HttpResponse(
+        MESSAGE, status=TOO_MANY_REQUESTS,
+        content_type='text/plain; charset=utf-8'
+    )
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def rate_limit(name, methods=('POST',)):
+    '''Ограничить частоту запросов к представлению.
+
+    Лимиты берутся из settings.RATE_LIMITS[name]. methods - методы,
+    которые расходуют жетоны, None - все. Декоратор ставится над
+    login_required, чтобы отказ приходил раньше работы представления.
+    '''
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                wait = check(request, name)
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
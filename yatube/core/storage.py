@@ -0,0 +1,76 @@
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.utils.functional import cached_property
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.map', '.svg', '.txt', '.html', '.json', '.xml', '.ico',
+)
+MIN_COMPRESS_SIZE = 256
+
+
+def compressors():
+    '''Доступные алгоритмы: (расширение файла, функция сжатия).'''
+    # mtime=0 делает .gz побайтно воспроизводимыми между сборками.
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    '''Статика с хешем содержимого в именах и заранее сжатыми копиями.
+
+    collectstatic кладёт рядом с файлами css/js/svg их .gz и, если
+    установлен пакет brotli, .br версии; core.views.static выбирает
+    подходящую по заголовку Accept-Encoding.
+    '''
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths) | set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as file:
+            data = file.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        for extension, compress in compressors():
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            self._save(name + extension, ContentFile(compressed))
+
+    @property
+    def manifest_strict(self):
+        return settings.STATIC_MANIFEST_STRICT
+
+    def stored_name(self, name):
+        # Без строгого манифеста (тесты и разработка без collectstatic)
+        # файлы, которых в нём нет, отдаются под обычным именем. В бою
+        # устаревший манифест должен сорвать выкладку, а не отдавать
+        # имена без хеша.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            if self.manifest_strict:
+                raise
+            return name
+
+    @cached_property
+    def hashed_names(self):
+        '''Имена файлов с хешем содержимого: их можно кешировать навсегда.'''
+        return frozenset(self.hashed_files.values())
@@ -0,0 +1,25 @@
+from django.test.runner import DiscoverRunner as BaseRunner
+from django.test.utils import override_settings
+
+
+class DiscoverRunner(BaseRunner):
+    '''Запуск тестов без ограничения частоты запросов и потока сброса.
+
+    Тесты шлют десятки запросов с одного адреса за секунды, а ведра
+    в кеше переживают откат базы между тестами. Тесты лимитов
+    включают их через override_settings. Поток сброса просмотров писал
+    бы в базу посреди чужого теста; тесты счётчиков сбрасывают сами.
+    Статика в тестах не собрана, поэтому манифест не строгий.
+    '''
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.rate_limits = override_settings(
+            RATE_LIMITS={}, VIEW_COUNT_FLUSH_THREAD=False,
+            STATIC_MANIFEST_STRICT=False,
+        )
+        self.rate_limits.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.rate_limits.disable()
+        super().teardown_test_environment(**kwargs)
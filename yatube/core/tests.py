@@ -1,5 +1,33 @@
+import os
+import shutil
+import tempfile
 from http import HTTPStatus
-from django.test import TestCase
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db.models import F
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils.functional import empty
+
+from posts.models import Comment, Post, User
+from . import jobs, ratelimit
+from .models import Job
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CONTENT = b'0123456789'
+CALLS = []
+
+
+@jobs.task(name='core.tests.remember', max_attempts=2)
+def remember(value):
+    if value == 'fail':
+        raise ValueError(value)
+    CALLS.append(value)
 
 
 class ViewTestClass(TestCase):
@@ -7,3 +35,286 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in (
+            'posts/file.txt', 'cache/ab/file.txt', 'posts/кактус 1.txt'
+        ):
+            path = os.path.join(TEMP_MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_media_file(self):
+        '''Файл отдаётся целиком с ETag и заголовками кеширования.'''
+        response = self.client.get('/media/posts/file.txt')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertIn('ETag', response)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_thumbnail_is_not_immutable(self):
+        '''Миниатюры кешируются на обычный срок: их имя не от содержимого.'''
+        response = self.client.get('/media/cache/ab/file.txt')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn(
+            f'max-age={settings.MEDIA_MAX_AGE}', response['Cache-Control']
+        )
+
+    def test_if_none_match(self):
+        '''Совпавший ETag даёт 304 без тела.'''
+        etag = self.client.get('/media/posts/file.txt')['ETag']
+        response = self.client.get(
+            '/media/posts/file.txt', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_range(self):
+        '''Запрос с Range возвращает только часть файла.'''
+        cases = (
+            ('bytes=2-4', b'234'),
+            ('bytes=7-', b'789'),
+            ('bytes=-2', b'89'),
+        )
+        for header, expected in cases:
+            with self.subTest(header=header):
+                response = self.client.get(
+                    '/media/posts/file.txt', HTTP_RANGE=header
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.PARTIAL_CONTENT
+                )
+                self.assertEqual(
+                    b''.join(response.streaming_content), expected
+                )
+        response = self.client.get(
+            '/media/posts/file.txt', HTTP_RANGE='bytes=20-'
+        )
+        self.assertEqual(
+            response.status_code,
+            HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+
+    @override_settings(SENDFILE='X-Accel-Redirect')
+    def test_accel_redirect(self):
+        '''Передача файла поручается nginx.'''
+        response = self.client.get('/media/posts/file.txt')
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/internal-media/posts/file.txt'
+        )
+        self.assertEqual(response.content, b'')
+
+    @override_settings(SENDFILE='X-Accel-Redirect')
+    def test_accel_redirect_quotes_path(self):
+        '''Кириллица и пробелы в имени передаются nginx как %-коды.'''
+        response = self.client.get('/media/posts/кактус 1.txt')
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/internal-media/posts/%D0%BA%D0%B0%D0%BA%D1%82%D1%83%D1%81'
+            '%201.txt'
+        )
+
+    def test_missing_and_outside_files(self):
+        '''Несуществующие файлы и пути вне MEDIA_ROOT дают 404.'''
+        for url in ('/media/posts/none.txt', '/media/../manage.py'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+@override_settings(
+    STATIC_ROOT=os.path.join(TEMP_MEDIA_ROOT, 'collected_static'),
+    STATICFILES_DIRS=[os.path.join(TEMP_MEDIA_ROOT, 'static')],
+)
+class StaticFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        path = os.path.join(TEMP_MEDIA_ROOT, 'static', 'css', 'site.css')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write('body { color: red; }\n' * 100)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        staticfiles_storage._wrapped = empty
+        cls.hashed_name = staticfiles_storage.stored_name('css/site.css')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        staticfiles_storage._wrapped = empty
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        '''collectstatic создаёт файлы с хешем и их сжатые копии.'''
+        self.assertNotEqual(self.hashed_name, 'css/site.css')
+        for name in (self.hashed_name, self.hashed_name + '.gz'):
+            with self.subTest(name=name):
+                self.assertTrue(os.path.exists(
+                    os.path.join(settings.STATIC_ROOT, name)
+                ))
+
+    def test_compressed_variant_is_served(self):
+        '''Клиенту с поддержкой gzip отдаётся сжатая копия.'''
+        url = '/static/' + self.hashed_name
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(
+            b''.join(response.streaming_content),
+            b'body { color: red; }\n' * 100
+        )
+
+    def test_missing_manifest_entry(self):
+        '''Файла нет в манифесте: в бою ошибка, в разработке - имя как есть.'''
+        with self.settings(STATIC_MANIFEST_STRICT=True):
+            with self.assertRaises(ValueError):
+                staticfiles_storage.stored_name('css/missing.css')
+        self.assertEqual(
+            staticfiles_storage.stored_name('css/missing.css'),
+            'css/missing.css'
+        )
+
+    def test_unhashed_name_is_not_immutable(self):
+        '''Файл без хеша в имени не кешируется навсегда.'''
+        response = self.client.get('/static/css/site.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+
+@override_settings(JOBS_BACKEND='database')
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def run_worker(self):
+        call_command('run_jobs', once=True, stdout=StringIO())
+
+    def test_dedup_key_keeps_one_queued_job(self):
+        '''Пока задача ждёт в очереди, такая же не добавляется.'''
+        first = remember.delay('a', dedup_key='key')
+        second = remember.delay('a', dedup_key='key')
+        self.assertEqual(first.pk, second.pk)
+        self.run_worker()
+        remember.delay('a', dedup_key='key')
+        self.assertEqual(Job.objects.count(), 2)
+        self.assertEqual(CALLS, ['a'])
+
+    def test_failed_job_is_retried_then_failed(self):
+        '''Упавшая задача повторяется до max_attempts и сохраняет ошибку.'''
+        job = remember.delay('fail')
+        for _ in range(2):
+            self.run_worker()
+            Job.objects.update(run_at=F('created'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('ValueError', job.error)
+        self.assertEqual(jobs.metrics()[remember.task_name]['failed'], 1)
+
+    @override_settings(JOBS_BACKEND='eager')
+    def test_eager_backend_runs_inline(self):
+        remember.delay('b')
+        self.assertEqual(CALLS, ['b'])
+        self.assertFalse(Job.objects.exists())
+
+
+@override_settings(RATE_LIMITS={
+    'add_comment': ((2, 60), None),
+    'signup': (None, (1, 60)),
+})
+class RateLimitTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        caches[settings.RATE_LIMIT_CACHE].clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_bucket_refunds_rejected_requests(self):
+        '''Отказы не отодвигают момент, когда жетон вернётся.'''
+        self.assertEqual(
+            [ratelimit.take('bucket', 2, 60) for _ in range(2)], [0, 0]
+        )
+        waits = [ratelimit.take('bucket', 2, 60) for _ in range(5)]
+        self.assertTrue(all(0 < wait <= 30 for wait in waits))
+        self.assertEqual(ratelimit.take('other', 2, 60), 0)
+
+    def test_comments_are_limited_per_user(self):
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.id})
+        statuses = [
+            self.authorized_client.post(url, data={'text': 'Текст'})
+            .status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(statuses, [302, 302, 429])
+        self.assertEqual(Comment.objects.count(), 2)
+        another = User.objects.create(username='another')
+        self.authorized_client.force_login(another)
+        response = self.authorized_client.post(url, data={'text': 'Текст'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_signup_is_limited_per_ip(self):
+        '''Форма открывается свободно, отправка ограничена по адресу.'''
+        url = reverse('users:signup')
+        self.client.post(url, REMOTE_ADDR='10.0.0.1')
+        response = self.client.post(url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(RATE_LIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_forwarded_for_uses_proxy_entry(self):
+        '''Подставной адрес в начале X-Forwarded-For не обходит лимит.'''
+        url = reverse('users:signup')
+        statuses = [
+            self.client.post(
+                url, HTTP_X_FORWARDED_FOR=f'192.0.2.{index}, 10.0.0.1'
+            ).status_code
+            for index in range(2)
+        ]
+        self.assertEqual(statuses, [200, 429])
+
+    @override_settings(RATE_LIMIT_IP_HEADER='HTTP_X_REAL_IP')
+    def test_missing_header_falls_back_to_remote_addr(self):
+        '''Запросы без заголовка прокси не делят одно ведро.'''
+        url = reverse('users:signup')
+        statuses = [
+            self.client.post(url, REMOTE_ADDR=address).status_code
+            for address in ('10.0.0.1', '10.0.0.2')
+        ]
+        self.assertEqual(statuses, [200, 200])
+
+    @override_settings(RATE_LIMITS={'add_comment': ((1, 60), (2, 60))})
+    def test_user_refusal_returns_ip_token(self):
+        '''Отказ по ведру пользователя не расходует ведро адреса.'''
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.id})
+        statuses = [
+            self.authorized_client.post(url, data={'text': 'Текст'})
+            .status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(statuses, [302, 429, 429])
+        self.authorized_client.force_login(
+            User.objects.create(username='another')
+        )
+        response = self.authorized_client.post(url, data={'text': 'Текст'})
+        self.assertEqual(response.status_code, 302)
@@ -1,4 +1,26 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, StreamingHttpResponse
+)
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date, quote_etag, urlquote
+from django.views.decorators.http import require_safe
+
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+COMPRESSED_VARIANTS = (('.br', 'br'), ('.gz', 'gzip'))
 
 
 def page_not_found(request, exception):
@@ -11,3 +33,187 @@ def csrf_failure(request, reason=''):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+def parse_range(header, size):
+    '''Вернуть (start, end) из заголовка Range с одним диапазоном.
+
+    None означает, что заголовок нужно проигнорировать и отдать файл
+    целиком, ValueError - что диапазон невыполним.
+    '''
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError('Range Not Satisfiable')
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(FileResponse.block_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def accepted_encodings(header):
+    '''Кодировки из Accept-Encoding, кроме запрещённых через q=0.'''
+    encodings = set()
+    for part in (header or '').split(','):
+        name, *params = part.split(';')
+        quality = 1
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+def file_response(request, fullpath, accel_path, max_age, immutable=False,
+                  content_type=None):
+    '''Отдать файл с поддержкой ETag, Range и X-Accel-Redirect/X-Sendfile.
+
+    accel_path - адрес файла во внутреннем location nginx,
+    используется при SENDFILE = 'X-Accel-Redirect'.
+    '''
+    try:
+        stat = os.stat(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+    etag = quote_etag(f'{int(stat.st_mtime):x}-{stat.st_size:x}')
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        if content_type is None:
+            content_type, _ = mimetypes.guess_type(fullpath)
+        response = build_file_response(
+            request, fullpath, accel_path, stat, etag,
+            content_type or 'application/octet-stream'
+        )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if immutable:
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+def build_file_response(request, fullpath, accel_path, stat, etag,
+                        content_type):
+    if settings.SENDFILE == 'X-Accel-Redirect':
+        # nginx сам отдаст файл, обработав Range; Python байты не читает.
+        # Путь кодируется как URI: не-ASCII имя Django записал бы
+        # по RFC 2047, и nginx не нашёл бы файл.
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = urlquote(accel_path)
+        return response
+    if settings.SENDFILE == 'X-Sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+        return response
+
+    byte_range = None
+    if request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = parse_range(
+                request.META.get('HTTP_RANGE'), stat.st_size
+            )
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+    if byte_range is None:
+        response = FileResponse(
+            open(fullpath, 'rb'), content_type=content_type
+        )
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            read_range(fullpath, start, length),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def media(request, path):
+    '''Отдать загруженный пользователями файл из MEDIA_ROOT.
+
+    Миниатюры кешируются так же, как исходники: sorl строит их имя
+    из имени исходника и параметров, а не из содержимого, и новая
+    картинка под именем удалённой получила бы ту же миниатюру.
+    '''
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    return file_response(
+        request,
+        fullpath,
+        settings.MEDIA_ACCEL_PREFIX + path,
+        max_age=settings.MEDIA_MAX_AGE,
+    )
+
+
+@require_safe
+def static(request, path):
+    '''Отдать собранную collectstatic статику из STATIC_ROOT.
+
+    Если клиент принимает сжатые ответы и рядом лежит .br или .gz
+    копия, отдаётся она. Файлы с хешем содержимого в имени
+    кешируются навсегда.
+    '''
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    content_type, _ = mimetypes.guess_type(fullpath)
+    immutable = path in staticfiles_storage.hashed_names
+    encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING'))
+    encoding = None
+    for extension, name in COMPRESSED_VARIANTS:
+        if name in encodings and os.path.isfile(fullpath + extension):
+            fullpath += extension
+            path += extension
+            encoding = name
+            break
+    response = file_response(
+        request,
+        fullpath,
+        settings.STATIC_ACCEL_PREFIX + path,
+        max_age=settings.STATIC_MAX_AGE,
+        immutable=immutable,
+        content_type=content_type,
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -1,38 +1,187 @@
 from django.contrib import admin
-from .models import Post, Group, Comment, Follow
+from django.core.paginator import Paginator
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html_join
+from . import archive, tasks
+from .groups import active_authors_changed, post_moved
+from .images import find_similar_images
+from .models import Post, Group, Comment, Follow, TextHash
+from .search import is_supported, match_expression, matching_ids
+from .tags import update_post_tags
 
 
-class PostAdmin(admin.ModelAdmin):
+COUNT_LIMIT = 10000
+
+
+class LimitedCountPaginator(Paginator):
+    '''Считать строки не дальше COUNT_LIMIT вместо полного COUNT(*).
+
+    На больших таблицах список в админке покажет первые страницы,
+    а не будет ждать подсчёта всех строк.
+    '''
+
+    @cached_property
+    def count(self):
+        return self.object_list.order_by()[:COUNT_LIMIT].count()
+
+
+class UsernameFilter(admin.SimpleListFilter):
+    '''Фильтр по имени пользователя с подсказками из posts:autocomplete.
+
+    В отличие от фильтра по внешнему ключу не загружает в боковую
+    панель всех пользователей.
+    '''
+    template = 'admin/username_filter.html'
+    field = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(
+                **{f'{self.field}__username': self.value()}
+            )
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            'parameter_name': self.parameter_name,
+            'query_parts': [
+                (key, value)
+                for key, value in changelist.get_filters_params().items()
+                if key != self.parameter_name
+            ],
+            'clear_url': changelist.get_query_string(
+                remove=[self.parameter_name]
+            ),
+            'autocomplete_url': reverse(
+                'posts:autocomplete', args=('users',)
+            ),
+        }
+
+
+class AuthorFilter(UsernameFilter):
+    title = 'автор'
+    parameter_name = 'author'
+    field = 'author'
+
+
+class UserFilter(UsernameFilter):
+    title = 'подписчик'
+    parameter_name = 'user'
+    field = 'user'
+
+
+class FastChangeListMixin:
+    '''Общие настройки списков для больших таблиц.'''
+    paginator = LimitedCountPaginator
+    show_full_result_count = False
+    full_text_comments = None
+
+    def get_search_results(self, request, queryset, search_term):
+        '''Искать по полнотекстовому индексу вместо LIKE по всей таблице.'''
+        if (
+            self.full_text_comments is None
+            or not is_supported()
+            or match_expression(search_term) is None
+        ):
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        ids = matching_ids(search_term, comments=self.full_text_comments)
+        return queryset.filter(pk__in=ids), False
+
+
+class PostAdmin(FastChangeListMixin, admin.ModelAdmin):
     '''Настроить параметры отображения "Модель поста".'''
     list_display = ('pk', 'text', 'pub_date', 'author', 'group',)
-    list_editable = ('group', )
+    list_select_related = ('author', 'group')
+    # Группа меняется на странице поста через autocomplete: редактируемая
+    # колонка в списке стоила отдельного запроса и виджета на строку.
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text', )
+    full_text_comments = False
     list_filter = ('pub_date', )
+    readonly_fields = ('similar_images',)
     empty_value_display = '-пусто-'
 
+    def similar_images(self, obj):
+        '''Посты с похожими картинками, по индексу перцептивных хешей.'''
+        if not hasattr(obj, 'image_hash'):
+            return None
+        similar = find_similar_images(obj.image_hash.hash, exclude=obj.pk)
+        return format_html_join(
+            ', ',
+            '<a href="{}">#{}</a> ({} бит)',
+            (
+                (reverse('admin:posts_post_change', args=(pk,)), pk, distance)
+                for pk, distance in similar
+            )
+        ) or None
+    similar_images.short_description = 'Похожие картинки'
+
+    def save_model(self, request, obj, form, change):
+        old_group_id = form.initial.get('group')
+        old_author_id = form.initial.get('author')
+        super().save_model(request, obj, form, change)
+        if change and 'group' in form.changed_data:
+            post_moved(obj, old_group_id)
+            archive.post_moved(obj, old_group_id)
+        if change and 'author' in form.changed_data:
+            archive.post_reassigned(obj, old_author_id)
+            if obj.group_id is not None:
+                active_authors_changed(obj.group_id)
+        if not change or 'text' in form.changed_data:
+            update_post_tags(obj)
+        if 'image' in form.changed_data:
+            tasks.image_changed(obj)
+
 
 class GroupAdmin(admin.ModelAdmin):
     '''Настроить параметры отображения "Модель группы".'''
     prepopulated_fields = {"slug": ("title",)}
+    search_fields = ('title', 'slug')
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FastChangeListMixin, admin.ModelAdmin):
     '''Настроить параметры отображения "Модель комментария".'''
     list_display = ('pk', 'author', 'text', 'pub_date',)
-    search_fields = ('author', 'text', 'pub_date',)
-    list_filter = ('author',)
+    list_select_related = ('author',)
+    autocomplete_fields = ('author', 'post')
+    search_fields = ('text',)
+    full_text_comments = True
+    list_filter = (AuthorFilter,)
     empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(FastChangeListMixin, admin.ModelAdmin):
     '''Настроить параметры отображения "Модель подписки".'''
     list_display = ('pk', 'user', 'author',)
-    search_fields = ('user', 'author',)
-    list_filter = ('user', 'author',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('=user__username', '=author__username',)
+    list_filter = (UserFilter, AuthorFilter,)
     empty_value_display = 'нет подписчиков/подписок'
 
 
+class TextHashAdmin(FastChangeListMixin, admin.ModelAdmin):
+    '''Повторы текстов для проверки модератором.'''
+    list_display = ('pk', 'author', 'post', 'comment', 'is_duplicate',
+                    'pub_date',)
+    list_select_related = ('author', 'post', 'comment')
+    list_filter = ('is_duplicate', AuthorFilter,)
+    raw_id_fields = ('post', 'comment', 'author')
+    readonly_fields = ('hash', 'band0', 'band1', 'band2', 'band3')
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(TextHash, TextHashAdmin)
@@ -0,0 +1,121 @@
+import datetime as dt
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from .models import ArchiveMonth, Post
+
+
+ARCHIVE_LIMIT = 10
+
+
+def scopes(author_id, group_id):
+    '''Разделы архива, в которые попадает пост.'''
+    found = [('all', 0), ('author', author_id)]
+    if group_id is not None:
+        found.append(('group', group_id))
+    return found
+
+
+def month_of(pub_date):
+    local = timezone.localtime(pub_date)
+    return local.year, local.month
+
+
+def valid_month(year, month):
+    '''Месяц существует, и month_range сможет построить его границы.
+
+    Конец месяца - начало следующего, поэтому последний год, который
+    поддерживает datetime, не подходит.
+    '''
+    return dt.MINYEAR <= year < dt.MAXYEAR and 1 <= month <= 12
+
+
+def month_range(year, month):
+    '''Границы месяца [начало, начало следующего) в текущем часовом поясе.'''
+    start = dt.datetime(year, month, 1)
+    end = dt.datetime(year + month // 12, month % 12 + 1, 1)
+    return timezone.make_aware(start), timezone.make_aware(end)
+
+
+def change_month(scope, scope_id, pub_date, delta):
+    year, month = month_of(pub_date)
+    months = ArchiveMonth.objects.filter(
+        scope=scope, scope_id=scope_id, year=year, month=month
+    )
+    if months.update(post_count=F('post_count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            ArchiveMonth.objects.create(
+                scope=scope, scope_id=scope_id, year=year, month=month,
+                post_count=delta
+            )
+    except IntegrityError:
+        # Строку успел создать параллельный запрос.
+        months.update(post_count=F('post_count') + delta)
+
+
+def post_added(post):
+    for scope, scope_id in scopes(post.author_id, post.group_id):
+        change_month(scope, scope_id, post.pub_date, 1)
+
+
+def post_removed(post):
+    for scope, scope_id in scopes(post.author_id, post.group_id):
+        change_month(scope, scope_id, post.pub_date, -1)
+
+
+def post_moved(post, old_group_id):
+    '''Перенести пост в архиве из группы old_group_id в текущую.'''
+    if old_group_id == post.group_id:
+        return
+    if old_group_id is not None:
+        change_month('group', old_group_id, post.pub_date, -1)
+    if post.group_id is not None:
+        change_month('group', post.group_id, post.pub_date, 1)
+
+
+def post_reassigned(post, old_author_id):
+    '''Перенести пост в архиве от автора old_author_id к текущему.'''
+    if old_author_id == post.author_id:
+        return
+    change_month('author', old_author_id, post.pub_date, -1)
+    change_month('author', post.author_id, post.pub_date, 1)
+
+
+def archive_months(scope, scope_id=0):
+    '''Месяцы раздела с постами, новые первыми.'''
+    return ArchiveMonth.objects.filter(
+        scope=scope, scope_id=scope_id, post_count__gt=0
+    )
+
+
+def rebuild_archive():
+    '''Пересчитать сводку архива целиком, например после импорта.'''
+    months = Post.objects.order_by().annotate(
+        year=ExtractYear('pub_date'), month=ExtractMonth('pub_date')
+    )
+    rows = []
+    for scope, field, posts in (
+        ('all', None, months),
+        ('group', 'group', months.filter(group__isnull=False)),
+        ('author', 'author', months),
+    ):
+        keys = ('year', 'month') if field is None else (field, 'year', 'month')
+        rows.extend(
+            ArchiveMonth(
+                scope=scope,
+                scope_id=row[field] if field else 0,
+                year=row['year'],
+                month=row['month'],
+                post_count=row['count'],
+            )
+            for row in posts.values(*keys).annotate(count=Count('pk'))
+        )
+    with transaction.atomic():
+        ArchiveMonth.objects.all().delete()
+        ArchiveMonth.objects.bulk_create(rows)
+    return len(rows)
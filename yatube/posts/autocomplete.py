@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from .models import Group
+
+
+AUTOCOMPLETE_LIMIT = 10
+# Сигналы обновляют индекс только в своём процессе, поэтому индексы
+# других процессов перестраиваются в фоне не реже этого интервала.
+REBUILD_INTERVAL = 5 * 60
+# Имена пользователей подсказываются только персоналу, для админки.
+STAFF_ONLY = {'users'}
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+class PrefixIndex:
+    '''Отсортированный список (ключ, pk) для поиска по началу строки.
+
+    Ключи хранятся в нижнем регистре; поиск - это bisect до первого
+    подходящего ключа и проход до первого неподходящего.
+    '''
+
+    def __init__(self, load):
+        self.load = load
+        self.lock = threading.Lock()
+        # Одновременно идёт не больше одной перестройки.
+        self.build_lock = threading.Lock()
+        self.entries = []
+        self.keys = {}
+        self.labels = {}
+        self.built = None
+        # Изменения, пришедшие во время перестройки; None - её нет.
+        self.missed = None
+
+    def build(self):
+        '''Загрузить индекс из базы целиком.
+
+        Сигналы, пришедшие во время загрузки, запоминаются и
+        применяются к новому индексу, а не теряются при его замене.
+        '''
+        with self.lock:
+            self.missed = []
+        try:
+            entries, keys, labels = [], {}, {}
+            for pk, label, *words in self.load():
+                keys[pk] = {word.lower() for word in words if word}
+                labels[pk] = label
+                entries.extend((key, pk) for key in keys[pk])
+            entries.sort()
+        except Exception:
+            with self.lock:
+                self.missed = None
+            raise
+        with self.lock:
+            self.entries, self.keys, self.labels = entries, keys, labels
+            for change, args in self.missed:
+                change(*args)
+            self.missed = None
+            self.built = time.monotonic()
+
+    def ensure_built(self):
+        '''Построить индекс при первом поиске, устаревший - обновить в фоне.
+
+        Запрос ждёт только первую загрузку в процессе; дальше он
+        отвечает по текущему индексу, пока новый строится в потоке.
+        '''
+        if self.built is None:
+            with self.build_lock:
+                if self.built is None:
+                    self.build()
+        elif (
+            time.monotonic() - self.built > REBUILD_INTERVAL
+            and self.build_lock.acquire(blocking=False)
+        ):
+            threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Индекс подсказок не перестроен')
+        finally:
+            self.build_lock.release()
+            # У потока своё соединение с базой, его нужно закрыть.
+            connection.close()
+
+    def change(self, method, *args):
+        with self.lock:
+            if self.missed is not None:
+                self.missed.append((method, args))
+            if self.built is not None:
+                method(*args)
+
+    def update(self, pk, label, *words):
+        '''Добавить или заменить ключи одного объекта.'''
+        self.change(self._update, pk, label, words)
+
+    def remove(self, pk):
+        self.change(self._remove, pk)
+
+    def _update(self, pk, label, words):
+        self._remove(pk)
+        self.keys[pk] = {word.lower() for word in words if word}
+        self.labels[pk] = label
+        for key in self.keys[pk]:
+            insort(self.entries, (key, pk))
+
+    def _remove(self, pk):
+        for key in self.keys.pop(pk, ()):
+            position = bisect_left(self.entries, (key, pk))
+            if self.entries[position:position + 1] == [(key, pk)]:
+                del self.entries[position]
+        self.labels.pop(pk, None)
+
+    def search(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        '''Не больше limit пар (pk, подпись) с ключом, начинающимся с prefix.
+
+        Объект с несколькими подходящими ключами выдаётся один раз.
+        Сигналы меняют список на месте из других потоков, поэтому проход
+        идёт под той же блокировкой; он ограничен limit и короток.
+        '''
+        self.ensure_built()
+        prefix = prefix.lower()
+        found = {}
+        with self.lock:
+            entries = self.entries
+            position = bisect_left(entries, (prefix,))
+            while len(found) < limit and position < len(entries):
+                key, pk = entries[position]
+                if not key.startswith(prefix):
+                    break
+                found.setdefault(pk, self.labels[pk])
+                position += 1
+        return list(found.items())
+
+
+def load_users():
+    for pk, username in User.objects.values_list('pk', 'username'):
+        yield pk, username, username
+
+
+def load_groups():
+    for pk, title, slug in Group.objects.values_list('pk', 'title', 'slug'):
+        yield pk, title, title, slug
+
+
+INDEXES = {
+    'users': PrefixIndex(load_users),
+    'groups': PrefixIndex(load_groups),
+}
@@ -0,0 +1,147 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Post
+
+
+logger = logging.getLogger(__name__)
+
+# Каждая строка CASE занимает два параметра запроса и ещё один IN:
+# так UPDATE укладывается в лимит SQLite в 999 параметров.
+FLUSH_BATCH_SIZE = 300
+MOST_VIEWED_LIMIT = 100
+
+_pending = Counter()
+_lock = threading.Lock()
+_flushed_at = time.monotonic()
+# База, для которой накоплен буфер. Тесты подменяют базу, и просмотры
+# тестовых постов не должны попасть в настоящую при выходе.
+_database = None
+# Процесс, в котором запущен поток сброса: после fork его нет.
+_flusher_pid = None
+
+
+def record_view(post_id):
+    '''Засчитать просмотр поста.
+
+    Просмотры копятся в памяти процесса. Фоновый поток сбрасывает их
+    в базу раз в VIEW_COUNT_FLUSH_INTERVAL секунд, а просмотр, после
+    которого в буфере VIEW_COUNT_BUFFER_SIZE постов, - сразу; остаток
+    сбрасывается и при штатном завершении процесса. При падении
+    теряются просмотры не больше чем за VIEW_COUNT_FLUSH_INTERVAL.
+    '''
+    global _database
+    start_flusher()
+    with _lock:
+        if not _pending:
+            _database = connection.settings_dict['NAME']
+        _pending[post_id] += 1
+        if (
+            len(_pending) < settings.VIEW_COUNT_BUFFER_SIZE
+            and time.monotonic() - _flushed_at
+            < settings.VIEW_COUNT_FLUSH_INTERVAL
+        ):
+            return
+        counts = take_pending()
+    save(counts)
+
+
+def start_flusher():
+    '''Запустить поток сброса, если в этом процессе его ещё нет.'''
+    global _flusher_pid
+    if not settings.VIEW_COUNT_FLUSH_THREAD or _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(
+        target=flush_periodically, name='view-counts', daemon=True
+    ).start()
+
+
+def flush_periodically():
+    '''Сбрасывать буфер раз в VIEW_COUNT_FLUSH_INTERVAL секунд.
+
+    Соединение потока закрывается после каждого сброса, чтобы простаивающий
+    поток не держал его открытым.
+    '''
+    while True:
+        time.sleep(settings.VIEW_COUNT_FLUSH_INTERVAL)
+        try:
+            flush()
+        finally:
+            connection.close()
+
+
+def save(counts):
+    '''Записать просмотры, при ошибке базы вернуть их в буфер.'''
+    try:
+        return write_counts(counts)
+    except DatabaseError:
+        # База занята: просмотры вернутся в буфер до следующего сброса,
+        # страница поста из-за счётчика не падает.
+        logger.exception('Просмотры постов не сохранены')
+        with _lock:
+            _pending.update(counts)
+        return 0
+
+
+def take_pending():
+    '''Забрать накопленные просмотры, оставив буфер пустым.'''
+    global _flushed_at
+    counts = dict(_pending)
+    _pending.clear()
+    _flushed_at = time.monotonic()
+    return counts
+
+
+def write_counts(counts):
+    '''Прибавить просмотры к постам одним UPDATE ... CASE на пачку.
+
+    Прибавление через F, а не запись итога, поэтому сбросы разных
+    процессов не затирают друг друга. Удалённые посты пропускаются.
+    '''
+    post_ids = list(counts)
+    for start in range(0, len(post_ids), FLUSH_BATCH_SIZE):
+        batch = post_ids[start:start + FLUSH_BATCH_SIZE]
+        Post.objects.filter(pk__in=batch).update(
+            view_count=F('view_count') + Case(
+                *(When(pk=pk, then=Value(counts[pk])) for pk in batch),
+                output_field=IntegerField()
+            )
+        )
+    return len(post_ids)
+
+
+def flush():
+    '''Сбросить буфер этого процесса в базу, вернуть число постов.
+
+    Если с момента первого просмотра в буфере база сменилась,
+    просмотры отбрасываются.
+    '''
+    with _lock:
+        database = _database
+        counts = take_pending()
+    if not counts or database != connection.settings_dict['NAME']:
+        return 0
+    return save(counts)
+
+
+def most_viewed(limit=MOST_VIEWED_LIMIT):
+    '''Самые просматриваемые посты по уже сброшенным счётчикам.'''
+    return Post.objects.select_related('author', 'group').filter(
+        view_count__gt=0
+    ).order_by('-view_count', '-pk')[:limit]
+
+
+# Штатная остановка воркера не теряет буфер.
+atexit.register(flush)
@@ -0,0 +1,89 @@
+import datetime as dt
+from itertools import groupby
+
+from django.core.mail import EmailMessage
+from django.utils import timezone
+
+from .models import Follow
+from .notifications import Renderer
+
+
+PERIODS = {'day': 1, 'week': 7}
+PERIOD_LABELS = {'day': 'день', 'week': 'неделю'}
+CHUNK_SIZE = 2000
+BATCH_SIZE = 200
+
+
+def period_range(period, until):
+    '''Границы периода [начало, until) в полночь текущего часового пояса.'''
+    end = timezone.make_aware(dt.datetime.combine(until, dt.time()))
+    return end - dt.timedelta(days=PERIODS[period]), end
+
+
+def digest_rows(start, end, chunk_size=CHUNK_SIZE):
+    '''(user_id, email, post_id) всех подписчиков по постам периода.
+
+    Один запрос соединяет подписки с постами периода по индексу
+    (author, -pub_date); строки идут по получателю, а у него по дате
+    поста, и читаются курсором по chunk_size.
+    '''
+    return Follow.objects.filter(
+        author__posts__pub_date__gte=start,
+        author__posts__pub_date__lt=end,
+    ).exclude(user__email='').order_by(
+        'user_id', 'author__posts__pub_date', 'author__posts__id'
+    ).values_list(
+        'user_id', 'user__email', 'author__posts__id'
+    ).iterator(chunk_size=chunk_size)
+
+
+def user_digests(rows):
+    '''Сгруппировать строки по получателю: (email, id постов по дате).
+
+    В памяти держатся посты только одного получателя. Подписка на
+    автора уникальна, поэтому посты в строках не повторяются.
+    '''
+    for (user_id, email), group in groupby(rows, lambda row: row[:2]):
+        yield email, [row[2] for row in group]
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def digest_messages(period, until, batch_size=BATCH_SIZE,
+                    chunk_size=CHUNK_SIZE):
+    '''Пачки писем сводки за период, заканчивающийся в until.
+
+    Фрагмент каждого поста рендерится один раз на пачку и берётся из
+    кеша Renderer в следующих, пока не вытеснен; порядок писем и постов
+    в них определяется id получателей и датами, поэтому повторный
+    запуск за тот же период даёт те же письма.
+    '''
+    start, end = period_range(period, until)
+    subject = f'Посты ваших авторов за {PERIOD_LABELS[period]}'
+    renderer = Renderer()
+    for batch in batches(
+        user_digests(digest_rows(start, end, chunk_size)), batch_size
+    ):
+        fragments = renderer.batch_fragments(list(dict.fromkeys(
+            post_id for email, post_ids in batch for post_id in post_ids
+        )))
+        messages = []
+        for email, post_ids in batch:
+            texts = [
+                fragments[post_id] for post_id in post_ids
+                if post_id in fragments
+            ]
+            if texts:
+                messages.append(EmailMessage(
+                    subject, '\n\n'.join(texts), to=[email]
+                ))
+        yield messages
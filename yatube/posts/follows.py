@@ -0,0 +1,41 @@
+from .models import Follow, FollowSuggestion, User
+
+
+# Сколько авторов можно передать в одном запросе массовой подписки.
+BULK_FOLLOW_LIMIT = 100
+
+
+def follow(user, author_ids):
+    '''Подписать user на авторов одним INSERT OR IGNORE.
+
+    Существующие подписки и подписка на себя пропускаются: повтор
+    запроса или двойной клик ничего не меняют. Подписаться на
+    пользователя дважды не даёт ограничение posts_follow_unique.
+    '''
+    author_ids = set(author_ids) - {user.pk}
+    if not author_ids:
+        return
+    Follow.objects.bulk_create(
+        (Follow(user=user, author_id=pk) for pk in author_ids),
+        ignore_conflicts=True
+    )
+    # Рекомендация больше не нужна; строк обычно нет, запрос почти пустой.
+    FollowSuggestion.objects.filter(
+        user=user, author_id__in=author_ids
+    ).delete()
+
+
+def unfollow(user, author_id):
+    '''Отписать user от автора одним DELETE, даже если подписки не было.'''
+    Follow.objects.filter(user=user, author_id=author_id).delete()
+
+
+def author_ids(usernames, limit=BULK_FOLLOW_LIMIT):
+    '''id пользователей по списку имён одним запросом.
+
+    Имена сверх limit и несуществующие пользователи отбрасываются.
+    '''
+    return list(
+        User.objects.filter(username__in=list(usernames)[:limit])
+        .values_list('pk', flat=True)
+    )
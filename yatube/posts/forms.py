@@ -1,12 +1,48 @@
 from django import forms
+from django.template.loader import render_to_string
+from django.urls import reverse
 from .models import Post, Comment
 
 
+class AutocompleteSelect(forms.Select):
+    '''Выпадающий список, в который попадает только выбранный вариант.
+
+    Остальные подгружаются по мере ввода из posts:autocomplete, поэтому
+    страница не зависит от числа строк в таблице.
+    '''
+
+    def __init__(self, kind, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [item for item in value if item]
+        choices = self.choices
+        self.choices = [('', choices.field.empty_label)]
+        if selected:
+            self.choices += [
+                (obj.pk, choices.field.label_from_instance(obj))
+                for obj in choices.queryset.filter(pk__in=selected)
+            ]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+    def render(self, name, value, attrs=None, renderer=None):
+        select = super().render(name, value, attrs, renderer)
+        return select + render_to_string('includes/autocomplete.html', {
+            'select_id': self.build_attrs(self.attrs, attrs).get('id'),
+            'url': reverse('posts:autocomplete', args=(self.kind,)),
+        })
+
+
 class PostForm(forms.ModelForm):
 
     class Meta:
         model = Post
         fields = ('text', 'group', 'image',)
+        widgets = {'group': AutocompleteSelect('groups')}
 
 
 class CommentForm(forms.ModelForm):
@@ -0,0 +1,138 @@
+import datetime as dt
+
+from django.db.models import Count, F, Max, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from core.jobs import enqueue
+from .models import Group, GroupStats, Post
+
+
+ACTIVE_DAYS = 7
+GROUP_ORDERINGS = {
+    'posts': ('-post_count', '-last_post_date', 'pk'),
+    'last': (F('last_post_date').desc(nulls_last=True), 'pk'),
+    'active': ('-active_authors', '-post_count', 'pk'),
+}
+DEFAULT_GROUP_ORDERING = 'posts'
+
+
+def active_since():
+    return timezone.now() - dt.timedelta(days=ACTIVE_DAYS)
+
+
+def count_active_authors(group_id):
+    '''Число авторов, писавших в группу за последние ACTIVE_DAYS дней.
+
+    Читает только свежие посты группы по индексу (group, -pub_date).
+    '''
+    return Post.objects.filter(
+        group_id=group_id, pub_date__gte=active_since()
+    ).values('author').distinct().count()
+
+
+def update_active_authors(group_id):
+    '''Пересчитать число активных авторов группы.'''
+    GroupStats.objects.filter(group_id=group_id).update(
+        active_authors=count_active_authors(group_id)
+    )
+
+
+def active_authors_changed(group_id):
+    '''Поставить пересчёт активных авторов в очередь.
+
+    Подсчёт уникальных авторов за неделю не должен замедлять запись
+    поста; пока задача ждёт в очереди, новые посты группы её не
+    дублируют.
+    '''
+    enqueue(
+        'posts.tasks.update_active_authors', group_id,
+        dedup_key=f'active-authors:{group_id}'
+    )
+
+
+def post_added(group_id, pub_date):
+    '''Учесть пост, появившийся в группе.'''
+    if group_id is None:
+        return
+    updated = GroupStats.objects.filter(group_id=group_id).update(
+        post_count=F('post_count') + 1,
+        last_post_date=Greatest(
+            Coalesce('last_post_date', Value(pub_date)), Value(pub_date)
+        ),
+    )
+    if updated:
+        active_authors_changed(group_id)
+    else:
+        refresh_group_stats([group_id])
+
+
+def post_removed(group_id):
+    '''Учесть пост, удалённый из группы или перенесённый в другую.'''
+    if group_id is None:
+        return
+    last_post_date = Post.objects.filter(group_id=group_id).aggregate(
+        last=Max('pub_date')
+    )['last']
+    updated = GroupStats.objects.filter(group_id=group_id).update(
+        post_count=Greatest(F('post_count') - 1, Value(0)),
+        last_post_date=last_post_date,
+    )
+    if updated:
+        active_authors_changed(group_id)
+    else:
+        refresh_group_stats([group_id])
+
+
+def post_moved(post, old_group_id):
+    '''Перенести пост из группы old_group_id в его текущую группу.'''
+    if post.group_id == old_group_id:
+        return
+    post_removed(old_group_id)
+    post_added(post.group_id, post.pub_date)
+
+
+def refresh_group_stats(group_ids=None):
+    '''Пересчитать сводку групп одним групповым запросом.
+
+    Нужен для первоначального заполнения и для устаревания числа
+    активных авторов: команда refresh_group_stats запускается по
+    расписанию. Возвращает число обновлённых групп.
+    '''
+    groups = Group.objects.all()
+    posts = Post.objects.filter(group__isnull=False)
+    if group_ids is not None:
+        groups = groups.filter(pk__in=group_ids)
+        posts = posts.filter(group_id__in=group_ids)
+    aggregates = {
+        row['group']: row
+        for row in posts.order_by().values('group').annotate(
+            count=Count('pk'),
+            last=Max('pub_date'),
+            active=Count(
+                'author', distinct=True, filter=Q(pub_date__gte=active_since())
+            ),
+        )
+    }
+    group_ids = list(groups.values_list('pk', flat=True))
+    existing = GroupStats.objects.in_bulk(group_ids)
+    changed, missing = [], []
+    for group_id in group_ids:
+        row = aggregates.get(group_id, {})
+        stats = existing.get(group_id) or GroupStats(group_id=group_id)
+        stats.post_count = row.get('count', 0)
+        stats.last_post_date = row.get('last')
+        stats.active_authors = row.get('active', 0)
+        (changed if group_id in existing else missing).append(stats)
+    GroupStats.objects.bulk_update(
+        changed, ('post_count', 'last_post_date', 'active_authors')
+    )
+    GroupStats.objects.bulk_create(missing, ignore_conflicts=True)
+    return len(group_ids)
+
+
+def group_directory(ordering=DEFAULT_GROUP_ORDERING):
+    '''Группы со сводкой, упорядоченные по выбранной колонке сводки.'''
+    return GroupStats.objects.select_related('group').order_by(
+        *GROUP_ORDERINGS[ordering]
+    )
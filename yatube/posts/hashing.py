@@ -0,0 +1,93 @@
+import hashlib
+from collections import Counter
+from itertools import combinations
+
+from PIL import Image
+
+
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def dhash(file):
+    '''Посчитать 64-битный разностный хеш (dHash) картинки.
+
+    Картинка уменьшается до 9x8 в оттенках серого, каждый бит
+    показывает, светлее ли пиксель своего правого соседа. Хеш
+    устойчив к масштабированию, пережатию и небольшой цветокоррекции.
+    '''
+    with Image.open(file) as image:
+        image = image.convert('L').resize((9, 8), Image.LANCZOS)
+        pixels = list(image.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = value << 1 | (left > right)
+    return value
+
+
+def simhash(features):
+    '''Посчитать 64-битный simhash набора признаков (строк).
+
+    Каждый бит - знак суммы весов признаков, у хеша которых этот бит
+    установлен, минус веса остальных. Тексты с небольшими правками
+    дают хеши, отличающиеся в нескольких битах.
+    '''
+    totals = [0] * HASH_BITS
+    for feature, weight in Counter(features).items():
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, 'big')
+        for bit in range(HASH_BITS):
+            totals[bit] += weight if value >> bit & 1 else -weight
+    return sum(1 << bit for bit in range(HASH_BITS) if totals[bit] > 0)
+
+
+def to_signed(value):
+    '''Привести беззнаковый 64-битный хеш к диапазону BigIntegerField.'''
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value & ((1 << HASH_BITS) - 1)
+
+
+def hamming(first, second):
+    return bin(to_unsigned(first) ^ to_unsigned(second)).count('1')
+
+
+def bands(value):
+    '''Разбить хеш на BANDS частей по BAND_BITS бит.'''
+    value = to_unsigned(value)
+    return [
+        value >> (BAND_BITS * index) & BAND_MASK for index in range(BANDS)
+    ]
+
+
+def band_neighbours(band, radius):
+    '''Все значения части, отличающиеся от band не более чем на radius бит.'''
+    values = [band]
+    for count in range(1, radius + 1):
+        for bits in combinations(range(BAND_BITS), count):
+            value = band
+            for bit in bits:
+                value ^= 1 << bit
+            values.append(value)
+    return values
+
+
+def band_lookups(value, distance):
+    '''Условия поиска по частям хеша для multi-index hashing.
+
+    Если хеши отличаются не более чем на distance бит, то хотя бы одна
+    из BANDS частей отличается не более чем на distance // BANDS бит,
+    поэтому кандидатов можно найти точными запросами по индексам частей.
+    '''
+    radius = distance // BANDS
+    return [
+        (f'band{index}', band_neighbours(band, radius))
+        for index, band in enumerate(bands(value))
+    ]
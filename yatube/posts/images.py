@@ -0,0 +1,82 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from sorl.thumbnail import get_thumbnail
+
+from .hashing import bands, band_lookups, dhash, hamming, to_signed
+from .models import ImageHash
+
+
+DUPLICATE_DISTANCE = 6
+
+
+def make_image_hash(post_id, value):
+    return ImageHash(
+        post_id=post_id,
+        hash=to_signed(value),
+        **{f'band{index}': band for index, band in enumerate(bands(value))}
+    )
+
+
+def build_image_hash(post):
+    '''Вернуть несохранённый ImageHash для картинки поста.
+
+    None, если картинки нет или её не удаётся прочитать.
+    '''
+    if not post.image:
+        return None
+    try:
+        with post.image.open('rb') as file:
+            value = dhash(file)
+    except (OSError, ValueError, SyntaxError):
+        return None
+    return make_image_hash(post.pk, value)
+
+
+def update_image_hash(post):
+    '''Пересчитать хеш после загрузки или замены картинки.'''
+    image_hash = build_image_hash(post)
+    if image_hash is None:
+        ImageHash.objects.filter(post=post).delete()
+    else:
+        image_hash.save()
+    return image_hash
+
+
+def build_thumbnails(name):
+    '''Построить все размеры миниатюр для одной картинки.
+
+    sorl сначала пишет файл и только потом регистрирует его
+    в key-value хранилище, поэтому шаблоны не увидят недописанную
+    миниатюру, а уже существующие файлы не перезаписываются.
+    '''
+    if not default_storage.exists(name):
+        return False
+    for geometry, options in settings.POST_THUMBNAILS:
+        get_thumbnail(name, geometry, **options)
+    return True
+
+
+def find_similar_images(value, distance=DUPLICATE_DISTANCE, exclude=None):
+    '''Найти посты с картинками не дальше distance бит от хеша value.
+
+    Возвращает список пар (post_id, расстояние), ближайшие первыми.
+    Кандидаты выбираются по индексам частей хеша, точное расстояние
+    считается только для них.
+    '''
+    query = reduce(or_, (
+        Q(**{f'{band}__in': values})
+        for band, values in band_lookups(value, distance)
+    ))
+    candidates = ImageHash.objects.filter(query)
+    if exclude is not None:
+        candidates = candidates.exclude(post_id=exclude)
+    found = []
+    for post_id, other in candidates.values_list('post_id', 'hash'):
+        other_distance = hamming(value, other)
+        if other_distance <= distance:
+            found.append((post_id, other_distance))
+    return sorted(found, key=lambda item: (item[1], item[0]))
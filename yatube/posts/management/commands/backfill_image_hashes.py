@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.hashing import dhash
+from posts.images import make_image_hash
+from posts.models import ImageHash, Post
+from posts.utils import keyset_batches
+
+
+BATCH_SIZE = 500
+
+
+def hash_image(name):
+    '''Посчитать хеш картинки в дочернем процессе.'''
+    try:
+        with default_storage.open(name, 'rb') as file:
+            return dhash(file)
+    except (OSError, ValueError, SyntaxError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Посчитать перцептивные хеши для картинок, у которых их ещё нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Количество процессов.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько хешей сохранять одним запросом.'
+        )
+
+    def handle(self, *args, **options):
+        # Посты без хеша выбираются заново на каждой пачке,
+        # поэтому прерванный запуск просто продолжится с того же места.
+        posts = Post.objects.exclude(image='').filter(image_hash__isnull=True)
+        self.stdout.write(f'Картинок без хеша: {posts.count()}')
+        done = failed = 0
+        started = time.monotonic()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('fork'),
+        ) as executor:
+            for batch in keyset_batches(posts, options['batch_size'], 'image'):
+                pks, names = zip(*batch)
+                connections.close_all()
+                hashes = [
+                    make_image_hash(pk, value)
+                    for pk, value in zip(pks, executor.map(hash_image, names))
+                    if value is not None
+                ]
+                ImageHash.objects.bulk_create(hashes, ignore_conflicts=True)
+                done += len(hashes)
+                failed += len(batch) - len(hashes)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{done + failed} ({done / elapsed:.1f} картинок/с)'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: посчитано {done}, не удалось прочитать {failed}.'
+        ))
@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Post, PostTag, Tag
+from posts.tags import extract_tags
+from posts.utils import keyset_batches
+
+
+BATCH_SIZE = 1000
+
+
+def save_batch(batch):
+    '''Сохранить теги пачки постов, вернуть число новых связей.'''
+    found = {
+        (pk, pub_date): extract_tags(text) for pk, text, pub_date in batch
+    }
+    names = set().union(*found.values())
+    if not names:
+        return 0
+    with transaction.atomic():
+        Tag.objects.bulk_create(
+            (Tag(name=name) for name in names), ignore_conflicts=True
+        )
+        ids = dict(
+            Tag.objects.filter(name__in=names).values_list('name', 'pk')
+        )
+        links = [
+            PostTag(tag_id=ids[name], post_id=pk, pub_date=pub_date)
+            for (pk, pub_date), post_names in found.items()
+            for name in post_names
+        ]
+        PostTag.objects.bulk_create(links, ignore_conflicts=True)
+    return len(links)
+
+
+def recount_tags():
+    '''Пересчитать сводку тегов одним UPDATE по индексу тегов постов.'''
+    counts = PostTag.objects.filter(tag=OuterRef('pk')).order_by().values(
+        'tag'
+    ).annotate(count=Count('pk')).values('count')
+    return Tag.objects.update(post_count=Coalesce(
+        Subquery(counts, output_field=IntegerField()), 0
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Разобрать теги в уже опубликованных постах. Посты читаются '
+        'пачками по первичному ключу, повторный запуск ничего не дублирует.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько постов читать за один запрос.'
+        )
+        parser.add_argument(
+            '--after', type=int, default=0,
+            help='Начать с постов, чей id больше указанного.'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(pk__gt=options['after'])
+        done = links = 0
+        started = time.monotonic()
+        for batch in keyset_batches(
+            posts, options['batch_size'], 'text', 'pub_date'
+        ):
+            links += save_batch(batch)
+            done += len(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'до id {batch[-1][0]}: {done} постов '
+                f'({done / elapsed:.0f} постов/с)'
+            )
+        tags = recount_tags()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: постов {done}, связей с тегами {links}, тегов {tags}.'
+        ))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Post, TextHash
+from posts.spam import make_text_hash, text_simhash
+from posts.utils import keyset_batches
+
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Посчитать simhash для постов и комментариев, у которых его нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько текстов читать и сохранять за один запрос.'
+        )
+
+    def handle(self, *args, **options):
+        for model, target in ((Post, 'post_id'), (Comment, 'comment_id')):
+            # Тексты без хеша выбираются заново на каждой пачке,
+            # поэтому прерванный запуск продолжится с того же места.
+            texts = model.objects.filter(text_hash__isnull=True)
+            done = skipped = 0
+            started = time.monotonic()
+            for batch in keyset_batches(
+                texts, options['batch_size'], 'author_id', 'text'
+            ):
+                hashes = []
+                for pk, author_id, text in batch:
+                    value = text_simhash(text)
+                    if value is not None:
+                        hashes.append(
+                            make_text_hash(value, author_id, **{target: pk})
+                        )
+                TextHash.objects.bulk_create(hashes, ignore_conflicts=True)
+                done += len(hashes)
+                skipped += len(batch) - len(hashes)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: {done + skipped} '
+                    f'({(done + skipped) / elapsed:.0f} текстов/с)'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: посчитано {done}, '
+                f'коротких {skipped}.'
+            ))
@@ -0,0 +1,62 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+REPEAT = 5
+CHANGELISTS = (
+    ('admin:posts_post_changelist', {}),
+    ('admin:posts_post_changelist', {'q': 'тест'}),
+    ('admin:posts_comment_changelist', {}),
+    ('admin:posts_comment_changelist', {'q': 'тест'}),
+    ('admin:posts_follow_changelist', {}),
+)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Замерить время открытия списков объектов в админке.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            help='Суперпользователь, от имени которого открывать админку.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=REPEAT,
+            help='Сколько раз открывать каждую страницу.'
+        )
+
+    def handle(self, *args, **options):
+        superusers = User.objects.filter(is_superuser=True)
+        if options['username']:
+            superusers = superusers.filter(username=options['username'])
+        user = superusers.first()
+        if user is None:
+            raise CommandError('Не найден суперпользователь.')
+        client = Client()
+        client.force_login(user)
+
+        for name, params in CHANGELISTS:
+            url = reverse(name)
+            timings = []
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.get(url, params)
+                    timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f'{url}: ответ {response.status_code}')
+            self.stdout.write(
+                f'{url} {params or ""}: '
+                f'медиана {statistics.median(timings) * 1000:.1f} мс, '
+                f'максимум {max(timings) * 1000:.1f} мс, '
+                f'запросов к БД {len(queries)}'
+            )
@@ -0,0 +1,90 @@
+import shutil
+import tempfile
+import time
+
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+
+from posts.models import Notification, Post, User
+from posts.notifications import Renderer, queue_notifications, send_pending
+
+
+POSTS = 3
+
+
+class Command(BaseCommand):
+    help = (
+        'Замерить рассылку уведомлений о новых постах через файловый '
+        'почтовый бэкенд: пачками через одно соединение и по одному '
+        'письму на уведомление. Изменения в базе откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--author',
+            help='Автор постов; по умолчанию тот, у кого больше подписчиков.'
+        )
+        parser.add_argument(
+            '--posts', type=int, default=POSTS,
+            help='Сколько последних постов автора разослать.'
+        )
+
+    def handle(self, *args, **options):
+        authors = User.objects.annotate(
+            followers=Count('following')
+        ).order_by('-followers')
+        if options['author']:
+            authors = authors.filter(username=options['author'])
+        author = authors.first()
+        if author is None:
+            raise CommandError('Автор не найден.')
+        posts = list(author.posts.all()[:options['posts']])
+        directory = tempfile.mkdtemp()
+        try:
+            with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.filebased.'
+                'EmailBackend',
+                EMAIL_FILE_PATH=directory,
+            ), transaction.atomic():
+                self.benchmark(posts)
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def benchmark(self, posts):
+        started = time.perf_counter()
+        queued = sum(queue_notifications(post) for post in posts)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Уведомлений: {queued} за {elapsed * 1000:.1f} мс '
+            f'({queued / max(elapsed, 1e-9):.0f} строк/с)'
+        )
+        rows = list(Notification.objects.values_list('user__email', 'post'))
+        by_pk = Post.objects.select_related('author', 'group').in_bulk(
+            [post.pk for post in posts]
+        )
+        # Тот же текст, что у рассылки пачками, но без кеша фрагментов:
+        # каждое письмо рендерится заново.
+        renderer = Renderer()
+        started = time.perf_counter()
+        for email, post_id in rows:
+            post = by_pk[post_id]
+            EmailMessage(
+                f'Новый пост: {post.author.username}',
+                renderer.render(post),
+                to=[email],
+            ).send()
+        self.report('По одному письму', len(rows), started)
+        started = time.perf_counter()
+        sent = send_pending()
+        self.report('Пачками со сводками', sent, started)
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label}: {count} писем за {elapsed * 1000:.1f} мс '
+            f'({count / max(elapsed, 1e-9):.0f} писем/с)'
+        )
@@ -0,0 +1,207 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts.models import Post
+
+
+CHUNK_SIZE = 1000
+MIN_AGE = 60 * 60
+CHECKPOINT_PATH = os.path.join(settings.BASE_DIR, '.clean_media')
+
+
+def scanned_roots():
+    '''Каталоги внутри MEDIA_ROOT, которыми владеют посты и sorl.
+
+    Остальные загрузки и файлы, положенные вручную, команда не трогает.
+    '''
+    return tuple(
+        tuple(filter(None, prefix.split('/')))
+        for prefix in (
+            Post._meta.get_field('image').upload_to,
+            thumbnail_settings.THUMBNAIL_PREFIX,
+        )
+    )
+
+
+def within(parts, roots):
+    return any(parts[:len(prefix)] == prefix for prefix in roots)
+
+
+def walk(root, after=(), relative=(), roots=((),)):
+    '''Обойти дерево файлов в порядке сортировки путей.
+
+    Возвращает пары (путь в виде кортежа частей, DirEntry). В памяти
+    держится только содержимое одного каталога. Всё, что не больше
+    `after`, пропускается, не заходя в уже пройденные каталоги.
+    Выдаются только файлы внутри каталогов roots, в другие каталоги
+    обход не заходит.
+    '''
+    with os.scandir(os.path.join(root, *relative)) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        parts = relative + (entry.name,)
+        if entry.is_dir(follow_symlinks=False):
+            if parts < after[:len(parts)]:
+                continue
+            if within(parts, roots) or any(
+                prefix[:len(parts)] == parts for prefix in roots
+            ):
+                yield from walk(root, after, parts, roots)
+        elif parts > after and within(parts, roots):
+            yield parts, entry
+
+
+class Command(BaseCommand):
+    help = (
+        'Удалить из MEDIA_ROOT картинки, на которые не ссылается ни один '
+        'пост, и миниатюры, неизвестные sorl-thumbnail. Проверяются только '
+        'каталог картинок постов и каталог миниатюр.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int,
+            help='Проверить не больше указанного числа файлов за запуск.'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=MIN_AGE,
+            help='Не трогать файлы моложе указанного числа секунд.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Сколько файлов сверять с БД одним запросом.'
+        )
+        parser.add_argument(
+            '--checkpoint', default=CHECKPOINT_PATH,
+            help='Файл с последним проверенным путём.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только вывести найденные файлы, ничего не удалять.'
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        checkpoint = options['checkpoint']
+        limit = options['limit']
+        if not os.path.isdir(settings.MEDIA_ROOT):
+            self.stdout.write('Каталог MEDIA_ROOT не найден.')
+            return
+        after = self.read_checkpoint(checkpoint)
+        if after:
+            self.stdout.write(f'Продолжаем после {"/".join(after)}.')
+
+        min_mtime = time.time() - options['min_age']
+        scanned = deleted = 0
+        chunk = []
+        finished = True
+        for parts, entry in walk(
+            settings.MEDIA_ROOT, after, roots=scanned_roots()
+        ):
+            if limit is not None and scanned >= limit:
+                finished = False
+                break
+            scanned += 1
+            after = parts
+            if not self.is_older(entry, min_mtime):
+                continue
+            chunk.append('/'.join(parts))
+            if len(chunk) >= options['chunk_size']:
+                deleted += self.collect(chunk)
+                self.write_checkpoint(checkpoint, chunk[-1])
+                chunk = []
+        deleted += self.collect(chunk)
+
+        if finished:
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+        else:
+            self.write_checkpoint(checkpoint, '/'.join(after))
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено файлов: {scanned}, удалено: {deleted}.'
+            + ('' if finished else ' Обход не завершён.')
+        ))
+
+    @staticmethod
+    def is_older(entry, mtime):
+        '''Файл не менялся с момента mtime и всё ещё существует.
+
+        Свежие файлы пропускаются: загрузка может быть ещё не сохранена
+        в посте, а миниатюра ещё не записана в key-value хранилище.
+        '''
+        try:
+            return entry.stat(follow_symlinks=False).st_mtime <= mtime
+        except FileNotFoundError:
+            return False
+
+    def collect(self, names):
+        '''Удалить файлы-сироты из пачки, вернуть их количество.'''
+        prefix = thumbnail_settings.THUMBNAIL_PREFIX
+        thumbnails = [name for name in names if name.startswith(prefix)]
+        originals = [name for name in names if not name.startswith(prefix)]
+        return (
+            self.collect_originals(originals)
+            + self.collect_thumbnails(thumbnails)
+        )
+
+    def collect_originals(self, names):
+        referenced = set(
+            Post.objects.filter(image__in=names).values_list(
+                'image', flat=True
+            )
+        )
+        orphans = [name for name in names if name not in referenced]
+        for name in orphans:
+            self.report(name)
+            if not self.dry_run:
+                # Вместе с оригиналом sorl удалит его миниатюры
+                # и записи о них в key-value хранилище.
+                image = ImageFile(name, default_storage)
+                default.kvstore.delete(image)
+                image.delete()
+        return len(orphans)
+
+    def collect_thumbnails(self, names):
+        keys = {
+            add_prefix(ImageFile(name, default.storage).key): name
+            for name in names
+        }
+        known = set(
+            KVStore.objects.filter(key__in=keys).values_list('key', flat=True)
+        )
+        orphans = [name for key, name in keys.items() if key not in known]
+        for name in orphans:
+            self.report(name)
+            if not self.dry_run:
+                default.storage.delete(name)
+        return len(orphans)
+
+    def report(self, name):
+        if self.verbosity > 1 or self.dry_run:
+            self.stdout.write(name)
+
+    @staticmethod
+    def read_checkpoint(path):
+        try:
+            with open(path) as file:
+                name = file.read().strip()
+        except FileNotFoundError:
+            return ()
+        return tuple(name.split('/')) if name else ()
+
+    @staticmethod
+    def write_checkpoint(path, name):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(name)
+        os.replace(tmp_path, path)
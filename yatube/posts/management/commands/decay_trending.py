@@ -0,0 +1,78 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from posts.models import Post
+
+
+HALF_LIFE = 6 * 60
+INTERVAL = 10
+MIN_SCORE = 0.01
+STATE_PATH = os.path.join(settings.BASE_DIR, '.decay_trending')
+
+
+class Command(BaseCommand):
+    help = (
+        'Уменьшить популярность постов с течением времени. '
+        'Запускается по расписанию, например из cron; множитель '
+        'считается по времени, прошедшему с прошлого запуска.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=INTERVAL,
+            help='Сколько минут считать прошедшими, если прошлый запуск '
+                 'не записан.'
+        )
+        parser.add_argument(
+            '--half-life', type=float, default=HALF_LIFE,
+            help='За сколько минут вклад комментария уменьшается вдвое.'
+        )
+        parser.add_argument(
+            '--state', default=STATE_PATH,
+            help='Файл с временем прошлого запуска.'
+        )
+
+    def handle(self, *args, **options):
+        now = time.time()
+        last_run = self.read_state(options['state'])
+        if last_run is None:
+            minutes = options['interval']
+        else:
+            # Пропущенный запуск даст больший множитель, лишний - меньший,
+            # и итоговое затухание не зависит от расписания.
+            minutes = max(now - last_run, 0) / 60
+        factor = 0.5 ** (minutes / options['half_life'])
+        # Оба запроса идут по индексу trend_score и трогают только
+        # посты, у которых популярность ещё не обнулилась.
+        with transaction.atomic():
+            decayed = Post.objects.filter(trend_score__gt=0).update(
+                trend_score=F('trend_score') * factor
+            )
+            Post.objects.filter(
+                trend_score__gt=0, trend_score__lt=MIN_SCORE
+            ).update(trend_score=0)
+        self.write_state(options['state'], now)
+        self.stdout.write(
+            f'Обновлено постов: {decayed}, прошло {minutes:.1f} мин, '
+            f'множитель {factor:.4f}.'
+        )
+
+    @staticmethod
+    def read_state(path):
+        try:
+            with open(path) as file:
+                return float(file.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def write_state(path, timestamp):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(repr(timestamp))
+        os.replace(tmp_path, path)
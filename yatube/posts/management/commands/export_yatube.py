@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.transfer import export_rows
+
+
+CHUNK_SIZE = 2000
+REPORT_EVERY = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгрузить пользователей, группы, посты, комментарии и подписки '
+        'в файл JSON Lines для import_yatube. Таблицы читаются курсором, '
+        'память не растёт с объёмом данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Куда записать выгрузку.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Сколько строк получать из базы за один раз.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        counts = {}
+        done = 0
+        with open(options['path'], 'w', encoding='utf-8') as file:
+            for label, line in export_rows(options['chunk_size']):
+                file.write(line)
+                file.write('\n')
+                counts[label] = counts.get(label, 0) + 1
+                done += 1
+                if done % REPORT_EVERY == 0:
+                    self.report(done, started)
+        self.report(done, started)
+        self.stdout.write(self.style.SUCCESS(
+            'Выгружено: ' + ', '.join(
+                f'{label} {count}' for label, count in counts.items()
+            )
+        ))
+
+    def report(self, done, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{done} строк за {elapsed:.2f} с '
+            f'({done / max(elapsed, 1e-9):.0f} строк/с)'
+        )
@@ -0,0 +1,208 @@
+import json
+import os
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+
+from posts.archive import rebuild_archive
+from posts.groups import refresh_group_stats
+from posts.threads import rebuild_paths
+from posts.transfer import (
+    MODELS, Loader, current_offsets, find_conflicts, last_pks, reserve_ids
+)
+
+
+BATCH_SIZE = 2000
+# Сколько занятых значений показывать в сообщении об ошибке.
+CONFLICTS_SHOWN = 20
+
+
+def read_state(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def write_state(path, state):
+    # Запись во временный файл и переименование, как у индекса
+    # related_posts: прерванный запуск не оставит половину файла.
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+    os.replace(f'{path}.tmp', path)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузить выгрузку export_yatube. Строки пишутся пачками, каждая '
+        'в своей транзакции; id сдвигаются за уже занятые и резервируются '
+        'до записи, ссылки пересчитываются. Прогресс хранится в файле '
+        'состояния, повторный запуск продолжает с последней сохранённой '
+        'пачки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки.')
+        parser.add_argument(
+            '--state',
+            help='Файл состояния импорта, по умолчанию <path>.state.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько строк записывать в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        state_path = options['state'] or f'{options["path"]}.state'
+        if os.path.exists(state_path):
+            state = read_state(state_path)
+            self.check_conflicts(options['path'], state['offsets'])
+            self.settle_pending(state)
+            self.stdout.write(f'Продолжение со строки {state["line"]}.')
+        else:
+            state = {'line': 0, 'offsets': current_offsets()}
+            self.check_conflicts(options['path'], state['offsets'])
+            self.reserve(options['path'], state['offsets'])
+        write_state(state_path, state)
+        loader = Loader(state['offsets'])
+        started = time.monotonic()
+        done = written = 0
+        batch = {label: [] for label, model, fields in MODELS}
+        last = state['line']
+        with open(options['path'], encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                if number <= state['line'] or not line.strip():
+                    continue
+                record = json.loads(line)
+                batch[record['model']].append(loader.row(record))
+                done += 1
+                last = number
+                if done % options['batch_size'] == 0:
+                    written += self.flush(
+                        loader, batch, state, state_path, last
+                    )
+                    self.report(done, written, started)
+        written += self.flush(loader, batch, state, state_path, last)
+        self.report(done, written, started)
+        self.finish(state['offsets'])
+
+    def reserve(self, path, offsets):
+        '''Занять диапазоны id выгрузки до записи первой строки.
+
+        Сайт работает во время импорта: без этого новая запись могла бы
+        получить id из диапазона, и строка выгрузки на её месте упала бы
+        на ключе или привязала бы свои комментарии к чужой строке.
+        '''
+        with open(path, encoding='utf-8') as file:
+            last = last_pks(json.loads(line) for line in file if line.strip())
+        taken = reserve_ids(offsets, last)
+        if taken:
+            raise CommandError(
+                'Пока готовился импорт, на сайте появились новые строки: '
+                f'{", ".join(taken)}. Ничего не записано, запустите импорт '
+                'снова.'
+            )
+
+    def settle_pending(self, state):
+        '''Узнать, записалась ли пачка, прерванная после транзакции.
+
+        Пачка пишется одной транзакцией, поэтому достаточно одной её
+        строки. Диапазон id занят импортом, и чужой строки с этим id
+        быть не может.
+        '''
+        pending = state.pop('pending', None)
+        if pending is None:
+            return
+        model = {label: model for label, model, fields in MODELS}[
+            pending['model']
+        ]
+        if model.objects.filter(pk=pending['pk']).exists():
+            state['line'] = pending['line']
+
+    def check_conflicts(self, path, offsets):
+        '''Остановить импорт до записи, если имена или slug уже заняты.
+
+        Иначе первая же пачка упала бы на ограничении уникальности,
+        а слить чужие строки с существующими молча нельзя: посты
+        достались бы другому человеку.
+        '''
+        with open(path, encoding='utf-8') as file:
+            conflicts = find_conflicts(
+                (json.loads(line) for line in file if line.strip()), offsets
+            )
+        if not conflicts:
+            return
+        lines = []
+        for label, values in conflicts.items():
+            shown = ', '.join(values[:CONFLICTS_SHOWN])
+            if len(values) > CONFLICTS_SHOWN:
+                shown += f' и ещё {len(values) - CONFLICTS_SHOWN}'
+            lines.append(f'{label}: {shown}')
+        raise CommandError(
+            'В базе уже есть строки с такими ключами, ничего не записано. '
+            'Переименуйте их в базе или в выгрузке:\n' + '\n'.join(lines)
+        )
+
+    def flush(self, loader, batch, state, state_path, last):
+        '''Записать пачку и отметить её в файле состояния.
+
+        Перед транзакцией в состояние пишется первая строка пачки:
+        если процесс упадёт между фиксацией и записью состояния,
+        повторный запуск по ней узнает, что пачка уже в базе.
+        '''
+        first = next(
+            ((label, rows[0][0]) for label, rows in batch.items() if rows),
+            None
+        )
+        if first is not None:
+            state['pending'] = {
+                'line': last, 'model': first[0], 'pk': first[1]
+            }
+            write_state(state_path, state)
+        written = 0
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                for label, model, fields in MODELS:
+                    if batch[label]:
+                        written += loader.insert(cursor, label, batch[label])
+        except IntegrityError as error:
+            raise CommandError(
+                f'Пачка не записана: {error}. Исправьте выгрузку или базу '
+                'и запустите импорт снова.'
+            )
+        for rows in batch.values():
+            rows.clear()
+        state.pop('pending', None)
+        state['line'] = last
+        write_state(state_path, state)
+        return written
+
+    def report(self, done, written, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{done} строк, записано {written} за {elapsed:.2f} с '
+            f'({done / max(elapsed, 1e-9):.0f} строк/с)'
+        )
+
+    def finish(self, offsets):
+        '''Выставить счётчики id и пересчитать производные данные.
+
+        Строки пишутся в обход сигналов, поэтому сводки групп и архива,
+        ветки комментариев, теги и хеши текстов обновляются здесь.
+        '''
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [model for label, model, fields in MODELS]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        with transaction.atomic():
+            refresh_group_stats()
+        rebuild_archive()
+        rebuild_paths()
+        call_command(
+            'backfill_tags', after=offsets['post'], stdout=self.stdout
+        )
+        call_command('backfill_text_hashes', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Импорт завершён.'))
@@ -0,0 +1,161 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.dateparse import parse_date
+
+from posts.images import build_thumbnails
+from posts.models import Post
+from posts.utils import keyset_batches
+
+
+BATCH_SIZE = 200
+CHECKPOINT_PATH = os.path.join(settings.BASE_DIR, '.rebuild_thumbnails')
+
+logger = logging.getLogger(__name__)
+
+
+def build(name):
+    '''build_thumbnails в процессе пула: None, если картинка не читается.
+
+    Испорченный исходник не должен останавливать весь прогон.
+    '''
+    try:
+        return build_thumbnails(name)
+    except Exception:
+        logger.exception('Миниатюры %s не построены', name)
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестроить миниатюры картинок постов '
+        '(размеры берутся из settings.POST_THUMBNAILS).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Количество процессов.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько картинок обрабатывать между сохранениями прогресса.'
+        )
+        parser.add_argument(
+            '--since', help='Только посты, опубликованные с даты YYYY-MM-DD.'
+        )
+        parser.add_argument(
+            '--until', help='Только посты, опубликованные до даты YYYY-MM-DD.'
+        )
+        parser.add_argument(
+            '--checkpoint', default=CHECKPOINT_PATH,
+            help='Файл с id последнего обработанного поста и фильтрами.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Игнорировать сохранённый прогресс и начать сначала.'
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        filters = self.filters_key(options)
+        last_pk = 0
+        if not options['restart']:
+            last_pk, saved_filters = self.read_checkpoint(checkpoint)
+            if last_pk and saved_filters != filters:
+                # Id из прогона с другими датами пропустил бы посты,
+                # которые тот прогон не обрабатывал.
+                raise CommandError(
+                    f'Контрольная точка {checkpoint} сохранена с фильтрами '
+                    f'"{saved_filters}", а не "{filters}". Запустите с теми '
+                    f'же --since/--until или с --restart.'
+                )
+        posts = self.get_queryset(options).filter(pk__gt=last_pk)
+        total = posts.count()
+        if last_pk:
+            self.stdout.write(f'Продолжаем после поста id={last_pk}.')
+        self.stdout.write(f'Картинок к обработке: {total}')
+
+        done = missing = 0
+        failed = []
+        started = time.monotonic()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('fork'),
+        ) as executor:
+            for batch in keyset_batches(posts, options['batch_size'], 'image'):
+                pks, names = zip(*batch)
+                # Пул порождает процессы через fork, и они не должны
+                # унаследовать открытое соединение с БД.
+                connections.close_all()
+                for name, result in zip(names, executor.map(build, names)):
+                    if result is None:
+                        failed.append(name)
+                        self.stderr.write(f'Картинка не обработана: {name}')
+                    elif not result:
+                        missing += 1
+                done += len(batch)
+                self.write_checkpoint(checkpoint, pks[-1], filters)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{done}/{total} '
+                    f'({done / elapsed:.1f} картинок/с)'
+                )
+
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {done} картинок за {elapsed:.1f} с '
+            f'({rate:.1f} картинок/с), файлов не найдено: {missing}, '
+            f'с ошибками: {len(failed)}.'
+        ))
+
+    def get_queryset(self, options):
+        posts = Post.objects.exclude(image='')
+        for option, lookup in (
+            ('since', 'pub_date__date__gte'),
+            ('until', 'pub_date__date__lt'),
+        ):
+            if options[option]:
+                date = parse_date(options[option])
+                if date is None:
+                    raise CommandError(
+                        f'Неверная дата в --{option}: {options[option]}'
+                    )
+                posts = posts.filter(**{lookup: date})
+        return posts
+
+    @staticmethod
+    def filters_key(options):
+        '''Фильтры прогона в виде строки для контрольной точки.'''
+        return ' '.join(
+            f'--{option}={options[option]}'
+            for option in ('since', 'until') if options[option]
+        )
+
+    @staticmethod
+    def read_checkpoint(path):
+        '''id последнего обработанного поста и фильтры его прогона.'''
+        try:
+            with open(path) as file:
+                pk, _, filters = file.read().partition('\n')
+            return int(pk.strip() or 0), filters.strip()
+        except (FileNotFoundError, ValueError):
+            return 0, ''
+
+    @staticmethod
+    def write_checkpoint(path, pk, filters):
+        # Запись через временный файл, чтобы прерывание не оставило
+        # повреждённую контрольную точку.
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(f'{pk}\n{filters}')
+        os.replace(tmp_path, path)
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.groups import refresh_group_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитать сводку каталога групп. Запускается по расписанию, '
+        'чтобы устаревало число активных авторов, и после импорта данных.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            count = refresh_group_stats()
+        self.stdout.write(
+            f'Обновлено групп: {count} '
+            f'за {time.monotonic() - started:.2f} с.'
+        )
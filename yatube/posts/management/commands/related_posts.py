@@ -0,0 +1,157 @@
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.models import Post, RelatedPost
+from posts.related import (
+    CHUNK_SIZE, MIN_SIMILARITY, affected_rows, embed, floors_for,
+    inverse_frequency, projection, related_rows, term_counts
+)
+from posts.utils import insert_sql, keyset_batches
+
+
+INDEX_PATH = os.path.join(settings.BASE_DIR, '.related_posts.npz')
+BATCH_SIZE = 1000
+# Ограничение SQLite на число параметров в одном запросе.
+DELETE_BATCH_SIZE = 500
+
+
+def read_posts(queryset, batch_size):
+    '''id и частоты слов постов, пачками по первичному ключу.'''
+    for batch in keyset_batches(queryset, batch_size, 'text'):
+        pks, texts = zip(*batch)
+        yield np.array(pks, dtype=np.int64), term_counts(texts)
+
+
+def embed_batches(batches, idf, matrix):
+    vectors = [
+        embed(len(pks), *counts, idf, matrix) for pks, counts in batches
+    ]
+    return np.concatenate(vectors) if vectors else np.zeros(
+        (0, matrix.shape[1]), dtype=np.float32
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Посчитать похожие посты по TF-IDF векторам текста. Без --rebuild '
+        'добавляет в индекс только новые посты и обновляет списки старых, '
+        'которым новые подходят лучше; правки текста и IDF учитывает '
+        'полный пересчёт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать все посты заново.'
+        )
+        parser.add_argument(
+            '--index', default=INDEX_PATH,
+            help='Файл с векторами постов между запусками.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько постов читать за один запрос.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Сколько постов сравнивать со всеми за один шаг.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        matrix = projection()
+        if options['rebuild'] or not os.path.exists(options['index']):
+            index, changed = self.rebuild(matrix, options)
+        else:
+            index, changed = self.update(matrix, options)
+        ids = index['ids']
+        parts = list(related_rows(
+            index['vectors'], changed, options['chunk_size']
+        ))
+        if parts:
+            rows, columns, scores = map(np.concatenate, zip(*parts))
+        else:
+            rows = columns = np.zeros(0, dtype=np.int64)
+            scores = np.zeros(0, dtype=np.float32)
+        self.write(ids, changed, rows, columns, scores)
+        index['floors'][changed] = floors_for(len(ids), rows, scores)[changed]
+        self.save(options['index'], index)
+        self.stdout.write(
+            f'Постов в индексе: {len(ids)}, пересчитано: {len(changed)}, '
+            f'похожих: {len(rows)} за {time.monotonic() - started:.2f} с.'
+        )
+
+    def rebuild(self, matrix, options):
+        batches = list(read_posts(Post.objects.all(), options['batch_size']))
+        ids = np.concatenate(
+            [pks for pks, counts in batches] or [np.zeros(0, dtype=np.int64)]
+        )
+        buckets = np.concatenate(
+            [counts[1] for pks, counts in batches]
+            or [np.zeros(0, dtype=np.int64)]
+        )
+        idf = inverse_frequency(buckets, len(ids))
+        index = {
+            'ids': ids,
+            'vectors': embed_batches(batches, idf, matrix),
+            'idf': idf,
+            'floors': np.full(len(ids), MIN_SIMILARITY, dtype=np.float32),
+        }
+        return index, np.arange(len(ids))
+
+    def update(self, matrix, options):
+        with np.load(options['index']) as saved:
+            index = dict(saved)
+        # Удалённые посты выпадают из индекса, их строки RelatedPost
+        # уже удалены каскадом.
+        alive = np.isin(
+            index['ids'],
+            np.fromiter(Post.objects.values_list('pk', flat=True), np.int64)
+        )
+        for name in ('ids', 'vectors', 'floors'):
+            index[name] = index[name][alive]
+        last_pk = int(index['ids'].max()) if len(index['ids']) else 0
+        batches = list(read_posts(
+            Post.objects.filter(pk__gt=last_pk), options['batch_size']
+        ))
+        old = len(index['ids'])
+        for pks, counts in batches:
+            index['ids'] = np.concatenate((index['ids'], pks))
+            index['floors'] = np.concatenate((
+                index['floors'],
+                np.full(len(pks), MIN_SIMILARITY, dtype=np.float32)
+            ))
+        index['vectors'] = np.concatenate((
+            index['vectors'], embed_batches(batches, index['idf'], matrix)
+        ))
+        added = np.arange(old, len(index['ids']))
+        affected = affected_rows(
+            index['vectors'], index['floors'], added, options['chunk_size']
+        )
+        return index, np.concatenate((affected, added))
+
+    def write(self, ids, changed, rows, columns, scores):
+        '''Заменить строки RelatedPost пересчитанных постов.'''
+        insert = insert_sql(RelatedPost, ('post', 'related', 'score'))
+        changed_ids = ids[changed].tolist()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(changed_ids), DELETE_BATCH_SIZE):
+                RelatedPost.objects.filter(
+                    post_id__in=changed_ids[start:start + DELETE_BATCH_SIZE]
+                ).delete()
+            cursor.executemany(insert, list(zip(
+                ids[rows].tolist(), ids[columns].tolist(),
+                scores.astype(float).tolist()
+            )))
+
+    def save(self, path, index):
+        # Запись во временный файл и переименование: прерванный запуск
+        # не оставит повреждённый индекс.
+        with open(f'{path}.tmp', 'wb') as file:
+            np.savez(file, **index)
+        os.replace(f'{path}.tmp', path)
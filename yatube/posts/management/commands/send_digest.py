@@ -0,0 +1,59 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from posts.digest import BATCH_SIZE, CHUNK_SIZE, PERIODS, digest_messages
+
+
+class Command(BaseCommand):
+    help = (
+        'Разослать подписчикам сводку постов их авторов за день или '
+        'неделю. Подписки и посты периода читаются одним запросом, '
+        'письма уходят пачками через одно соединение.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period', choices=sorted(PERIODS), default='day',
+            help='За какой период собирать сводку.'
+        )
+        parser.add_argument(
+            '--until',
+            help='Конец периода YYYY-MM-DD (не включая), по умолчанию '
+                 'сегодня.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько писем отправлять за один раз.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Сколько строк получать из базы за один раз.'
+        )
+
+    def handle(self, *args, **options):
+        until = timezone.localdate()
+        if options['until']:
+            until = parse_date(options['until'])
+            if until is None:
+                raise CommandError('Дата должна быть в формате YYYY-MM-DD.')
+        started = time.monotonic()
+        sent = 0
+        with get_connection() as mail:
+            for messages in digest_messages(
+                options['period'], until,
+                options['batch_size'], options['chunk_size']
+            ):
+                sent += mail.send_messages(messages) or 0
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Отправлено писем: {sent} '
+                    f'({sent / max(elapsed, 1e-9):.0f} писем/с)'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Сводка до {until}: {sent} писем '
+            f'за {time.monotonic() - started:.2f} с.'
+        ))
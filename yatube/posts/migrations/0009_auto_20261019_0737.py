@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-19 07:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_auto_20230429_2021'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, help_text='Добавьте картинку к посту', upload_to='posts/', verbose_name='Картинка'),
+        ),
+    ]
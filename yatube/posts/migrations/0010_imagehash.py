@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-19 07:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_auto_20261019_0737'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageHash',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='image_hash', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('hash', models.BigIntegerField(verbose_name='Хеш картинки')),
+                ('band0', models.IntegerField(db_index=True)),
+                ('band1', models.IntegerField(db_index=True)),
+                ('band2', models.IntegerField(db_index=True)),
+                ('band3', models.IntegerField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Хеш картинки',
+                'verbose_name_plural': 'Хеши картинок',
+            },
+        ),
+    ]
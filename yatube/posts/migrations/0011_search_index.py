@@ -0,0 +1,90 @@
+from django.db import migrations
+
+
+# Posts are stored under rowid = id * 2 and comments under id * 2 + 1,
+# so triggers update a single row of the index by its rowid.
+CREATE_SQL = (
+    '''
+    CREATE VIRTUAL TABLE posts_search USING fts5(
+        text, post_id UNINDEXED, tokenize = 'unicode61'
+    )
+    ''',
+    '''
+    INSERT INTO posts_search (rowid, text, post_id)
+    SELECT id * 2, text, id FROM posts_post
+    ''',
+    '''
+    INSERT INTO posts_search (rowid, text, post_id)
+    SELECT id * 2 + 1, text, post_id FROM posts_comment
+    ''',
+    '''
+    CREATE TRIGGER posts_post_search_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2, new.text, new.id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER posts_post_search_update AFTER UPDATE OF text ON posts_post
+    BEGIN
+        UPDATE posts_search SET text = new.text WHERE rowid = new.id * 2;
+    END
+    ''',
+    '''
+    CREATE TRIGGER posts_post_search_delete AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+    END
+    ''',
+    '''
+    CREATE TRIGGER posts_comment_search_insert AFTER INSERT ON posts_comment
+    BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2 + 1, new.text, new.post_id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER posts_comment_search_update
+    AFTER UPDATE OF text, post_id ON posts_comment
+    BEGIN
+        UPDATE posts_search SET text = new.text, post_id = new.post_id
+        WHERE rowid = new.id * 2 + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER posts_comment_search_delete AFTER DELETE ON posts_comment
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+    END
+    ''',
+)
+
+DROP_SQL = (
+    'DROP TRIGGER IF EXISTS posts_post_search_insert',
+    'DROP TRIGGER IF EXISTS posts_post_search_update',
+    'DROP TRIGGER IF EXISTS posts_post_search_delete',
+    'DROP TRIGGER IF EXISTS posts_comment_search_insert',
+    'DROP TRIGGER IF EXISTS posts_comment_search_update',
+    'DROP TRIGGER IF EXISTS posts_comment_search_delete',
+    'DROP TABLE IF EXISTS posts_search',
+)
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_imagehash'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(CREATE_SQL), run_sqlite(DROP_SQL)),
+    ]
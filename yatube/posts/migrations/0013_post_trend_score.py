@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-19 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_pub_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trend_score',
+            field=models.FloatField(db_index=True, default=0, editable=False, help_text='Число комментариев с затуханием по времени', verbose_name='Популярность'),
+        ),
+    ]
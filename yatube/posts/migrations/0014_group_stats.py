@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-19 07:48
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+
+def fill_group_stats(apps, schema_editor):
+    # Active authors are left at zero until the first run of the
+    # refresh_group_stats command, which counts them against "now".
+    Group = apps.get_model('posts', 'Group')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    Post = apps.get_model('posts', 'Post')
+    aggregates = {
+        row['group']: row
+        for row in Post.objects.filter(group__isnull=False).order_by()
+        .values('group').annotate(count=Count('pk'), last=Max('pub_date'))
+    }
+    GroupStats.objects.bulk_create(
+        GroupStats(
+            group_id=group_id,
+            post_count=aggregates.get(group_id, {}).get('count', 0),
+            last_post_date=aggregates.get(group_id, {}).get('last'),
+        )
+        for group_id in Group.objects.values_list('pk', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_trend_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group', verbose_name='Группа')),
+                ('post_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Число постов')),
+                ('last_post_date', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Последний пост')),
+                ('active_authors', models.PositiveIntegerField(db_index=True, default=0, help_text='Авторы, писавшие в группу за последние 7 дней', verbose_name='Активные авторы')),
+            ],
+            options={
+                'verbose_name': 'Статистика группы',
+                'verbose_name_plural': 'Статистика групп',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date'], name='posts_post_group_date'),
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
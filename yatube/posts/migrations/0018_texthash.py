@@ -0,0 +1,40 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0017_relatedpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextHash',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(auto_now_add=True, db_index=True, help_text='Отображает дату', verbose_name='Дата публикации')),
+                ('hash', models.BigIntegerField(verbose_name='Хеш текста')),
+                ('band0', models.IntegerField(db_index=True)),
+                ('band1', models.IntegerField(db_index=True)),
+                ('band2', models.IntegerField(db_index=True)),
+                ('band3', models.IntegerField(db_index=True)),
+                ('is_duplicate', models.BooleanField(db_index=True, default=False, help_text='Похож на уже опубликованный текст', verbose_name='Повтор')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('comment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='text_hash', to='posts.Comment', verbose_name='Комментарий')),
+                ('post', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='text_hash', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Хеш текста',
+                'verbose_name_plural': 'Хеши текстов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='texthash',
+            index=models.Index(fields=['author', '-pub_date'], name='posts_texthash_author'),
+        ),
+    ]
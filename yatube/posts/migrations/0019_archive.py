@@ -0,0 +1,65 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:09
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def fill_archive(apps, schema_editor):
+    ArchiveMonth = apps.get_model('posts', 'ArchiveMonth')
+    Post = apps.get_model('posts', 'Post')
+    months = Post.objects.order_by().annotate(
+        year=ExtractYear('pub_date'), month=ExtractMonth('pub_date')
+    )
+    scopes = (
+        ('all', None, months),
+        ('group', 'group', months.filter(group__isnull=False)),
+        ('author', 'author', months),
+    )
+    for scope, field, posts in scopes:
+        keys = ('year', 'month') if field is None else (field, 'year', 'month')
+        ArchiveMonth.objects.bulk_create(
+            ArchiveMonth(
+                scope=scope,
+                scope_id=row[field] if field else 0,
+                year=row['year'],
+                month=row['month'],
+                post_count=row['count'],
+            )
+            for row in posts.values(*keys).annotate(count=Count('pk'))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_texthash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveMonth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('all', 'Весь сайт'), ('group', 'Группа'), ('author', 'Автор')], max_length=10, verbose_name='Раздел')),
+                ('scope_id', models.PositiveIntegerField(default=0, verbose_name='id группы или автора')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Месяц')),
+                ('post_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+            ],
+            options={
+                'verbose_name': 'Месяц архива',
+                'verbose_name_plural': 'Месяцы архива',
+                'ordering': ('-year', '-month'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date'], name='posts_post_author_date'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivemonth',
+            unique_together={('scope', 'scope_id', 'year', 'month')},
+        ),
+        migrations.RunPython(fill_archive, migrations.RunPython.noop),
+    ]
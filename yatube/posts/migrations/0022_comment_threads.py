@@ -0,0 +1,66 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+STEP = 7
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BATCH_SIZE = 1000
+
+
+def encode_step(pk):
+    digits = []
+    while pk:
+        pk, digit = divmod(pk, 36)
+        digits.append(DIGITS[digit])
+    return ''.join(reversed(digits)).rjust(STEP, '0')
+
+
+def fill_paths(apps, schema_editor):
+    # До этой миграции ответов не было: все комментарии - корни веток.
+    Comment = apps.get_model('posts', 'Comment')
+    pks = list(Comment.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(pks), BATCH_SIZE):
+        Comment.objects.bulk_update(
+            [
+                Comment(pk=pk, path=encode_step(pk))
+                for pk in pks[start:start + BATCH_SIZE]
+            ],
+            ('path',)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_comment_post_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='Комментарий, на который отвечают', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='Ответ на'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, help_text='id предков и самого комментария, см. posts.threads', max_length=255, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Все ответы в ветке под комментарием', verbose_name='Число ответов'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='posts_comment_post_path'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:25
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    # Без ограничения get_or_create мог записать подписку дважды.
+    Follow = apps.get_model('posts', 'Follow')
+    keep = Follow.objects.order_by().values('user', 'author').annotate(
+        first=models.Min('pk')
+    ).values('first')
+    Follow.objects.exclude(pk__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_comment_threads'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='posts_follow_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_follow_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='view_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Просмотры страницы поста, сброшенные из буфера', verbose_name='Просмотры'),
+        ),
+    ]
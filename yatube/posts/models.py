@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from core.models import CreatedModel
 
@@ -58,21 +58,61 @@ class Post(CreatedModel):
     image = models.ImageField(
         upload_to='posts/',
         blank=True,
+        db_index=True,
         verbose_name='Картинка',
         help_text='Добавьте картинку к посту'
     )
+    trend_score = models.FloatField(
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name='Популярность',
+        help_text='Число комментариев с затуханием по времени'
+    )
+    view_count = models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name='Просмотры',
+        help_text='Просмотры страницы поста, сброшенные из буфера'
+    )
 
     def __str__(self):
         return self.text[:LIMIT_ELEMENT]
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('group', '-pub_date'), name='posts_post_group_date'
+            ),
+            models.Index(
+                fields=('author', '-pub_date'), name='posts_post_author_date'
+            ),
+        )
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
 
+class CommentQuerySet(models.QuerySet):
+    def delete(self):
+        '''Удалить комментарии с ответами, поправив счётчики веток.
+
+        Удаления каскадом (поста, пользователя) сюда не попадают,
+        их ветки правит posts.signals.
+        '''
+        from .threads import forget_comments
+        with transaction.atomic():
+            forget_comments(self)
+            return super().delete()
+
+
 class Comment(CreatedModel):
-    '''Модель комментария.'''
+    '''Модель комментария.
+
+    Удаление идёт через CommentQuerySet.delete, чтобы счётчики ответов
+    предков не разошлись с ветками.
+    '''
     post = models.ForeignKey(
         Post,
         blank=True,
@@ -93,12 +133,52 @@ class Comment(CreatedModel):
         verbose_name='Текст комментария',
         help_text='Введите текст комментария'
     )
+    parent = models.ForeignKey(
+        'self',
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name='replies',
+        verbose_name='Ответ на',
+        help_text='Комментарий, на который отвечают'
+    )
+    path = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        verbose_name='Путь в ветке',
+        help_text='id предков и самого комментария, см. posts.threads'
+    )
+    depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Глубина'
+    )
+    reply_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число ответов',
+        help_text='Все ответы в ветке под комментарием'
+    )
+
+    objects = CommentQuerySet.as_manager()
 
     def __str__(self):
         return self.text
 
+    def delete(self, using=None, keep_parents=False):
+        return Comment.objects.using(using).filter(pk=self.pk).delete()
+
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('post', '-pub_date'), name='posts_comment_post_date'
+            ),
+            models.Index(
+                fields=('post', 'path'), name='posts_comment_post_path'
+            ),
+        )
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -121,5 +201,316 @@ class Follow(models.Model):
     )
 
     class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'), name='posts_follow_unique'
+            ),
+        )
         verbose_name = 'Последователь'
         verbose_name_plural = 'Последователи'
+
+
+class ImageHash(models.Model):
+    '''Перцептивный хеш картинки поста.
+
+    Хеш дополнительно хранится четырьмя 16-битными частями с индексами:
+    так поиск похожих картинок сводится к точным запросам по индексам.
+    '''
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='image_hash',
+        verbose_name='Пост'
+    )
+    hash = models.BigIntegerField(verbose_name='Хеш картинки')
+    band0 = models.IntegerField(db_index=True)
+    band1 = models.IntegerField(db_index=True)
+    band2 = models.IntegerField(db_index=True)
+    band3 = models.IntegerField(db_index=True)
+
+    def __str__(self):
+        return f'{self.post_id}: {self.hash}'
+
+    class Meta:
+        verbose_name = 'Хеш картинки'
+        verbose_name_plural = 'Хеши картинок'
+
+
+class GroupStats(models.Model):
+    '''Сводка по активности группы для каталога групп.
+
+    Поддерживается при создании, удалении и переносе постов, поэтому
+    каталог сортируется по индексам этой таблицы без обхода постов.
+    '''
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Группа'
+    )
+    post_count = models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        verbose_name='Число постов'
+    )
+    last_post_date = models.DateTimeField(
+        blank=True,
+        null=True,
+        db_index=True,
+        verbose_name='Последний пост'
+    )
+    active_authors = models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        verbose_name='Активные авторы',
+        help_text='Авторы, писавшие в группу за последние 7 дней'
+    )
+
+    def __str__(self):
+        return f'{self.group_id}: {self.post_count}'
+
+    class Meta:
+        verbose_name = 'Статистика группы'
+        verbose_name_plural = 'Статистика групп'
+
+
+class FollowSuggestion(models.Model):
+    '''Рекомендованный автор, посчитанный командой suggest_authors.'''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follow_suggestions',
+        verbose_name='Читатель'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рекомендованный автор'
+    )
+    score = models.PositiveIntegerField(
+        verbose_name='Вес',
+        help_text='Сколько раз автора читают вместе с подписками читателя'
+    )
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.author_id}: {self.score}'
+
+    class Meta:
+        ordering = ('-score', 'pk')
+        indexes = (
+            models.Index(
+                fields=('user', '-score'), name='posts_suggestion_user_score'
+            ),
+        )
+        unique_together = ('user', 'author')
+        verbose_name = 'Рекомендация автора'
+        verbose_name_plural = 'Рекомендации авторов'
+
+
+class Tag(models.Model):
+    '''Хештег из текста постов.
+
+    post_count поддерживается при сохранении и удалении постов и служит
+    сводкой популярных тегов.
+    '''
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name='Тег'
+    )
+    post_count = models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        verbose_name='Число постов'
+    )
+
+    def __str__(self):
+        return f'#{self.name}'
+
+    class Meta:
+        ordering = ('-post_count', 'name')
+        verbose_name = 'Тег'
+        verbose_name_plural = 'Теги'
+
+
+class PostTag(models.Model):
+    '''Тег поста. Дата поста копируется, чтобы лента тега шла по индексу.'''
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_tags',
+        verbose_name='Тег'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='post_tags',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    def __str__(self):
+        return f'{self.tag_id}: {self.post_id}'
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('tag', '-pub_date', '-post'),
+                name='posts_posttag_tag_date'
+            ),
+        )
+        unique_together = ('post', 'tag')
+        verbose_name = 'Тег поста'
+        verbose_name_plural = 'Теги постов'
+
+
+class RelatedPost(models.Model):
+    '''Похожий по тексту пост, посчитанный командой related_posts.'''
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='related_posts',
+        verbose_name='Пост'
+    )
+    related = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий пост'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    def __str__(self):
+        return f'{self.post_id} -> {self.related_id}: {self.score:.2f}'
+
+    class Meta:
+        ordering = ('-score',)
+        indexes = (
+            models.Index(
+                fields=('post', '-score'), name='posts_related_post_score'
+            ),
+        )
+        verbose_name = 'Похожий пост'
+        verbose_name_plural = 'Похожие посты'
+
+
+class TextHash(CreatedModel):
+    '''Simhash текста поста или комментария для поиска повторов.
+
+    Как и у ImageHash, хеш хранится ещё и четырьмя 16-битными частями
+    с индексами.
+    '''
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='text_hash',
+        verbose_name='Пост'
+    )
+    comment = models.OneToOneField(
+        Comment,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='text_hash',
+        verbose_name='Комментарий'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    hash = models.BigIntegerField(verbose_name='Хеш текста')
+    band0 = models.IntegerField(db_index=True)
+    band1 = models.IntegerField(db_index=True)
+    band2 = models.IntegerField(db_index=True)
+    band3 = models.IntegerField(db_index=True)
+    is_duplicate = models.BooleanField(
+        default=False,
+        db_index=True,
+        verbose_name='Повтор',
+        help_text='Похож на уже опубликованный текст'
+    )
+
+    def __str__(self):
+        return f'{self.post_id or self.comment_id}: {self.hash}'
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('author', '-pub_date'), name='posts_texthash_author'
+            ),
+        )
+        verbose_name = 'Хеш текста'
+        verbose_name_plural = 'Хеши текстов'
+
+
+class ArchiveMonth(models.Model):
+    '''Число постов за месяц: по всему сайту, в группе или у автора.
+
+    scope - 'all', 'group' или 'author', scope_id - id группы или автора
+    (0 для всего сайта). Поддерживается при создании, удалении и
+    переносе постов, поэтому архив не считает посты при каждом запросе.
+    '''
+    SCOPES = (
+        ('all', 'Весь сайт'),
+        ('group', 'Группа'),
+        ('author', 'Автор'),
+    )
+    scope = models.CharField(
+        max_length=10,
+        choices=SCOPES,
+        verbose_name='Раздел'
+    )
+    scope_id = models.PositiveIntegerField(
+        default=0,
+        verbose_name='id группы или автора'
+    )
+    year = models.PositiveSmallIntegerField(verbose_name='Год')
+    month = models.PositiveSmallIntegerField(verbose_name='Месяц')
+    post_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число постов'
+    )
+
+    def __str__(self):
+        return f'{self.scope}:{self.scope_id} {self.year}-{self.month:02}'
+
+    class Meta:
+        ordering = ('-year', '-month')
+        unique_together = ('scope', 'scope_id', 'year', 'month')
+        verbose_name = 'Месяц архива'
+        verbose_name_plural = 'Месяцы архива'
+
+
+class Notification(models.Model):
+    '''Неотправленное уведомление подписчику о новом посте.
+
+    Строки копятся, пока ждёт задача рассылки, и удаляются после
+    отправки; несколько постов для одного пользователя уходят одним
+    письмом.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Получатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Пост'
+    )
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.post_id}'
+
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.template.loader import get_template
+from django.urls import reverse
+
+from .models import Follow, Notification, Post, User
+from .utils import insert_sql, keyset_batches
+
+
+CHUNK_SIZE = 1000
+FRAGMENT_CACHE_SIZE = 5000
+# Сколько получателей обрабатывать за один проход рассылки.
+BATCH_SIZE = 200
+
+
+def queue_notifications(post, chunk_size=CHUNK_SIZE):
+    '''Записать уведомления подписчикам автора поста, вернуть их число.
+
+    Подписки читаются пачками по первичному ключу, уведомления пишутся
+    executemany без создания объектов моделей.
+    '''
+    follows = Follow.objects.filter(author_id=post.author_id).exclude(
+        user__email=''
+    ).exclude(user_id=post.author_id)
+    insert = insert_sql(Notification, ('user', 'post'))
+    count = 0
+    for batch in keyset_batches(follows, chunk_size, 'user'):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                insert, [(user_id, post.pk) for pk, user_id in batch]
+            )
+        count += len(batch)
+    return count
+
+
+class Renderer:
+    '''Тексты писем: фрагмент каждого поста рендерится один раз.
+
+    Хранится не больше limit последних фрагментов, так что память
+    не растёт с числом постов в рассылке.
+    '''
+
+    def __init__(self, limit=FRAGMENT_CACHE_SIZE):
+        self.limit = limit
+        self.fragments = OrderedDict()
+        self.template = get_template('posts/email/post.txt')
+
+    def render(self, post):
+        return self.template.render(
+            {
+                'post': post,
+                'url': settings.SITE_URL + reverse(
+                    'posts:post_detail', args=(post.pk,)
+                ),
+            }
+        )
+
+    def store(self, post_id, fragment):
+        self.fragments[post_id] = fragment
+        self.fragments.move_to_end(post_id)
+        while len(self.fragments) > self.limit:
+            self.fragments.popitem(last=False)
+
+    def fragment(self, post):
+        if post.pk in self.fragments:
+            self.fragments.move_to_end(post.pk)
+        else:
+            self.store(post.pk, self.render(post))
+        return self.fragments[post.pk]
+
+    def batch_fragments(self, post_ids):
+        '''Фрагменты постов пачки: {id: фрагмент}, удалённые пропускаются.
+
+        Недостающие в кеше посты загружаются одним запросом. Пачка
+        получает свой словарь, поэтому её посты сверх limit не
+        вытесняют друг друга и не перечитываются по одному; кеш
+        переносит фрагменты только в следующие пачки.
+        '''
+        fragments = {}
+        missing = []
+        for pk in post_ids:
+            if pk in self.fragments:
+                self.fragments.move_to_end(pk)
+                fragments[pk] = self.fragments[pk]
+            else:
+                missing.append(pk)
+        posts = Post.objects.select_related('author', 'group').in_bulk(missing)
+        for pk, post in posts.items():
+            fragments[pk] = self.render(post)
+            self.store(pk, fragments[pk])
+        return fragments
+
+    def message(self, email, posts):
+        '''Письмо об одном посте или сводка, если постов несколько.'''
+        if len(posts) == 1:
+            subject = f'Новый пост: {posts[0].author.username}'
+        else:
+            subject = f'Новые посты от ваших авторов: {len(posts)}'
+        return EmailMessage(
+            subject,
+            '\n\n'.join(self.fragment(post) for post in posts),
+            to=[email],
+        )
+
+
+def pending_batches(batch_size):
+    '''Неотправленные уведомления, сгруппированные по получателям.
+
+    Выдаёт для batch_size получателей за раз их id, id последней
+    прочитанной строки и список (email, посты по дате). Посты и адреса
+    загружаются одним запросом на пачку.
+    '''
+    last_user = 0
+    while True:
+        user_ids = list(
+            Notification.objects.filter(user_id__gt=last_user)
+            .order_by('user_id').values_list('user_id', flat=True)
+            .distinct()[:batch_size]
+        )
+        if not user_ids:
+            return
+        rows = list(
+            Notification.objects.filter(user_id__in=user_ids)
+            .values_list('pk', 'user_id', 'post_id')
+        )
+        posts = Post.objects.select_related('author').in_bulk(
+            {post_id for pk, user_id, post_id in rows}
+        )
+        emails = dict(
+            User.objects.filter(pk__in=user_ids).values_list('pk', 'email')
+        )
+        grouped = {}
+        for pk, user_id, post_id in rows:
+            if post_id in posts:
+                grouped.setdefault(user_id, set()).add(post_id)
+        recipients = [
+            (
+                emails[user_id],
+                sorted(
+                    (posts[post_id] for post_id in post_ids),
+                    key=lambda post: (post.pub_date, post.pk)
+                ),
+            )
+            for user_id, post_ids in sorted(grouped.items())
+            if emails.get(user_id)
+        ]
+        yield user_ids, max(pk for pk, user_id, post_id in rows), recipients
+        last_user = user_ids[-1]
+
+
+def send_pending(batch_size=BATCH_SIZE):
+    '''Отправить накопленные уведомления, вернуть число писем.
+
+    Все письма идут через одно соединение с почтовым сервером, как
+    в send_mass_mail. Строки удаляются только до последней прочитанной,
+    поэтому уведомления, пришедшие во время рассылки, дождутся
+    следующей.
+    '''
+    renderer = Renderer()
+    sent = 0
+    with get_connection() as mail:
+        for user_ids, last_pk, recipients in pending_batches(batch_size):
+            sent += mail.send_messages([
+                renderer.message(email, posts) for email, posts in recipients
+            ]) or 0
+            Notification.objects.filter(
+                user_id__in=user_ids, pk__lte=last_pk
+            ).delete()
+    return sent
@@ -0,0 +1,131 @@
+import re
+import zlib
+
+import numpy as np
+
+
+RELATED_LIMIT = 5
+MIN_SIMILARITY = 0.1
+# Слова хешируются в FEATURES корзин, а TF-IDF векторы корзин случайной
+# проекцией сжимаются до DIMENSIONS: косинус сохраняется приближённо,
+# а сравнение постов сводится к умножению плотных матриц.
+FEATURES = 2 ** 14
+DIMENSIONS = 128
+SEED = 37
+# Матрица сходства части со всеми постами: CHUNK_SIZE x N float32.
+CHUNK_SIZE = 256
+WORD_RE = re.compile(r'\w{3,}')
+
+
+def features(text):
+    '''Номера корзин для слов текста.
+
+    crc32, в отличие от hash(), не меняется между запусками.
+    '''
+    return [
+        zlib.crc32(word.encode()) % FEATURES
+        for word in WORD_RE.findall(text.lower())
+    ]
+
+
+def term_counts(texts):
+    '''Разреженная матрица частот: массивы (документ, корзина, число).'''
+    docs, buckets = [], []
+    for doc, text in enumerate(texts):
+        found = features(text)
+        docs.extend([doc] * len(found))
+        buckets.extend(found)
+    keys, counts = np.unique(
+        np.array(docs, dtype=np.int64) * FEATURES
+        + np.array(buckets, dtype=np.int64),
+        return_counts=True
+    )
+    return keys // FEATURES, keys % FEATURES, counts
+
+
+def inverse_frequency(buckets, size):
+    '''Сглаженный IDF корзин по документам, где они встречаются.'''
+    frequency = np.bincount(buckets, minlength=FEATURES)
+    return (np.log((1 + size) / (1 + frequency)) + 1).astype(np.float32)
+
+
+def projection():
+    # RandomState выдаёт одну и ту же матрицу во всех версиях NumPy.
+    random = np.random.RandomState(SEED)
+    return random.standard_normal((FEATURES, DIMENSIONS)).astype(np.float32)
+
+
+def embed(size, docs, buckets, counts, idf, matrix):
+    '''Сжатые нормированные TF-IDF векторы документов.'''
+    vectors = np.zeros((size, DIMENSIONS), dtype=np.float32)
+    if not len(docs):
+        return vectors
+    weights = (1 + np.log(counts)).astype(np.float32) * idf[buckets]
+    starts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+    vectors[docs[starts]] = np.add.reduceat(
+        matrix[buckets] * weights[:, None], starts
+    )
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def nearest(queries, vectors, own, limit=RELATED_LIMIT):
+    '''Для каждого вектора queries - limit ближайших строк vectors.
+
+    own[i] - номер строки vectors, совпадающей с queries[i], она
+    пропускается. Возвращает (номер запроса, номер строки, сходство)
+    с отсечкой по MIN_SIMILARITY.
+    '''
+    similarity = queries @ vectors.T
+    similarity[np.arange(len(queries)), own] = -1
+    limit = min(limit, vectors.shape[0] - 1)
+    if limit <= 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float32)
+    best = np.argpartition(similarity, -limit, axis=1)[:, -limit:]
+    rows = np.repeat(np.arange(len(queries)), limit)
+    columns = best.ravel()
+    scores = similarity[rows, columns]
+    keep = scores >= MIN_SIMILARITY
+    return rows[keep], columns[keep], scores[keep]
+
+
+def related_rows(vectors, positions, chunk_size=CHUNK_SIZE):
+    '''Похожие для строк positions, частями по chunk_size запросов.
+
+    Генератор отдаёт (строка, похожая строка, сходство).
+    '''
+    for start in range(0, len(positions), chunk_size):
+        chunk = positions[start:start + chunk_size]
+        rows, columns, scores = nearest(vectors[chunk], vectors, chunk)
+        yield chunk[rows], columns, scores
+
+
+def affected_rows(vectors, floors, added, chunk_size=CHUNK_SIZE):
+    '''Старые строки, которым новые строки added подходят лучше.
+
+    floors - сходство худшего из уже найденных похожих для каждой строки.
+    '''
+    old = np.arange(added.min() if len(added) else 0)
+    found = []
+    for start in range(0, len(old), chunk_size):
+        chunk = old[start:start + chunk_size]
+        similarity = vectors[chunk] @ vectors[added].T
+        better = (similarity > floors[chunk, None]).any(axis=1)
+        found.append(chunk[better])
+    return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+
+def floors_for(size, rows, scores, limit=RELATED_LIMIT):
+    '''Худшее сходство среди найденных похожих для каждой строки.
+
+    У неполных списков это MIN_SIMILARITY: туда подойдёт любой
+    достаточно похожий пост.
+    '''
+    floors = np.full(size, MIN_SIMILARITY, dtype=np.float32)
+    counts = np.bincount(rows, minlength=size)
+    worst = np.full(size, np.inf, dtype=np.float32)
+    np.minimum.at(worst, rows, scores)
+    full = counts >= limit
+    floors[full] = worst[full]
+    return floors
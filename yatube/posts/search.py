@@ -0,0 +1,176 @@
+import re
+from collections import namedtuple
+
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+
+SEARCH_LIMIT = 10
+SNIPPET_TOKENS = 16
+WORD_RE = re.compile(r'\w+')
+# Управляющие символы не встречаются в тексте постов, поэтому ими
+# можно отметить совпадения до экранирования HTML.
+MARK_START, MARK_END = '\x02', '\x03'
+
+Hit = namedtuple('Hit', 'post_id comment_id snippet rank rowid')
+
+# Посты хранятся в индексе под rowid = id * 2, комментарии - id * 2 + 1,
+# поэтому триггеры меняют одну строку индекса по её rowid.
+TRIGGERS_SQL = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS posts_post_search_insert
+    AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2, new.text, new.id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS posts_post_search_update
+    AFTER UPDATE OF text ON posts_post
+    BEGIN
+        UPDATE posts_search SET text = new.text WHERE rowid = new.id * 2;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS posts_post_search_delete
+    AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS posts_comment_search_insert
+    AFTER INSERT ON posts_comment
+    BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2 + 1, new.text, new.post_id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS posts_comment_search_update
+    AFTER UPDATE OF text, post_id ON posts_comment
+    BEGIN
+        UPDATE posts_search SET text = new.text, post_id = new.post_id
+        WHERE rowid = new.id * 2 + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS posts_comment_search_delete
+    AFTER DELETE ON posts_comment
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+    END
+    ''',
+)
+
+
+def is_supported():
+    '''Полнотекстовый индекс есть только в SQLite (FTS5).'''
+    return connection.vendor == 'sqlite'
+
+
+def install_triggers(using):
+    '''Создать триггеры индекса, если их нет.
+
+    SQLite удаляет триггеры вместе с таблицей, а миграции, меняющие
+    поля Post и Comment, пересоздают таблицы. Поэтому триггеры
+    восстанавливаются после каждого migrate.
+    '''
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    if 'posts_search' not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for statement in TRIGGERS_SQL:
+            cursor.execute(statement)
+
+
+def match_expression(query):
+    '''Превратить пользовательский ввод в выражение FTS5 MATCH.
+
+    Каждое слово берётся в кавычки, чтобы операторы FTS5 в запросе
+    не ломали синтаксис, последнее слово ищется как префикс.
+    '''
+    words = WORD_RE.findall(query or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def find_text(query, after=None, limit=SEARCH_LIMIT):
+    '''Найти посты и комментарии, лучшие по bm25 первыми.
+
+    after - курсор (rank, rowid) последнего показанного результата.
+    Возвращает список Hit и курсор следующей страницы или None.
+    '''
+    expression = match_expression(query)
+    if expression is None:
+        return [], None
+    sql = (
+        'SELECT post_id, rowid, rank, '
+        'snippet(posts_search, 0, %s, %s, %s, %s) '
+        'FROM posts_search WHERE posts_search MATCH %s'
+    )
+    params = [MARK_START, MARK_END, '…', SNIPPET_TOKENS, expression]
+    if after is not None:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(limit + 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    hits = [
+        Hit(
+            post_id=post_id,
+            comment_id=(rowid - 1) // 2 if rowid % 2 else None,
+            snippet=highlight(snippet),
+            rank=rank,
+            rowid=rowid,
+        )
+        for post_id, rowid, rank, snippet in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = (hits[-1].rank, hits[-1].rowid)
+    return hits, next_cursor
+
+
+def encode_cursor(cursor):
+    return f'{cursor[0]!r}_{cursor[1]}' if cursor else ''
+
+
+def decode_cursor(value):
+    try:
+        rank, rowid = (value or '').split('_')
+        return float(rank), int(rowid)
+    except ValueError:
+        return None
+
+
+def matching_ids(query, comments=False):
+    '''Подзапрос с id постов или комментариев, текст которых подходит.
+
+    Используется в админке вместо LIKE '%...%' по всей таблице.
+    '''
+    expression = match_expression(query)
+    parity = 1 if comments else 0
+    return RawSQL(
+        'SELECT rowid / 2 FROM posts_search '
+        'WHERE posts_search MATCH %s AND rowid %% 2 = %s',
+        (expression, parity)
+    )
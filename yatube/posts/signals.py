@@ -0,0 +1,97 @@
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from . import archive, threads
+from .autocomplete import INDEXES, User
+from .groups import post_added, post_removed
+from .models import Comment, Group, GroupStats, Post
+from .search import install_triggers
+from .tags import forget_post_tags
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == 'posts':
+        install_triggers(using)
+
+
+@receiver(post_save, sender=Comment)
+def raise_trend_score(sender, instance, created, **kwargs):
+    '''Каждый новый комментарий добавляет посту единицу популярности.
+
+    Со временем вклад затухает: его уменьшает команда decay_trending.
+    '''
+    if created and instance.post_id is not None:
+        Post.objects.filter(pk=instance.post_id).update(
+            trend_score=F('trend_score') + 1
+        )
+
+
+@receiver(post_save, sender=Comment)
+def place_created_comment(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        threads.place_comment(instance)
+
+
+@receiver(pre_delete, sender=User)
+def count_deleted_user_replies(sender, instance, **kwargs):
+    '''Комментарии пользователя удалятся каскадом: поправить ветки.
+
+    Ветки под его постами удаляются целиком, их не трогаем. Сигнала
+    на удаление самого комментария нет, чтобы каскад удалял
+    комментарии пачками; прямые удаления правит CommentQuerySet.delete.
+    '''
+    threads.forget_comments(
+        Comment.objects.filter(author=instance).exclude(post__author=instance)
+    )
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        GroupStats.objects.get_or_create(group=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, raw, **kwargs):
+    '''Перенос поста между группами учитывает post_edit через post_moved.'''
+    if created and not raw:
+        post_added(instance.group_id, instance.pub_date)
+        archive.post_added(instance)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    post_removed(instance.group_id)
+    archive.post_removed(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def count_deleted_post_tags(sender, instance, **kwargs):
+    # Теги поста удаляются каскадом после сигнала, счётчики - здесь.
+    forget_post_tags(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, **kwargs):
+    INDEXES['users'].update(instance.pk, instance.username, instance.username)
+
+
+@receiver(post_delete, sender=User)
+def unindex_username(sender, instance, **kwargs):
+    INDEXES['users'].remove(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def index_group(sender, instance, **kwargs):
+    INDEXES['groups'].update(
+        instance.pk, instance.title, instance.title, instance.slug
+    )
+
+
+@receiver(post_delete, sender=Group)
+def unindex_group(sender, instance, **kwargs):
+    INDEXES['groups'].remove(instance.pk)
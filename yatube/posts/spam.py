@@ -0,0 +1,99 @@
+import datetime as dt
+import re
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .hashing import band_lookups, bands, hamming, simhash, to_signed
+from .models import TextHash
+
+
+FLAG, REJECT, RATE_LIMIT = 'flag', 'reject', 'rate-limit'
+# Короткие тексты вроде «Спасибо!» повторяются честно, их не проверяем.
+MIN_WORDS = 5
+WORD_RE = re.compile(r'\w+')
+REJECT_MESSAGE = 'Этот текст почти повторяет уже опубликованный.'
+
+Verdict = namedtuple('Verdict', 'value duplicates rejected')
+
+
+def text_simhash(text):
+    '''Simhash по словам текста или None для коротких текстов.
+
+    Шинглы из нескольких слов на коротких текстах слишком чувствительны:
+    замена одного слова меняет треть признаков и десяток бит хеша.
+    '''
+    words = WORD_RE.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    return simhash(words)
+
+
+def make_text_hash(value, author_id, **target):
+    return TextHash(
+        author_id=author_id,
+        hash=to_signed(value),
+        **{f'band{index}': band for index, band in enumerate(bands(value))},
+        **target
+    )
+
+
+def find_duplicates(value, distance=None, exclude=None):
+    '''id хешей текстов не дальше distance бит от value.
+
+    Кандидаты выбираются по индексам частей хеша, как для картинок.
+    '''
+    if distance is None:
+        distance = settings.SPAM_TEXT_DISTANCE
+    query = reduce(or_, (
+        Q(**{f'{band}__in': values})
+        for band, values in band_lookups(value, distance)
+    ))
+    candidates = TextHash.objects.filter(query)
+    if exclude is not None:
+        candidates = candidates.exclude(**exclude)
+    return [
+        pk for pk, other in candidates.values_list('pk', 'hash')
+        if hamming(value, other) <= distance
+    ]
+
+
+def over_rate(author):
+    limit, seconds = settings.SPAM_TEXT_RATE
+    since = timezone.now() - dt.timedelta(seconds=seconds)
+    return TextHash.objects.filter(
+        author=author, is_duplicate=True, pub_date__gte=since
+    ).count() >= limit
+
+
+def check_text(text, author, exclude=None):
+    '''Найти повторы текста и решить, принимать ли его.
+
+    Решение зависит от settings.SPAM_TEXT_ACTION: 'flag' только
+    помечает повтор, 'reject' отклоняет его, 'rate-limit' отклоняет,
+    когда автор уже прислал SPAM_TEXT_RATE повторов за период.
+    '''
+    value = text_simhash(text)
+    if value is None:
+        return Verdict(None, [], False)
+    duplicates = find_duplicates(value, exclude=exclude)
+    action = settings.SPAM_TEXT_ACTION
+    rejected = bool(duplicates) and (
+        action == REJECT or action == RATE_LIMIT and over_rate(author)
+    )
+    return Verdict(value, duplicates, rejected)
+
+
+def save_text_hash(verdict, author, **target):
+    '''Сохранить хеш принятого текста; target - post= или comment=.'''
+    TextHash.objects.filter(**target).delete()
+    if verdict.value is None:
+        return None
+    text_hash = make_text_hash(verdict.value, author.pk, **target)
+    text_hash.is_duplicate = bool(verdict.duplicates)
+    text_hash.save()
+    return text_hash
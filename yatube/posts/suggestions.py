@@ -0,0 +1,134 @@
+import numpy as np
+
+
+SUGGESTIONS_LIMIT = 5
+# Сколько авторов, похожих на каждого автора, участвует в рекомендациях.
+NEIGHBOURS = 50
+# Подписки одного читателя дают квадратичное число пар авторов, поэтому
+# у читателей с огромным числом подписок учитываются только первые.
+MAX_FOLLOWS = 1000
+CHUNK_SIZE = 5000
+
+
+def build_csr(rows, size):
+    '''Индекс строк: элементы строки i - order[indptr[i]:indptr[i + 1]].'''
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, order
+
+
+def gather(indptr, rows, limit=None):
+    '''Элементы строк rows: пары (номер в rows, позиция) одним проходом.'''
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    if limit is not None:
+        lengths = np.minimum(lengths, limit)
+    owners = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    return owners, np.repeat(starts, lengths) + offsets
+
+
+def sum_pairs(rows, columns, weights, width):
+    '''Сложить веса одинаковых пар (row, column).'''
+    keys, inverse = np.unique(rows * width + columns, return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=weights)
+    return keys // width, keys % width, sums
+
+
+def top_per_row(rows, columns, scores, limit):
+    '''Не больше limit лучших (row, column, score) в каждой строке.
+
+    Результат упорядочен по строкам, лучшие в строке первыми.
+    '''
+    order = np.lexsort((columns, -scores, rows))
+    rows, columns, scores = rows[order], columns[order], scores[order]
+    keep = np.arange(len(rows)) - np.searchsorted(rows, rows) < limit
+    return rows[keep], columns[keep], scores[keep]
+
+
+def merge_pairs(parts, size):
+    '''Слить части (rows, columns, counts) в одну, сложив одинаковые пары.'''
+    return sum_pairs(*map(np.concatenate, zip(*parts)), size)
+
+
+def co_followed(indptr, follows, size, chunk_size):
+    '''Для каждого автора - NEIGHBOURS авторов, чаще всего читаемых вместе.
+
+    Пары авторов собираются по подпискам читателей частями. Суммы
+    частей сливаются с накопленными, как только их набирается не
+    меньше накопленного, поэтому в памяти держится не больше двух
+    копий различных пар авторов и одна часть, а не пары всех читателей.
+    Для точных сумм нужны все пары до конца: память растёт с числом
+    различных пар, отбросить их по ходу нельзя.
+    '''
+    readers = np.flatnonzero(np.diff(indptr))
+    merged, parts, pending = None, [], 0
+    for start in range(0, len(readers), chunk_size):
+        chunk = readers[start:start + chunk_size]
+        owners, positions = gather(indptr, chunk, MAX_FOLLOWS)
+        pairs, others = gather(indptr, chunk[owners], MAX_FOLLOWS)
+        first, second = follows[positions][pairs], follows[others]
+        different = first != second
+        part = sum_pairs(first[different], second[different], None, size)
+        parts.append(part)
+        pending += len(part[0])
+        if merged is None or pending >= len(merged[0]):
+            merged = merge_pairs(
+                parts if merged is None else [merged, *parts], size
+            )
+            parts, pending = [], 0
+    if merged is None:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros(size + 1, dtype=np.int64), empty, empty
+    if parts:
+        merged = merge_pairs([merged, *parts], size)
+    rows, columns, counts = top_per_row(*merged, NEIGHBOURS)
+    similar = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=similar[1:])
+    return similar, columns, counts
+
+
+def suggest_authors(users, authors, limit=SUGGESTIONS_LIMIT,
+                    chunk_size=CHUNK_SIZE):
+    '''Посчитать рекомендации авторов по совместным подпискам.
+
+    users, authors - массивы id: пользователь users[i] подписан на
+    authors[i]. Кандидат получает от каждого автора из подписок
+    пользователя столько очков, сколько у них общих читателей; уже
+    знакомые авторы и сам пользователь отбрасываются. Генератор отдаёт
+    тройки массивов (user_id, author_id, score) по частям из chunk_size
+    пользователей.
+    '''
+    ids, inverse = np.unique(
+        np.concatenate((users, authors)), return_inverse=True
+    )
+    inverse = inverse.ravel()
+    size = len(ids)
+    users, authors = inverse[:len(users)], inverse[len(users):]
+    indptr, order = build_csr(users, size)
+    follows = authors[order]
+    similar, neighbours, counts = co_followed(
+        indptr, follows, size, chunk_size
+    )
+
+    readers = np.flatnonzero(np.diff(indptr))
+    for start in range(0, len(readers), chunk_size):
+        chunk = readers[start:start + chunk_size]
+        owners, positions = gather(indptr, chunk)
+        followed = follows[positions]
+        known = np.concatenate((
+            owners * size + followed,
+            np.arange(len(chunk)) * size + chunk,
+        ))
+        pairs, positions = gather(similar, followed)
+        owners, candidates, scores = sum_pairs(
+            owners[pairs], neighbours[positions], counts[positions], size
+        )
+        new = ~np.isin(owners * size + candidates, known)
+        owners, candidates, scores = top_per_row(
+            owners[new], candidates[new], scores[new], limit
+        )
+        yield ids[chunk[owners]], ids[candidates], scores.astype(np.int64)
@@ -0,0 +1,91 @@
+import re
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import PostTag, Tag
+from .utils import date_keyset_page
+
+
+TAG_RE = re.compile(r'(?<![\w&])#(\w+)')
+MAX_TAG_LENGTH = Tag._meta.get_field('name').max_length
+TAG_POSTS_LIMIT = 10
+TOP_TAGS_LIMIT = 10
+
+
+def extract_tags(text):
+    '''Множество нормализованных тегов из текста: без # и в нижнем регистре.
+
+    Слишком длинные теги пропускаются.
+    '''
+    return {
+        name.lower() for name in TAG_RE.findall(text or '')
+        if len(name) <= MAX_TAG_LENGTH
+    }
+
+
+def change_counts(tag_ids, delta):
+    if tag_ids:
+        Tag.objects.filter(pk__in=tag_ids).update(
+            post_count=F('post_count') + delta
+        )
+
+
+def update_post_tags(post):
+    '''Привести теги поста в соответствие с его текстом.
+
+    Меняются только добавленные и убранные теги, счётчики сводки
+    сдвигаются на единицу, а не пересчитываются.
+    '''
+    names = extract_tags(post.text)
+    current = dict(
+        PostTag.objects.filter(post=post).values_list('tag__name', 'tag_id')
+    )
+    removed = [current[name] for name in current.keys() - names]
+    added = names - current.keys()
+    with transaction.atomic():
+        if removed:
+            PostTag.objects.filter(post=post, tag_id__in=removed).delete()
+            change_counts(removed, -1)
+        if added:
+            Tag.objects.bulk_create(
+                (Tag(name=name) for name in added), ignore_conflicts=True
+            )
+            added = list(
+                Tag.objects.filter(name__in=added).values_list('pk', flat=True)
+            )
+            PostTag.objects.bulk_create(
+                PostTag(tag_id=tag_id, post=post, pub_date=post.pub_date)
+                for tag_id in added
+            )
+            change_counts(added, 1)
+
+
+def forget_post_tags(post_id):
+    '''Уменьшить счётчики тегов удаляемого поста.'''
+    change_counts(
+        list(
+            PostTag.objects.filter(post_id=post_id)
+            .values_list('tag_id', flat=True)
+        ),
+        -1
+    )
+
+
+def top_tags(limit=TOP_TAGS_LIMIT):
+    return Tag.objects.filter(post_count__gt=0)[:limit]
+
+
+def tagged_posts(tag, after=None, limit=TAG_POSTS_LIMIT):
+    '''Посты тега, новые первыми, по индексу (tag, -pub_date, -post).
+
+    after - курсор (pub_date, post_id) последнего показанного поста.
+    Возвращает список постов и курсор следующей страницы или None.
+    '''
+    rows, next_cursor = date_keyset_page(
+        PostTag.objects.filter(tag=tag).select_related(
+            'post__author', 'post__group'
+        ),
+        after, limit, pk_field='post_id'
+    )
+    return [row.post for row in rows], next_cursor
@@ -0,0 +1,53 @@
+from django.conf import settings
+
+from core.jobs import task
+
+from . import groups, images, notifications
+from .models import Post
+
+
+@task()
+def update_image_hash(post_id):
+    '''Пересчитать хеш картинки поста, если пост ещё существует.'''
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        images.update_image_hash(post)
+
+
+@task()
+def build_thumbnails(name):
+    '''Заранее построить миниатюры, чтобы их не строил первый просмотр.'''
+    images.build_thumbnails(name)
+
+
+def image_changed(post):
+    '''Поставить в очередь работу после загрузки или замены картинки.'''
+    update_image_hash.delay(post.pk, dedup_key=f'image-hash:{post.pk}')
+    if post.image:
+        build_thumbnails.delay(
+            post.image.name, dedup_key=f'thumbnails:{post.image.name}'
+        )
+
+
+@task()
+def update_active_authors(group_id):
+    groups.update_active_authors(group_id)
+
+
+@task()
+def notify_followers(post_id):
+    '''Записать уведомления о посте и запланировать рассылку.
+
+    Рассылка откладывается на NOTIFY_DELAY секунд, и посты, вышедшие
+    за это время, приходят подписчику одним письмом.
+    '''
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None and notifications.queue_notifications(post):
+        send_notifications.delay(
+            delay=settings.NOTIFY_DELAY, dedup_key='send-notifications'
+        )
+
+
+@task()
+def send_notifications():
+    notifications.send_pending()
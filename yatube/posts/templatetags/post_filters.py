@@ -0,0 +1,29 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+
+from ..tags import MAX_TAG_LENGTH, TAG_RE
+
+
+register = template.Library()
+
+
+@register.filter
+def hashtags(text):
+    '''Экранировать текст поста и превратить #теги в ссылки.'''
+    parts = []
+    position = 0
+    for match in TAG_RE.finditer(text):
+        name = match.group(1)
+        if len(name) > MAX_TAG_LENGTH:
+            continue
+        parts.append(conditional_escape(text[position:match.start()]))
+        parts.append(format_html(
+            '<a href="{}">{}</a>',
+            reverse('posts:tag', args=(name.lower(),)),
+            match.group(0)
+        ))
+        position = match.end()
+    parts.append(conditional_escape(text[position:]))
+    return mark_safe(''.join(parts))
@@ -0,0 +1,85 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import archive
+from ..models import Comment, Follow, Group, Post, User
+
+
+class AdminChangeListTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.user = User.objects.create(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group
+        )
+        Comment.objects.create(
+            author=cls.user, post=cls.post, text='Тестовый комментарий'
+        )
+        Comment.objects.create(
+            author=cls.admin, post=cls.post, text='Ответ администратора'
+        )
+        Follow.objects.create(user=cls.admin, author=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        '''Число запросов списка постов не зависит от числа строк.'''
+        url = reverse('admin:posts_post_changelist')
+        self.client.get(url)
+        with self.assertNumQueries(4):
+            self.client.get(url)
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {index}', group=self.group)
+            for index in range(20)
+        )
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+    def test_change_author_moves_archive_month(self):
+        '''Смена автора в админке переносит пост в архиве профиля.'''
+        post = Post.objects.create(author=self.user, text='Чей пост')
+        self.client.post(
+            reverse('admin:posts_post_change', args=(post.pk,)),
+            {'text': post.text, 'author': self.admin.pk, 'group': ''}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.author, self.admin)
+        counts = {
+            user: sum(
+                month.post_count
+                for month in archive.archive_months('author', user.pk)
+            )
+            for user in (self.user, self.admin)
+        }
+        self.assertEqual(counts, {
+            self.user: Post.objects.filter(author=self.user).count(),
+            self.admin: 1,
+        })
+
+    def test_author_filter(self):
+        '''Фильтр по имени автора оставляет только его комментарии.'''
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'),
+            {'author': self.user.username}
+        )
+        comments = list(response.context['cl'].result_list)
+        self.assertEqual([comment.author for comment in comments], [self.user])
+
+    def test_benchmark_admin(self):
+        '''Команда замера открывает все списки без ошибок.'''
+        out = StringIO()
+        call_command('benchmark_admin', repeat=1, stdout=out)
+        self.assertIn('/admin/posts/follow/', out.getvalue())
@@ -0,0 +1,486 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import datetime as dt
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import images, transfer
+from ..management.commands import rebuild_thumbnails
+from ..notifications import Renderer
+from ..models import (
+    Comment, Follow, FollowSuggestion, Group, Post, RelatedPost, Tag,
+    TextHash, User
+)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RebuildThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='HasNoName')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            image=SimpleUploadedFile(
+                name='small.gif', content=SMALL_GIF, content_type='image/gif'
+            ),
+        )
+        cls.checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'checkpoint')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_rebuild_thumbnails(self):
+        '''Команда строит миниатюры и удаляет контрольную точку.'''
+        out = StringIO()
+        call_command(
+            'rebuild_thumbnails', workers=1, checkpoint=self.checkpoint,
+            stdout=out,
+        )
+        self.assertIn('Готово: 1', out.getvalue())
+        self.assertTrue(
+            os.path.isdir(os.path.join(TEMP_MEDIA_ROOT, 'cache'))
+        )
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_broken_image_does_not_stop_run(self):
+        '''Испорченная картинка пропускается, остальные обрабатываются.'''
+        broken = Post.objects.create(
+            author=self.user,
+            text='Испорченная картинка',
+            image=SimpleUploadedFile(
+                name='broken.gif', content=b'not an image',
+                content_type='image/gif'
+            ),
+        )
+        out, err = StringIO(), StringIO()
+
+        def build_thumbnails(name):
+            # sorl сам глотает ошибку чтения картинки, но не ошибки
+            # хранилища и декодирования.
+            if name == broken.image.name:
+                raise OSError('image file is truncated')
+            return images.build_thumbnails(name)
+
+        with mock.patch.object(
+            rebuild_thumbnails, 'build_thumbnails', build_thumbnails
+        ), mock.patch.object(rebuild_thumbnails, 'logger'):
+            call_command(
+                'rebuild_thumbnails', workers=1, checkpoint=self.checkpoint,
+                stdout=out, stderr=err,
+            )
+        self.assertIn('Готово: 2', out.getvalue())
+        self.assertIn('с ошибками: 1', out.getvalue())
+        self.assertIn(broken.image.name, err.getvalue())
+
+    def test_rebuild_thumbnails_resumes_from_checkpoint(self):
+        '''Уже обработанные посты пропускаются.'''
+        with open(self.checkpoint, 'w') as file:
+            file.write(str(self.post.pk))
+        out = StringIO()
+        call_command(
+            'rebuild_thumbnails', workers=1, checkpoint=self.checkpoint,
+            stdout=out,
+        )
+        self.assertIn('Картинок к обработке: 0', out.getvalue())
+
+    def test_rebuild_thumbnails_refuses_other_filters(self):
+        '''Прогресс прогона с другими датами не применяется молча.'''
+        with open(self.checkpoint, 'w') as file:
+            file.write(f'{self.post.pk}\n--since=2020-01-01')
+        with self.assertRaises(CommandError):
+            call_command(
+                'rebuild_thumbnails', workers=1, checkpoint=self.checkpoint,
+                stdout=StringIO(),
+            )
+        out = StringIO()
+        call_command(
+            'rebuild_thumbnails', workers=1, checkpoint=self.checkpoint,
+            since='2020-01-01', stdout=out,
+        )
+        self.assertIn('Картинок к обработке: 0', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CleanMediaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='HasNoName')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            image=SimpleUploadedFile(
+                name='used.gif', content=SMALL_GIF, content_type='image/gif'
+            ),
+        )
+        cls.checkpoint_dir = tempfile.mkdtemp()
+        cls.checkpoint = os.path.join(cls.checkpoint_dir, 'clean_media')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(cls.checkpoint_dir, ignore_errors=True)
+
+    def make_file(self, *parts):
+        path = os.path.join(TEMP_MEDIA_ROOT, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(SMALL_GIF)
+        os.utime(path, (0, 0))
+        return path
+
+    def clean(self, **options):
+        call_command(
+            'clean_media', min_age=0, checkpoint=self.checkpoint,
+            stdout=StringIO(), **options
+        )
+
+    def test_clean_media_removes_only_orphans(self):
+        '''Удаляются только файлы, на которые не ссылается ни один пост.'''
+        orphan = self.make_file('posts', 'orphan.gif')
+        used = os.path.join(TEMP_MEDIA_ROOT, self.post.image.name)
+        os.utime(used, (0, 0))
+        self.clean()
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(used))
+
+    def test_unrelated_files_are_kept(self):
+        '''Файлы вне каталогов постов и миниатюр не проверяются.'''
+        kept = [
+            self.make_file('avatars', 'user.gif'),
+            self.make_file('manual.gif'),
+        ]
+        self.clean()
+        for path in kept:
+            self.assertTrue(os.path.exists(path))
+
+    def test_orphan_thumbnail_is_removed(self):
+        thumbnail = self.make_file('cache', 'ab', 'cd', 'orphan.jpg')
+        self.clean()
+        self.assertFalse(os.path.exists(thumbnail))
+
+    def test_limit_resumes_from_checkpoint(self):
+        '''Обход с --limit продолжается со следующего файла.'''
+        first = self.make_file('posts', 'a.gif')
+        second = self.make_file('posts', 'b.gif')
+        self.clean(limit=1)
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+        with open(self.checkpoint) as file:
+            self.assertEqual(file.read(), 'posts/a.gif')
+        self.clean()
+        self.assertFalse(os.path.exists(second))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+
+class DecayTrendingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.state = os.path.join(directory, 'decay_trending')
+        user = User.objects.create(username='HasNoName')
+        self.post = Post.objects.create(
+            author=user, text='Пост', trend_score=4
+        )
+        self.faded = Post.objects.create(
+            author=user, text='Пост', trend_score=0.01
+        )
+
+    def decay(self, **options):
+        call_command(
+            'decay_trending', half_life=60, state=self.state,
+            stdout=StringIO(), **options
+        )
+        self.post.refresh_from_db()
+        return self.post.trend_score
+
+    def test_decay_trending(self):
+        '''За период полураспада популярность падает вдвое.'''
+        self.assertEqual(self.decay(interval=60), 2)
+        self.faded.refresh_from_db()
+        self.assertEqual(self.faded.trend_score, 0)
+        self.assertTrue(os.path.exists(self.state))
+
+    def test_factor_follows_elapsed_time(self):
+        '''Множитель считается по времени с прошлого запуска.'''
+        with open(self.state, 'w') as file:
+            file.write(str(time.time() - 120 * 60))
+        self.assertAlmostEqual(self.decay(interval=10), 1, places=3)
+        # Повторный запуск сразу же почти ничего не меняет.
+        self.assertAlmostEqual(self.decay(interval=10), 1, places=3)
+
+
+class SuggestAuthorsTests(TestCase):
+    def test_suggest_authors(self):
+        '''Рекомендуются авторы, которых читают вместе с подписками.'''
+        reader, other, another, *authors = (
+            User.objects.create(username=name)
+            for name in ('reader', 'other', 'another', 'a', 'b', 'c')
+        )
+        first, second, third = authors
+        for user, followed in (
+            (reader, (first, second)),
+            (other, (first, second, third)),
+            (another, (second, third)),
+        ):
+            for author in followed:
+                Follow.objects.create(user=user, author=author)
+        call_command('suggest_authors', stdout=StringIO())
+        self.assertEqual(
+            list(FollowSuggestion.objects.filter(user=reader).values_list(
+                'author', 'score'
+            )),
+            [(third.id, 3)]
+        )
+        self.assertFalse(FollowSuggestion.objects.filter(user=other).exists())
+
+        client = Client()
+        client.force_login(reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [suggestion.author for suggestion in response.context[
+                'suggestions'
+            ]],
+            [third]
+        )
+        client.get(reverse('posts:profile_follow', args=(third.username,)))
+        self.assertFalse(
+            FollowSuggestion.objects.filter(user=reader).exists()
+        )
+
+
+class BackfillTagsTests(TestCase):
+    def test_backfill_tags(self):
+        '''Теги старых постов разбираются пачками, повтор не дублирует.'''
+        user = User.objects.create(username='HasNoName')
+        Post.objects.bulk_create(
+            Post(author=user, text=f'#Старый пост #номер{index % 2}')
+            for index in range(5)
+        )
+        for _ in range(2):
+            call_command('backfill_tags', batch_size=2, stdout=StringIO())
+        self.assertEqual(
+            dict(Tag.objects.values_list('name', 'post_count')),
+            {'старый': 5, 'номер0': 3, 'номер1': 2}
+        )
+
+
+class RelatedPostsTests(TestCase):
+    def setUp(self):
+        self.index = os.path.join(
+            tempfile.mkdtemp(dir=settings.BASE_DIR), 'related.npz'
+        )
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.index))
+        self.user = User.objects.create(username='HasNoName')
+
+    def related(self, post):
+        return list(RelatedPost.objects.filter(post=post).values_list(
+            'related', flat=True
+        ))
+
+    def test_related_posts(self):
+        '''Похожими считаются посты на ту же тему, новые добавляются.'''
+        cactus, violet, *others = (
+            Post.objects.create(author=self.user, text=text)
+            for text in (
+                'Кактусы любят солнце и редкий полив',
+                'Фиалки боятся прямого солнца',
+                'Ремонт велосипеда: смазка цепи',
+                'Настройка переключателя велосипеда',
+            )
+        )
+        call_command('related_posts', index=self.index, stdout=StringIO())
+        self.assertEqual(self.related(others[0])[0], others[1].id)
+
+        new = Post.objects.create(
+            author=self.user, text='Кактусы цветут, если полив редкий'
+        )
+        call_command('related_posts', index=self.index, stdout=StringIO())
+        self.assertEqual(self.related(new)[0], cactus.id)
+        self.assertEqual(self.related(cactus)[0], new.id)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': new.id})
+        )
+        self.assertEqual(
+            response.context['related_posts'][0].related, cactus
+        )
+
+
+class BackfillTextHashesTests(TestCase):
+    def test_backfill_text_hashes(self):
+        '''Хеши считаются для длинных текстов постов и комментариев.'''
+        user = User.objects.create(username='HasNoName')
+        post = Post.objects.create(
+            author=user, text='Достаточно длинный текст поста для хеша'
+        )
+        Post.objects.create(author=user, text='Коротко')
+        Comment.objects.create(
+            author=user, post=post,
+            text='И достаточно длинный текст комментария тоже'
+        )
+        for _ in range(2):
+            call_command(
+                'backfill_text_hashes', batch_size=1, stdout=StringIO()
+            )
+        self.assertEqual(TextHash.objects.filter(post=post).count(), 1)
+        self.assertEqual(
+            TextHash.objects.filter(comment__isnull=False).count(), 1
+        )
+        self.assertEqual(TextHash.objects.count(), 2)
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'dump.jsonl')
+
+    def test_export_and_import(self):
+        '''Импорт сдвигает id за занятые и сохраняет ссылки и даты.'''
+        author = User.objects.create(username='author')
+        reader = User.objects.create(username='reader')
+        group = Group.objects.create(
+            title='Группа', slug='old-group', description='Описание'
+        )
+        post = Post.objects.create(author=author, group=group, text='#пост')
+        Comment.objects.create(author=reader, post=post, text='Комментарий')
+        Follow.objects.create(user=reader, author=author)
+        pub_date = post.pub_date
+        call_command('export_yatube', self.path, stdout=StringIO())
+        for model in (User, Group):
+            model.objects.all().delete()
+        Group.objects.create(title='Занятая', slug='taken', description='')
+
+        for _ in range(2):
+            call_command(
+                'import_yatube', self.path, batch_size=2, stdout=StringIO()
+            )
+        post = Post.objects.get()
+        self.assertEqual(post.group.slug, 'old-group')
+        self.assertEqual(post.author.username, 'author')
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.comments.get().author.username, 'reader')
+        self.assertTrue(Follow.objects.filter(
+            user__username='reader', author__username='author'
+        ).exists())
+        self.assertEqual(post.group.stats.post_count, 1)
+        self.assertEqual(Tag.objects.get().post_count, 1)
+
+    def test_import_reserves_ids(self):
+        '''Новые строки сайта во время импорта не занимают его id.'''
+        User.objects.create(username='author')
+        offsets = transfer.current_offsets()
+        last = transfer.last_pks([{'model': 'user', 'pk': 50}])
+        self.assertEqual(transfer.reserve_ids(offsets, last), [])
+        live = User.objects.create(username='live')
+        self.assertGreater(live.pk, offsets['user'] + last['user'])
+
+    def test_import_resumes_after_committed_batch(self):
+        '''Пачка, записанная до сохранения состояния, не пишется снова.'''
+        author = User.objects.create(username='author')
+        Post.objects.create(author=author, text='Пост')
+        call_command('export_yatube', self.path, stdout=StringIO())
+        User.objects.all().delete()
+        state_path = f'{self.path}.state'
+        call_command('import_yatube', self.path, stdout=StringIO())
+        with open(state_path, encoding='utf-8') as file:
+            state = json.load(file)
+        state['pending'] = {
+            'line': state['line'], 'model': 'user',
+            'pk': User.objects.get().pk,
+        }
+        state['line'] = 0
+        with open(state_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        call_command('import_yatube', self.path, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_import_reports_taken_keys(self):
+        '''Занятые имена и slug перечисляются до записи первой строки.'''
+        author = User.objects.create(username='author')
+        group = Group.objects.create(
+            title='Группа', slug='old-group', description='Описание'
+        )
+        Post.objects.create(author=author, group=group, text='Пост')
+        call_command('export_yatube', self.path, stdout=StringIO())
+        Post.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, 'user: author'):
+            call_command('import_yatube', self.path, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertFalse(Post.objects.exists())
+
+
+class SendDigestTests(TestCase):
+    def test_batch_larger_than_fragment_cache(self):
+        '''Пачка больше кеша фрагментов читает посты одним запросом.'''
+        author = User.objects.create(username='author')
+        post_ids = [
+            Post.objects.create(author=author, text=f'Пост {index}').pk
+            for index in range(3)
+        ]
+        renderer = Renderer(limit=1)
+        with self.assertNumQueries(1):
+            fragments = renderer.batch_fragments(post_ids)
+        self.assertEqual(sorted(fragments), post_ids)
+        self.assertEqual(len(renderer.fragments), 1)
+
+    def test_digest_groups_period_posts_per_follower(self):
+        '''Сводка содержит посты авторов за период по порядку и повторяется.'''
+        reader = User.objects.create(username='reader', email='r@example.com')
+        User.objects.create(username='lonely', email='l@example.com')
+        authors = [
+            User.objects.create(username=f'author{index}')
+            for index in range(2)
+        ]
+        for author in authors:
+            Follow.objects.create(user=reader, author=author)
+        until = dt.date(2022, 3, 10)
+        for text, author, day, hour in (
+            ('Вечерний пост', authors[0], 9, 20),
+            ('Утренний пост', authors[1], 9, 8),
+            ('Старый пост', authors[0], 1, 12),
+        ):
+            post = Post.objects.create(author=author, text=text)
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=post.pub_date.replace(2022, 3, day, hour)
+            )
+        for _ in range(2):
+            call_command(
+                'send_digest', until=until.isoformat(), stdout=StringIO()
+            )
+        first, second = mail.outbox
+        self.assertEqual(first.to, ['r@example.com'])
+        self.assertEqual(first.body, second.body)
+        self.assertLess(
+            first.body.index('Утренний пост'),
+            first.body.index('Вечерний пост')
+        )
+        self.assertEqual(first.body.count('Вечерний пост'), 1)
+        self.assertNotIn('Старый пост', first.body)
@@ -0,0 +1,50 @@
+from io import BytesIO
+
+from django.test import TestCase
+from PIL import Image
+
+from ..hashing import dhash, hamming
+from ..images import find_similar_images, make_image_hash
+from ..models import Post, User
+
+
+def gradient(size):
+    '''Картинка с диагональным градиентом заданного размера.'''
+    image = Image.new('L', size)
+    width, height = size
+    image.putdata([
+        (x * 255 // width + y * 128 // height) % 256
+        for y in range(height) for x in range(width)
+    ])
+    file = BytesIO()
+    image.save(file, 'PNG')
+    file.seek(0)
+    return file
+
+
+class ImageHashTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='HasNoName')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Пост {index}') for index in range(3)
+        )
+        cls.posts = list(Post.objects.order_by('pk'))
+
+    def test_dhash_survives_resize(self):
+        '''Уменьшенная копия картинки почти не меняет хеш.'''
+        original = dhash(gradient((320, 240)))
+        resized = dhash(gradient((160, 120)))
+        self.assertLessEqual(hamming(original, resized), 4)
+
+    def test_find_similar_images(self):
+        '''Находятся только хеши в пределах заданного расстояния.'''
+        value = 0xF0F0F0F0F0F0F0F0
+        hashes = (value, value ^ 0b101, value ^ 0xFFFF)
+        for post, other in zip(self.posts, hashes):
+            make_image_hash(post.pk, other).save()
+        similar = find_similar_images(
+            value, distance=4, exclude=self.posts[0].pk
+        )
+        self.assertEqual(similar, [(self.posts[1].pk, 2)])
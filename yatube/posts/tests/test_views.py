@@ -1,11 +1,27 @@
-from django.test import Client, TestCase
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django import forms
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Post, Group, Comment, Follow, User
+from core.models import Job
+from .. import counters, spam
+from ..autocomplete import INDEXES, PrefixIndex
+from ..groups import refresh_group_stats
+from ..models import (
+    ArchiveMonth, Post, Group, GroupStats, Comment, Follow, Notification,
+    Tag, TextHash, User
+)
 
 
 LIMIT_ELEMENT = 10
+COMMENTS_LIMIT = 20
 SECOND_LIMIT_ELEMENT = 3
 NUMBER_OF_POSTS = 13
 
@@ -168,6 +184,46 @@ class PostPagesTests(TestCase):
             Comment.objects.filter(text='Тестовый комментарий').exists()
         )
 
+    def test_ajax_comment_returns_fragment(self):
+        '''Запрос скрипта получает разметку комментария, а не редирект.'''
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.id})
+        response = self.authorized_client.post(
+            url, data={'text': 'Комментарий скриптом'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('Комментарий скриптом', response.json()['html'])
+        self.assertNotIn('<html', response.json()['html'])
+        response = self.authorized_client.post(
+            url, data={'text': ''}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['errors'])
+
+    def test_comments_are_paged_by_cursor(self):
+        '''Первая страница комментариев в посте, дальше - фрагменты.'''
+        comments = Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text=f'Комментарий {i}')
+            for i in range(COMMENTS_LIMIT + 5)
+        )
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        self.assertEqual(len(response.context['comments']), COMMENTS_LIMIT)
+        next_urls = response.context['comments_next']
+        self.assertContains(response, next_urls['page'])
+        data = self.guest_client.get(next_urls['fragment']).json()
+        self.assertIsNone(data['next'])
+        self.assertEqual(data['html'].count('media-body'), 5)
+        shown = response.context['comments'] + list(
+            self.guest_client.get(next_urls['page']).context['comments']
+        )
+        self.assertEqual(
+            sorted(comment.pk for comment in shown),
+            sorted(Comment.objects.values_list('pk', flat=True))
+        )
+        self.assertEqual(len(shown), len(comments))
+
     def test_check_cache(self):
         '''Проверка работы кеша.'''
         response = self.guest_client.get(reverse('posts:index'))
@@ -236,3 +292,673 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(len(
             response.context['page_obj']
         ), SECOND_LIMIT_ELEMENT)
+
+
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пишем про кактусы и <b>другие</b> растения',
+        )
+        cls.other_post = Post.objects.create(
+            author=cls.user,
+            text='Совсем другая тема',
+        )
+        cls.comment = Comment.objects.create(
+            author=cls.user,
+            post=cls.other_post,
+            text='А у меня дома тоже растут кактусы',
+        )
+
+    def test_search_finds_posts_and_comments(self):
+        '''Поиск находит и посты, и комментарии, подсвечивая слово.'''
+        response = self.client.get(reverse('posts:search'), {'q': 'кактус'})
+        results = response.context['results']
+        self.assertEqual(
+            {post for post, hit in results}, {self.post, self.other_post}
+        )
+        hits = {hit.comment_id: hit for post, hit in results}
+        self.assertIn(self.comment.id, hits)
+        self.assertIn('<mark>кактусы</mark>', hits[None].snippet)
+        self.assertIn('&lt;b&gt;', hits[None].snippet)
+
+    def test_search_index_follows_edits(self):
+        '''Изменённый и удалённый текст пропадает из выдачи.'''
+        self.post.text = 'Теперь про фиалки'
+        self.post.save()
+        self.comment.delete()
+        response = self.client.get(reverse('posts:search'), {'q': 'кактусы'})
+        self.assertEqual(response.context['results'], [])
+
+    def test_search_cursor_pagination(self):
+        '''Курсор ведёт на следующую страницу без повторов.'''
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Кактус номер {index}')
+            for index in range(LIMIT_ELEMENT + SECOND_LIMIT_ELEMENT)
+        )
+        url = reverse('posts:search')
+        first = self.client.get(url, {'q': 'кактус'}).context
+        second = self.client.get(
+            url, {'q': 'кактус', 'after': first['next_cursor']}
+        ).context
+        self.assertEqual(len(first['results']), LIMIT_ELEMENT)
+        self.assertEqual(second['next_cursor'], '')
+        seen = [hit.rowid for post, hit in first['results']]
+        seen += [hit.rowid for post, hit in second['results']]
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), LIMIT_ELEMENT + SECOND_LIMIT_ELEMENT + 2)
+
+
+class TrendingViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.quiet_post = Post.objects.create(author=cls.user, text='Тишина')
+        cls.calm_post = Post.objects.create(author=cls.user, text='Спокойно')
+        cls.hot_post = Post.objects.create(author=cls.user, text='Обсуждаем')
+
+    def test_comments_raise_trend_score(self):
+        '''Популярные посты упорядочены по числу свежих комментариев.'''
+        for post, count in ((self.hot_post, 3), (self.calm_post, 1)):
+            for index in range(count):
+                Comment.objects.create(
+                    author=self.user, post=post, text=f'Комментарий {index}'
+                )
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [self.hot_post, self.calm_post]
+        )
+        self.hot_post.refresh_from_db()
+        self.assertEqual(self.hot_post.trend_score, 3)
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600)
+class ViewCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.calm_post = Post.objects.create(author=cls.user, text='Спокойно')
+        cls.hot_post = Post.objects.create(author=cls.user, text='Обсуждаем')
+
+    def setUp(self):
+        counters.take_pending()
+
+    def view(self, post, times=1):
+        for _ in range(times):
+            self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.id})
+            )
+
+    def test_views_are_flushed_in_one_update(self):
+        '''Просмотры видны в базе и в списке только после сброса.'''
+        self.view(self.hot_post, 3)
+        self.view(self.calm_post)
+        response = self.client.get(reverse('posts:most_viewed'))
+        self.assertEqual(list(response.context['page_obj']), [])
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.flush(), 2)
+        response = self.client.get(reverse('posts:most_viewed'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [self.hot_post, self.calm_post]
+        )
+        self.assertEqual(response.context['page_obj'][0].view_count, 3)
+
+    @override_settings(VIEW_COUNT_BUFFER_SIZE=2)
+    def test_full_buffer_is_flushed(self):
+        self.view(self.hot_post)
+        self.view(self.calm_post)
+        self.view(self.hot_post)
+        self.assertEqual(
+            dict(Post.objects.values_list('pk', 'view_count')),
+            {self.hot_post.pk: 1, self.calm_post.pk: 1}
+        )
+
+    @override_settings(VIEW_COUNT_FLUSH_THREAD=True)
+    def test_flush_thread_starts_once_per_process(self):
+        '''Поток сброса запускается первым просмотром и один раз.'''
+        with mock.patch.object(counters, '_flusher_pid', None), \
+                mock.patch.object(counters.threading, 'Thread') as thread:
+            self.view(self.hot_post, 2)
+        thread.assert_called_once_with(
+            target=counters.flush_periodically, name='view-counts',
+            daemon=True
+        )
+        thread.return_value.start.assert_called_once_with()
+
+    def test_buffer_of_other_database_is_dropped(self):
+        '''Просмотры, накопленные для другой базы, не сбрасываются.'''
+        self.view(self.hot_post)
+        with mock.patch.object(counters, '_database', 'other.sqlite3'):
+            self.assertEqual(counters.flush(), 0)
+        self.assertEqual(counters.flush(), 0)
+        self.hot_post.refresh_from_db()
+        self.assertEqual(self.hot_post.view_count, 0)
+
+
+class GroupIndexViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.another_user = User.objects.create(username='AnotherUser')
+        cls.busy_group = Group.objects.create(
+            title='Шумная группа', slug='busy', description='Много постов'
+        )
+        cls.quiet_group = Group.objects.create(
+            title='Тихая группа', slug='quiet', description='Мало постов'
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        for user in (self.user, self.another_user):
+            Post.objects.create(
+                author=user, text='Тестовый пост', group=self.busy_group
+            )
+        self.post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.quiet_group
+        )
+
+    def stats(self):
+        return {
+            stats.group_id: (
+                stats.post_count, stats.last_post_date, stats.active_authors
+            )
+            for stats in GroupStats.objects.all()
+        }
+
+    def test_group_index_ordering(self):
+        '''Каталог групп сортируется по колонкам сводки.'''
+        url = reverse('posts:group_index')
+        by_posts = self.client.get(url).context['page_obj']
+        self.assertEqual(
+            [stats.group for stats in by_posts],
+            [self.busy_group, self.quiet_group]
+        )
+        by_last = self.client.get(url, {'sort': 'last'}).context['page_obj']
+        self.assertEqual(
+            [stats.group for stats in by_last],
+            [self.quiet_group, self.busy_group]
+        )
+
+    def test_group_stats_follow_edit_and_delete(self):
+        '''Сводка совпадает с полным пересчётом после правок постов.'''
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': 'Перенесённый пост', 'group': self.busy_group.id},
+        )
+        Post.objects.filter(author=self.another_user).delete()
+        # Число активных авторов пересчитывается задачей из очереди.
+        call_command('run_jobs', once=True, stdout=StringIO())
+        maintained = self.stats()
+        self.assertEqual(maintained[self.busy_group.id][0], 2)
+        self.assertEqual(maintained[self.busy_group.id][2], 1)
+        self.assertEqual(maintained[self.quiet_group.id], (0, None, 0))
+        refresh_group_stats()
+        self.assertEqual(self.stats(), maintained)
+
+    def test_active_authors_are_counted_in_background(self):
+        '''Новые посты группы ставят в очередь один пересчёт.'''
+        Job.objects.all().delete()
+        for _ in range(2):
+            Post.objects.create(
+                author=self.user, text='Ещё пост', group=self.busy_group
+            )
+        self.assertEqual(
+            list(Job.objects.values_list('dedup_key', flat=True)),
+            [f'active-authors:{self.busy_group.id}']
+        )
+
+
+class TagViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, text):
+        self.authorized_client.post(
+            reverse('posts:post_create'), data={'text': text}
+        )
+        return Post.objects.latest('pk')
+
+    def counts(self):
+        return dict(Tag.objects.values_list('name', 'post_count'))
+
+    def test_tags_follow_create_edit_and_delete(self):
+        '''Теги разбираются при сохранении, сводка сдвигается на единицу.'''
+        post = self.create_post('Про #Django и #python')
+        other = self.create_post('Снова #django, а тут не тег: a#b')
+        self.assertEqual(self.counts(), {'django': 2, 'python': 1})
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={'text': 'Только #python и #новое'},
+        )
+        self.assertEqual(
+            self.counts(), {'django': 1, 'python': 1, 'новое': 1}
+        )
+        other.delete()
+        self.assertEqual(
+            self.counts(), {'django': 0, 'python': 1, 'новое': 1}
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id})
+        )
+        self.assertContains(
+            response,
+            f'<a href="{reverse("posts:tag", args=("python",))}">#python</a>'
+        )
+
+    def test_tag_cursor_pagination(self):
+        '''Курсор ведёт на следующую страницу ленты тега без повторов.'''
+        posts = [
+            self.create_post(f'Пост {index} #лента')
+            for index in range(LIMIT_ELEMENT + SECOND_LIMIT_ELEMENT)
+        ]
+        url = reverse('posts:tag', args=('Лента',))
+        first = self.client.get(url).context
+        second = self.client.get(
+            url, {'after': first['next_cursor']}
+        ).context
+        self.assertEqual(second['next_cursor'], '')
+        self.assertEqual(
+            first['posts'] + second['posts'], posts[::-1]
+        )
+
+
+class AutocompleteViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.group = Group.objects.create(
+            title='Кактусоводы', slug='cactus', description='Про кактусы'
+        )
+        cls.other_group = Group.objects.create(
+            title='Фиалки', slug='violets', description='Про фиалки'
+        )
+
+    def setUp(self):
+        for index in INDEXES.values():
+            index.build()
+
+    def complete(self, kind, term, client=None):
+        response = (client or self.client).get(
+            reverse('posts:autocomplete', args=(kind,)), {'term': term}
+        )
+        return [item['text'] for item in response.json()['results']]
+
+    def test_autocomplete_prefix(self):
+        '''Подсказки ищутся по началу имени, названия и slug.'''
+        staff = User.objects.create(username='admin', is_staff=True)
+        staff_client = Client()
+        staff_client.force_login(staff)
+        self.assertEqual(
+            self.complete('users', 'stas', staff_client), ['StasBasov']
+        )
+        self.assertEqual(self.complete('groups', 'Кактус'), ['Кактусоводы'])
+        self.assertEqual(self.complete('groups', 'vio'), ['Фиалки'])
+        self.assertEqual(self.complete('groups', ''), [])
+
+    def test_autocomplete_follows_saves(self):
+        '''Индекс обновляется сигналами без полной перестройки.'''
+        self.group.title = 'Суккуленты'
+        self.group.save()
+        self.other_group.delete()
+        self.assertEqual(self.complete('groups', 'сукк'), ['Суккуленты'])
+        self.assertEqual(self.complete('groups', 'кактус'), [])
+        self.assertEqual(self.complete('groups', 'фиал'), [])
+
+    def test_usernames_are_for_staff_only(self):
+        response = self.client.get(
+            reverse('posts:autocomplete', args=('users',)), {'term': 'stas'}
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_changes_during_build_are_kept(self):
+        '''Сигнал во время загрузки не теряется при замене индекса.'''
+        def load():
+            yield 1, 'Старое', 'старое'
+            index.update(2, 'Новое', 'новое')
+            index.remove(1)
+
+        index = PrefixIndex(load)
+        index.build()
+        self.assertEqual(index.search('н'), [(2, 'Новое')])
+        self.assertEqual(index.search('с'), [])
+
+    def test_group_select_renders_selected_only(self):
+        '''В выпадающий список попадает только выбранная группа.'''
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(
+            reverse('posts:post_edit', kwargs={'post_id': post.id})
+        )
+        self.assertContains(response, 'Кактусоводы')
+        self.assertNotContains(response, 'Фиалки')
+
+
+class DuplicateTextTests(TestCase):
+    SPAM = (
+        'Лучшие скидки на кактусы только сегодня, переходите по ссылке '
+        'и покупайте горшки со скидкой пятьдесят процентов, доставка '
+        'бесплатно по всей стране'
+    )
+    EDITED = SPAM.replace('сегодня,', 'завтра!!!')
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, text):
+        return self.authorized_client.post(
+            reverse('posts:post_create'), data={'text': text}
+        )
+
+    @override_settings(SPAM_TEXT_ACTION='reject')
+    def test_reject_near_duplicates(self):
+        '''Почти повторяющийся текст поста и комментария отклоняется.'''
+        self.create_post(self.SPAM)
+        response = self.create_post(self.EDITED)
+        self.assertFormError(response, 'form', 'text', spam.REJECT_MESSAGE)
+        response = self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': self.EDITED}, follow=True
+        )
+        self.assertContains(response, spam.REJECT_MESSAGE)
+        self.assertEqual(Post.objects.filter(text=self.EDITED).count(), 0)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_flag_near_duplicates(self):
+        '''По умолчанию повтор публикуется, но помечается.'''
+        self.create_post(self.SPAM)
+        self.create_post(self.EDITED)
+        self.assertEqual(
+            list(TextHash.objects.order_by('pk').values_list(
+                'is_duplicate', flat=True
+            )),
+            [False, True]
+        )
+
+    @override_settings(SPAM_TEXT_ACTION='rate-limit', SPAM_TEXT_RATE=(1, 60))
+    def test_rate_limit_near_duplicates(self):
+        '''Повторы сверх лимита за период отклоняются.'''
+        for text in (self.SPAM, self.EDITED, self.EDITED):
+            self.create_post(text)
+        self.assertEqual(
+            Post.objects.filter(text__startswith='Лучшие').count(), 2
+        )
+
+
+class ArchiveViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Вторая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def counts(self):
+        return {
+            (row.scope, row.scope_id): row.post_count
+            for row in ArchiveMonth.objects.all()
+        }
+
+    def test_rollup_follows_create_move_and_delete(self):
+        '''Сводка по месяцам сдвигается при создании, переносе и удалении.'''
+        post = Post.objects.create(
+            text='Тестовый пост', author=self.user, group=self.group
+        )
+        Post.objects.create(text='Без группы', author=self.user)
+        self.assertEqual(self.counts(), {
+            ('all', 0): 2,
+            ('author', self.user.pk): 2,
+            ('group', self.group.pk): 1,
+        })
+        authorized_client = Client()
+        authorized_client.force_login(self.user)
+        authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={'text': post.text, 'group': self.other_group.pk},
+        )
+        post.refresh_from_db()
+        post.delete()
+        self.assertEqual(self.counts(), {
+            ('all', 0): 1,
+            ('author', self.user.pk): 1,
+            ('group', self.group.pk): 0,
+            ('group', self.other_group.pk): 0,
+        })
+
+    def test_month_keyset_pagination(self):
+        '''Посты месяца листаются курсором без повторов.'''
+        posts = [
+            Post.objects.create(
+                text=f'Пост {index}', author=self.user, group=self.group
+            )
+            for index in range(LIMIT_ELEMENT + SECOND_LIMIT_ELEMENT)
+        ]
+        month = ArchiveMonth.objects.get(scope='group')
+        url = reverse(
+            'posts:group_archive',
+            args=(self.group.slug, month.year, month.month)
+        )
+        first = self.client.get(url).context
+        second = self.client.get(
+            url, {'after': first['next_cursor']}
+        ).context
+        self.assertEqual(second['next_cursor'], '')
+        self.assertEqual(first['posts'] + second['posts'], posts[::-1])
+        self.assertEqual(
+            first['months'][0]['post_count'], len(posts)
+        )
+        self.assertTrue(first['months'][0]['active'])
+        for year, number in ((month.year, 13), (0, 1), (9999, 12),
+                             (10000, 1)):
+            invalid = reverse('posts:archive', args=(year, number))
+            self.assertEqual(self.client.get(invalid).status_code, 404)
+        valid = reverse('posts:archive', args=(1, 1))
+        self.assertEqual(self.client.get(valid).status_code, 200)
+
+
+@override_settings(JOBS_BACKEND='database')
+class NotificationTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        for name, email in (
+            ('reader', 'reader@example.com'),
+            ('other', 'other@example.com'),
+            ('noemail', ''),
+        ):
+            Follow.objects.create(
+                user=User.objects.create(username=name, email=email),
+                author=cls.author
+            )
+
+    def test_posts_are_coalesced_per_follower(self):
+        '''Посты, вышедшие до рассылки, приходят подписчику одним письмом.'''
+        client = Client()
+        client.force_login(self.author)
+        for text in ('Первый пост', 'Второй пост'):
+            client.post(reverse('posts:post_create'), data={'text': text})
+        call_command('run_jobs', once=True, stdout=StringIO())
+        self.assertEqual(Notification.objects.count(), 4)
+        self.assertEqual(len(mail.outbox), 0)
+
+        Job.objects.update(run_at=F('created'))
+        call_command('run_jobs', once=True, stdout=StringIO())
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['other@example.com', 'reader@example.com']
+        )
+        body = mail.outbox[0].body
+        self.assertLess(body.index('Первый пост'), body.index('Второй пост'))
+        self.assertFalse(Notification.objects.exists())
+
+
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def comment(self, text, reply_to=None):
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': text, 'reply_to': reply_to or ''},
+        )
+        return Comment.objects.latest('pk')
+
+    def test_replies_follow_their_thread(self):
+        '''Ответы идут под родителем, ветки - новые первыми.'''
+        first = self.comment('Первая ветка')
+        reply = self.comment('Ответ', first.pk)
+        deep = self.comment('Ответ на ответ', reply.pk)
+        second = self.comment('Вторая ветка')
+        late = self.comment('Поздний ответ', first.pk)
+        self.assertEqual(
+            (deep.parent, deep.depth, deep.path[:len(first.path)]),
+            (reply, 2, first.path)
+        )
+        first.refresh_from_db()
+        self.assertEqual(first.reply_count, 3)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        self.assertEqual(
+            response.context['comments'], [second, first, reply, deep, late]
+        )
+
+        reply.delete()
+        first.refresh_from_db()
+        self.assertEqual(first.reply_count, 1)
+        Comment.objects.filter(pk=late.pk).delete()
+        first.refresh_from_db()
+        self.assertEqual(first.reply_count, 0)
+
+    def test_cascades_delete_comments_in_bulk(self):
+        '''Удаление автора правит чужие ветки, удаление поста - ничего.'''
+        root = self.comment('Ветка')
+        guest = User.objects.create(username='guest')
+        self.authorized_client.force_login(guest)
+        reply = self.comment('Ответ гостя', root.pk)
+        self.comment('Ответ на ответ гостя', reply.pk)
+        guest.delete()
+        root.refresh_from_db()
+        self.assertEqual(root.reply_count, 0)
+
+        self.authorized_client.force_login(self.user)
+        self.comment('Ответ', root.pk)
+        with CaptureQueriesContext(connection) as queries:
+            Post.objects.get(pk=self.post.pk).delete()
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "posts_comment"')
+        ])
+
+    def test_pages_count_only_threads(self):
+        '''Страница комментариев содержит COMMENTS_LIMIT веток с ответами.'''
+        roots = [
+            self.comment(f'Ветка {index}') for index in range(COMMENTS_LIMIT)
+        ]
+        self.comment('Ответ', roots[0].pk)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        self.assertEqual(len(response.context['comments']), COMMENTS_LIMIT + 1)
+        self.assertEqual(response.context['comments_next'], {})
+
+
+class FollowEndpointTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create(username='StasBasov')
+        cls.authors = [
+            User.objects.create(username=f'author{index}')
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_follow_and_unfollow_are_idempotent(self):
+        '''Повторные запросы не дублируют подписку и не падают.'''
+        author = self.authors[0]
+        for name, following in (
+            ('posts:profile_follow', True),
+            ('posts:profile_follow', True),
+            ('posts:profile_unfollow', False),
+            ('posts:profile_unfollow', False),
+        ):
+            response = self.authorized_client.post(
+                reverse(name, args=(author.username,))
+            )
+            self.assertEqual(
+                response.json(),
+                {'username': author.username, 'following': following}
+            )
+            self.assertEqual(
+                Follow.objects.filter(user=self.user).count(), int(following)
+            )
+
+    def test_self_follow_is_ignored(self):
+        response = self.authorized_client.post(
+            reverse('posts:profile_follow', args=(self.user.username,))
+        )
+        self.assertFalse(response.json()['following'])
+        self.assertFalse(Follow.objects.exists())
+
+    def test_bulk_follow(self):
+        '''Массовая подписка пропускает себя, чужие имена и повторы.'''
+        Follow.objects.create(user=self.user, author=self.authors[0])
+        response = self.authorized_client.post(
+            reverse('posts:bulk_follow'),
+            data={'username': [
+                *(author.username for author in self.authors),
+                self.user.username, 'nobody',
+            ]},
+        )
+        self.assertEqual(response.json(), {'following': 3})
+        self.assertEqual(
+            set(Follow.objects.values_list('author', flat=True)),
+            {author.pk for author in self.authors}
+        )
@@ -0,0 +1,171 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+)
+from django.db.models.functions import Coalesce, Concat
+
+from .models import Comment
+from .utils import date_keyset_page, keyset_batches
+
+
+# Путь комментария - id его предков и его собственный, каждый в STEP
+# символах base36 с ведущими нулями. Сортировка по пути выдаёт ветку
+# в порядке показа: ответы сразу под родителем, по времени создания.
+STEP = 7
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+# Больше любого символа пути: [path, path + END) - всё поддерево.
+END = '~'
+# Глубже ответы становятся соседями родителя, чтобы ветка не уезжала
+# за край экрана.
+MAX_DEPTH = 8
+BATCH_SIZE = 1000
+# Каждая строка CASE занимает два параметра запроса и ещё один IN.
+UPDATE_BATCH_SIZE = 300
+
+
+def encode_step(pk):
+    digits = []
+    while pk:
+        pk, digit = divmod(pk, 36)
+        digits.append(DIGITS[digit])
+    return ''.join(reversed(digits)).rjust(STEP, '0')
+
+
+def ancestor_ids(path):
+    return [
+        int(path[start:start + STEP], 36)
+        for start in range(0, len(path) - STEP, STEP)
+    ]
+
+
+def reply_parent(comment):
+    '''Куда на самом деле прикрепить ответ на comment с учётом MAX_DEPTH.'''
+    while comment is not None and comment.depth >= MAX_DEPTH:
+        comment = comment.parent
+    return comment
+
+
+def place_comment(comment):
+    '''Записать путь и глубину нового комментария, счётчики предков.
+
+    Путь включает id, поэтому пишется после вставки строки.
+    '''
+    parent = comment.parent
+    prefix = parent.path if parent is not None else ''
+    comment.path = prefix + encode_step(comment.pk)
+    comment.depth = parent.depth + 1 if parent is not None else 0
+    with transaction.atomic():
+        Comment.objects.filter(pk=comment.pk).update(
+            path=comment.path, depth=comment.depth
+        )
+        ancestors = ancestor_ids(comment.path)
+        if ancestors:
+            Comment.objects.filter(pk__in=ancestors).update(
+                reply_count=F('reply_count') + 1
+            )
+
+
+def forget_comments(comments):
+    '''Уменьшить счётчики уцелевших предков удаляемых комментариев.
+
+    Ответы на comments удалятся каскадом. Верхний из удаляемых уносит
+    из веток своих предков 1 + reply_count комментариев, вложенные
+    в него уже учтены. Читаются только пути, счётчики меняются одним
+    UPDATE ... CASE на пачку предков.
+    '''
+    removed = Counter()
+    top = None
+    for path, reply_count in comments.order_by('path').values_list(
+        'path', 'reply_count'
+    ):
+        if top is not None and path.startswith(top):
+            continue
+        top = path
+        for pk in ancestor_ids(path):
+            removed[pk] += 1 + reply_count
+    ancestors = list(removed)
+    for start in range(0, len(ancestors), UPDATE_BATCH_SIZE):
+        batch = ancestors[start:start + UPDATE_BATCH_SIZE]
+        Comment.objects.filter(pk__in=batch).update(
+            reply_count=F('reply_count') - Case(
+                *(When(pk=pk, then=Value(removed[pk])) for pk in batch),
+                output_field=IntegerField()
+            )
+        )
+
+
+def subtree(comment):
+    '''Комментарий и все ответы под ним одним запросом по индексу пути.'''
+    return Comment.objects.filter(
+        post_id=comment.post_id,
+        path__gte=comment.path,
+        path__lt=comment.path + END,
+    ).order_by('path')
+
+
+def thread_page(post_id, after, limit):
+    '''Страница веток: корневые комментарии, новые первыми, с ответами.
+
+    Корни листаются курсором (pub_date, pk), затем ответы всех веток
+    страницы читаются одним запросом по диапазону путей каждого корня:
+    после импорта порядок id и дат расходится, и общий диапазон от
+    первого до последнего корня захватил бы ветки других страниц.
+    Возвращает плоский список в порядке показа и курсор следующей
+    страницы.
+    '''
+    roots, next_cursor = date_keyset_page(
+        Comment.objects.filter(post_id=post_id, depth=0)
+        .select_related('author'),
+        after, limit
+    )
+    if not roots:
+        return [], next_cursor
+    threads = {root.pk: [root] for root in roots}
+    ranges = Q()
+    for root in roots:
+        ranges |= Q(path__gt=root.path, path__lt=root.path + END)
+    replies = Comment.objects.filter(
+        ranges, post_id=post_id, depth__gt=0
+    ).select_related('author').order_by('path')
+    for reply in replies:
+        thread = threads.get(int(reply.path[:STEP], 36))
+        if thread is not None:
+            thread.append(reply)
+    return [
+        comment for root in roots for comment in threads[root.pk]
+    ], next_cursor
+
+
+def rebuild_paths(batch_size=BATCH_SIZE):
+    '''Заполнить пути комментариев без пути и пересчитать ответы.
+
+    Нужен после импорта: строки пишутся в обход сигналов. Родитель
+    всегда старше ответа, поэтому к моменту обработки ответа его путь
+    уже известен.
+    '''
+    pending = Comment.objects.filter(path='')
+    for batch in keyset_batches(pending, batch_size, 'parent'):
+        parents = dict(
+            Comment.objects.filter(
+                pk__in={parent for pk, parent in batch if parent}
+            ).values_list('pk', 'path')
+        )
+        changed = []
+        for pk, parent in batch:
+            prefix = parents.get(parent, '')
+            path = prefix + encode_step(pk)
+            parents[pk] = path
+            changed.append(Comment(
+                pk=pk, path=path, depth=len(path) // STEP - 1
+            ))
+        Comment.objects.bulk_update(changed, ('path', 'depth'))
+    replies = Comment.objects.filter(
+        post_id=OuterRef('post_id'),
+        path__gt=OuterRef('path'),
+        path__lt=Concat(OuterRef('path'), Value(END)),
+    ).order_by().values('post_id').annotate(count=Count('pk')).values('count')
+    return Comment.objects.update(reply_count=Coalesce(
+        Subquery(replies, output_field=IntegerField()), 0
+    ))
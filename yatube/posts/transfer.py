@@ -0,0 +1,208 @@
+import datetime as dt
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import DateTimeField
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Follow, Group, Post, User
+from .utils import insert_sql
+
+
+# Порядок выгрузки и загрузки: строки ссылаются только на модели выше.
+# Права администратора не переносятся, пользователи приходят обычными.
+MODELS = (
+    ('user', User, (
+        'username', 'password', 'email', 'first_name', 'last_name',
+        'is_active', 'date_joined', 'last_login',
+    )),
+    ('group', Group, ('title', 'slug', 'description')),
+    ('post', Post, ('text', 'pub_date', 'author', 'group', 'image')),
+    ('comment', Comment, ('post', 'author', 'text', 'pub_date', 'parent')),
+    ('follow', Follow, ('user', 'author')),
+)
+LABELS = {model: label for label, model, fields in MODELS}
+# Уникальные поля, по которым строки выгрузки могут совпасть с чужими.
+NATURAL_KEYS = (('user', User, 'username'), ('group', Group, 'slug'))
+# Размер списка IN: SQLite принимает не больше 999 параметров.
+KEY_BATCH_SIZE = 500
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    '''Даты с микросекундами.
+
+    DjangoJSONEncoder обрезает их до миллисекунд, и у постов одной
+    секунды поменялся бы порядок в лентах.
+    '''
+
+    def default(self, value):
+        if isinstance(value, dt.datetime):
+            return value.isoformat()
+        return super().default(value)
+
+
+def export_rows(chunk_size):
+    '''Строки всех моделей как JSON, по одной на объект.
+
+    iterator(chunk_size) читает таблицу курсором, не загружая её
+    в память целиком.
+    '''
+    for label, model, fields in MODELS:
+        columns = [model._meta.get_field(name).attname for name in fields]
+        rows = model.objects.order_by('pk').values_list('pk', *columns)
+        for pk, *values in rows.iterator(chunk_size=chunk_size):
+            yield label, json.dumps(
+                {
+                    'model': label,
+                    'pk': pk,
+                    'fields': dict(zip(fields, values)),
+                },
+                cls=ExportEncoder,
+                ensure_ascii=False,
+            )
+
+
+def current_offsets():
+    '''Сдвиги первичных ключей: новые id идут после уже занятых.
+
+    В пустую базу объекты ложатся со своими id, и ссылки между ними
+    пересчитываются прибавлением сдвига без таблицы соответствия.
+    '''
+    offsets = {}
+    for label, model, fields in MODELS:
+        last = model.objects.order_by('-pk').values_list('pk', flat=True)
+        offsets[label] = last.first() or 0
+    return offsets
+
+
+def find_conflicts(records, offsets):
+    '''Имена пользователей и slug групп выгрузки, уже занятые в базе.
+
+    Возвращает {метка модели: отсортированный список значений}.
+    Пользователи и группы идут в выгрузке первыми, поэтому чтение
+    заканчивается на первой строке другой модели. Строка с тем же id,
+    что получила бы при загрузке, записана прерванным запуском этого
+    же импорта и конфликтом не считается.
+    '''
+    fields = {label: field for label, model, field in NATURAL_KEYS}
+    wanted = {label: {} for label in fields}
+    for record in records:
+        label = record['model']
+        if label not in fields:
+            break
+        value = record['fields'][fields[label]]
+        wanted[label][value] = record['pk'] + offsets[label]
+    conflicts = {}
+    for label, model, field in NATURAL_KEYS:
+        values = list(wanted[label])
+        taken = []
+        for start in range(0, len(values), KEY_BATCH_SIZE):
+            rows = model.objects.filter(**{
+                f'{field}__in': values[start:start + KEY_BATCH_SIZE]
+            }).values_list(field, 'pk')
+            taken += [
+                value for value, pk in rows if wanted[label][value] != pk
+            ]
+        if taken:
+            conflicts[label] = sorted(taken)
+    return conflicts
+
+
+def last_pks(records):
+    '''Наибольший id каждой модели в выгрузке.'''
+    last = {label: 0 for label, model, fields in MODELS}
+    for record in records:
+        last[record['model']] = max(last[record['model']], record['pk'])
+    return last
+
+
+def reserve_ids(offsets, last):
+    '''Передвинуть счётчики id за диапазоны, которые займёт импорт.
+
+    Возвращает метки моделей, в диапазон которых новые строки сайта
+    попали раньше, чем счётчик был передвинут.
+    '''
+    taken = []
+    with connection.cursor() as cursor:
+        for label, model, fields in MODELS:
+            end = offsets[label] + last[label]
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    'UPDATE sqlite_sequence SET seq = MAX(seq, %s) '
+                    'WHERE name = %s', [end, table]
+                )
+                if not cursor.rowcount:
+                    cursor.execute(
+                        'INSERT INTO sqlite_sequence (name, seq) '
+                        'VALUES (%s, %s)', [table, end]
+                    )
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT setval(s, GREATEST(%s, nextval(s))) '
+                    'FROM pg_get_serial_sequence(%s, %s) AS s',
+                    [end, table, model._meta.pk.column]
+                )
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    f'ALTER TABLE {connection.ops.quote_name(table)} '
+                    f'AUTO_INCREMENT = {end + 1}'
+                )
+            if model.objects.filter(
+                pk__gt=offsets[label], pk__lte=end
+            ).exists():
+                taken.append(label)
+    return taken
+
+
+class Loader:
+    '''Переводит строки выгрузки в параметры INSERT для executemany.'''
+
+    def __init__(self, offsets):
+        self.offsets = offsets
+        self.specs = {}
+        for label, model, fields in MODELS:
+            # Поля вне выгрузки получают значения по умолчанию: в обход
+            # ORM база их сама не заполнит.
+            columns = [
+                field for field in model._meta.concrete_fields
+                if not field.primary_key
+            ]
+            converters = [
+                (
+                    field,
+                    field.name in fields,
+                    LABELS[field.related_model] if field.is_relation else None,
+                )
+                for field in columns
+            ]
+            sql = insert_sql(
+                model,
+                (model._meta.pk.name, *(field.name for field in columns))
+            )
+            self.specs[label] = (model, sql, converters)
+
+    def row(self, record):
+        label = record['model']
+        model, sql, converters = self.specs[label]
+        values = [record['pk'] + self.offsets[label]]
+        for field, exported, target in converters:
+            if not exported:
+                values.append(field.get_db_prep_save(
+                    field.get_default(), connection
+                ))
+                continue
+            value = record['fields'].get(field.name)
+            if value is not None and target is not None:
+                value += self.offsets[target]
+            elif isinstance(field, DateTimeField) and value is not None:
+                value = parse_datetime(value)
+            values.append(field.get_db_prep_save(value, connection))
+        return values
+
+    def insert(self, cursor, label, rows):
+        '''Записать строки модели, вернуть их число.'''
+        model, sql, converters = self.specs[label]
+        cursor.executemany(sql, rows)
+        return len(rows)
@@ -5,15 +5,51 @@ from . import views
 app_name = 'posts'
 urlpatterns = [
     path('', views.index, name='index'),
+    path('trending/', views.trending, name='trending'),
+    path('most-viewed/', views.most_viewed, name='most_viewed'),
+    path('group/', views.group_index, name='group_index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('search/', views.search, name='search'),
+    path('archive/', views.site_archive, name='archive_index'),
+    path(
+        'archive/<int:year>/<int:month>/', views.site_archive, name='archive'
+    ),
+    path(
+        'group/<slug:slug>/archive/',
+        views.group_archive,
+        name='group_archive_index'
+    ),
+    path(
+        'group/<slug:slug>/archive/<int:year>/<int:month>/',
+        views.group_archive,
+        name='group_archive'
+    ),
+    path(
+        'profile/<str:username>/archive/',
+        views.profile_archive,
+        name='profile_archive_index'
+    ),
+    path(
+        'profile/<str:username>/archive/<int:year>/<int:month>/',
+        views.profile_archive,
+        name='profile_archive'
+    ),
+    path('tags/<str:name>/', views.tag_posts, name='tag'),
+    path(
+        'autocomplete/<str:kind>/', views.autocomplete, name='autocomplete'
+    ),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path(
         'posts/<int:post_id>/comment/', views.add_comment, name='add_comment'
     ),
+    path(
+        'posts/<int:post_id>/comments/', views.comments, name='comments'
+    ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/bulk/', views.bulk_follow, name='bulk_follow'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -0,0 +1,71 @@
+import datetime as dt
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def keyset_batches(queryset, size, *fields):
+    '''Выдавать строки (pk, *fields) пачками, двигаясь по возрастанию pk.
+
+    В отличие от OFFSET каждая пачка читается по индексу первичного
+    ключа, а в памяти держится только одна пачка.
+    '''
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        batch = queryset
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch.values_list('pk', *fields)[:size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1][0]
+
+
+def insert_sql(model, fields):
+    '''INSERT модели для cursor.executemany без создания объектов.'''
+    columns = [model._meta.get_field(name).column for name in fields]
+    return (
+        f'INSERT INTO {model._meta.db_table} ({", ".join(columns)}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))})'
+    )
+
+
+def date_keyset_page(queryset, after, limit, pk_field='pk'):
+    '''Страница строк, новые первыми, с курсором (pub_date, pk).
+
+    after - курсор последней показанной строки или None. Запрос идёт
+    по индексу, оканчивающемуся на (-pub_date, -pk), без OFFSET.
+    Возвращает список строк и курсор следующей страницы или None.
+    '''
+    queryset = queryset.order_by('-pub_date', f'-{pk_field}')
+    if after is not None:
+        queryset = queryset.filter(
+            Q(pub_date__lt=after[0])
+            | Q(pub_date=after[0], **{f'{pk_field}__lt': after[1]})
+        )
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = (last.pub_date, getattr(last, pk_field))
+    return rows[:limit], next_cursor
+
+
+def encode_date_cursor(cursor):
+    if not cursor:
+        return ''
+    pub_date, pk = cursor
+    return f'{(pub_date - EPOCH) // dt.timedelta(microseconds=1)}_{pk}'
+
+
+def decode_date_cursor(value):
+    try:
+        micros, pk = (value or '').split('_')
+        return EPOCH + dt.timedelta(microseconds=int(micros)), int(pk)
+    except (ValueError, OverflowError):
+        return None
@@ -1,11 +1,31 @@
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
 from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import urlencode
 from django.contrib.auth.decorators import login_required
-from .models import Post, Group, Comment, Follow, User
+from django.views.decorators.http import require_POST, require_safe
+from core.ratelimit import rate_limit
+from .models import (
+    Post, Group, Comment, Follow, FollowSuggestion, RelatedPost, Tag, User
+)
+from .autocomplete import INDEXES, STAFF_ONLY
 from .forms import PostForm, CommentForm
+from .groups import (
+    DEFAULT_GROUP_ORDERING, GROUP_ORDERINGS, group_directory, post_moved
+)
+from .search import decode_cursor, encode_cursor, find_text
+from .utils import date_keyset_page, decode_date_cursor, encode_date_cursor
+from . import archive, counters, follows, spam, tags, tasks, threads
 
 
 LIMIT_ELEMENT = 10
+COMMENTS_LIMIT = 20
+TRENDING_LIMIT = 100
+SUGGESTIONS_SHOWN = 5
 
 
 def paginator_func(request, posts):
@@ -16,6 +36,15 @@ def paginator_func(request, posts):
     return page_obj
 
 
+def suggested_authors(user):
+    '''Рекомендации из таблицы, заполненной командой suggest_authors.'''
+    if not user.is_authenticated:
+        return []
+    return FollowSuggestion.objects.filter(user=user).select_related(
+        'author'
+    )[:SUGGESTIONS_SHOWN]
+
+
 def index(request):
     '''Вернуть главную страницу.'''
     template = 'posts/index.html'
@@ -25,6 +54,36 @@ def index(request):
     context = {
         'title': title,
         'page_obj': page_obj,
+        'index': True,
+    }
+    return render(request, template, context)
+
+
+def trending(request):
+    '''Вернуть страницу популярных постов.'''
+    template = 'posts/trending.html'
+    title = 'Популярное'
+    posts = Post.objects.select_related('author', 'group').filter(
+        trend_score__gt=0
+    ).order_by('-trend_score', '-pk')[:TRENDING_LIMIT]
+    page_obj = paginator_func(request, posts)
+    context = {
+        'title': title,
+        'page_obj': page_obj,
+        'trending': True,
+    }
+    return render(request, template, context)
+
+
+def most_viewed(request):
+    '''Вернуть страницу самых просматриваемых постов.'''
+    template = 'posts/most_viewed.html'
+    title = 'Самое читаемое'
+    page_obj = paginator_func(request, counters.most_viewed())
+    context = {
+        'title': title,
+        'page_obj': page_obj,
+        'most_viewed': True,
     }
     return render(request, template, context)
 
@@ -44,6 +103,97 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+def group_index(request):
+    '''Вернуть каталог групп.'''
+    template = 'posts/groups.html'
+    title = 'Группы'
+    ordering = request.GET.get('sort')
+    if ordering not in GROUP_ORDERINGS:
+        ordering = DEFAULT_GROUP_ORDERING
+    page_obj = paginator_func(request, group_directory(ordering))
+    context = {
+        'title': title,
+        'page_obj': page_obj,
+        'ordering': ordering,
+    }
+    return render(request, template, context)
+
+
+def render_archive(request, posts, scope, scope_id, year, month, context):
+    '''Страница архива раздела: список месяцев и посты выбранного месяца.
+
+    Число постов по месяцам берётся из ArchiveMonth, посты месяца
+    читаются по индексу с курсором вместо номера страницы.
+    '''
+    url_name = context.pop('url_name')
+    url_args = context.pop('url_args', ())
+    months = [
+        {
+            'year': item.year,
+            'month': item.month,
+            'post_count': item.post_count,
+            'url': reverse(url_name, args=(*url_args, item.year, item.month)),
+            'active': (item.year, item.month) == (year, month),
+        }
+        for item in archive.archive_months(scope, scope_id)
+    ]
+    page, next_cursor = [], None
+    if year is not None:
+        if not archive.valid_month(year, month):
+            raise Http404
+        start, end = archive.month_range(year, month)
+        page, next_cursor = date_keyset_page(
+            posts.filter(pub_date__gte=start, pub_date__lt=end)
+            .select_related('author', 'group'),
+            decode_date_cursor(request.GET.get('after')),
+            archive.ARCHIVE_LIMIT
+        )
+    context.update({
+        'months': months,
+        'year': year,
+        'month': month,
+        'posts': page,
+        'next_cursor': encode_date_cursor(next_cursor),
+    })
+    return render(request, 'posts/archive.html', context)
+
+
+def site_archive(request, year=None, month=None):
+    '''Вернуть архив всех постов.'''
+    return render_archive(
+        request, Post.objects.all(), 'all', 0, year, month,
+        {'title': 'Архив', 'url_name': 'posts:archive'}
+    )
+
+
+def group_archive(request, slug, year=None, month=None):
+    '''Вернуть архив постов группы.'''
+    group = get_object_or_404(Group, slug=slug)
+    return render_archive(
+        request, group.posts.all(), 'group', group.pk, year, month,
+        {
+            'title': f'Архив сообщества {group}',
+            'group': group,
+            'url_name': 'posts:group_archive',
+            'url_args': (group.slug,),
+        }
+    )
+
+
+def profile_archive(request, username, year=None, month=None):
+    '''Вернуть архив постов автора.'''
+    author = get_object_or_404(User, username=username)
+    return render_archive(
+        request, author.posts.all(), 'author', author.pk, year, month,
+        {
+            'title': f'Архив пользователя {author}',
+            'author': author,
+            'url_name': 'posts:profile_archive',
+            'url_args': (author.username,),
+        }
+    )
+
+
 def profile(request, username):
     '''Вернуть страницу профиля.'''
     template = 'posts/profile.html'
@@ -63,25 +213,132 @@ def profile(request, username):
             author=author, user=request.user
         ).exists()
         context['following'] = following
+        context['suggestions'] = suggested_authors(request.user)
     return render(request, template, context)
 
 
+def reply_to_id(data):
+    '''id комментария, на который отвечают, из скрытого поля формы.'''
+    try:
+        return int(data.get('reply_to', ''))
+    except ValueError:
+        return None
+
+
+def comment_page(request, post_id):
+    '''Страница веток комментариев поста и ссылки на следующую.
+
+    Ветки листаются курсором, новые первыми, ответы в них идут
+    в порядке показа; авторы загружаются теми же запросами.
+    '''
+    comments, next_cursor = threads.thread_page(
+        post_id,
+        decode_date_cursor(request.GET.get('comments_after')),
+        COMMENTS_LIMIT
+    )
+    next_urls = {}
+    if next_cursor is not None:
+        query = urlencode({'comments_after': encode_date_cursor(next_cursor)})
+        page = reverse('posts:post_detail', args=(post_id,))
+        fragment = reverse('posts:comments', args=(post_id,))
+        next_urls = {
+            'page': f'{page}?{query}',
+            'fragment': f'{fragment}?{query}',
+        }
+    return comments, next_urls
+
+
 def post_detail(request, post_id):
     '''Вернуть страницу отдельного поста.'''
     template = 'posts/post_detail.html'
     post = get_object_or_404(Post.objects.select_related('author'), pk=post_id)
     author_posts_count = Post.objects.filter(author__pk=post.author.pk).count()
     form = CommentForm(request.POST or None)
-    comments = Comment.objects.filter(post=post)
+    comments, comments_next = comment_page(request, post.pk)
+    # Список заранее посчитан командой related_posts.
+    related_posts = RelatedPost.objects.filter(post=post).select_related(
+        'related'
+    )
+    counters.record_view(post.pk)
     context = {
         'post': post,
         'author_posts_count': author_posts_count,
         'form': form,
-        'comments': comments
+        'comments': comments,
+        'comments_next': comments_next,
+        'reply_to': reply_to_id(request.GET),
+        'related_posts': related_posts,
+    }
+    return render(request, template, context)
+
+
+@require_safe
+def comments(request, post_id):
+    '''Следующая страница комментариев для подгрузки скриптом.'''
+    comments, comments_next = comment_page(request, post_id)
+    html = render_to_string(
+        'includes/comment_list.html', {'comments': comments}, request=request
+    )
+    return JsonResponse({'html': html, 'next': comments_next.get('fragment')})
+
+
+def search(request):
+    '''Найти посты и комментарии по тексту.'''
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    hits, next_cursor = find_text(
+        query, decode_cursor(request.GET.get('after'))
+    )
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        {hit.post_id for hit in hits}
+    )
+    results = [
+        (posts[hit.post_id], hit) for hit in hits if hit.post_id in posts
+    ]
+    context = {
+        'title': f'Поиск: {query}' if query else 'Поиск',
+        'query': query,
+        'results': results,
+        'next_cursor': encode_cursor(next_cursor),
+    }
+    return render(request, template, context)
+
+
+def tag_posts(request, name):
+    '''Вернуть ленту постов с тегом.'''
+    template = 'posts/tag.html'
+    tag = get_object_or_404(Tag, name=name.lower())
+    posts, next_cursor = tags.tagged_posts(
+        tag, decode_date_cursor(request.GET.get('after'))
+    )
+    context = {
+        'title': f'Посты с тегом {tag}',
+        'tag': tag,
+        'posts': posts,
+        'next_cursor': encode_date_cursor(next_cursor),
+        'top_tags': tags.top_tags(),
     }
     return render(request, template, context)
 
 
+@require_safe
+def autocomplete(request, kind):
+    '''Подсказки по началу имени пользователя или названия группы.
+
+    Имена пользователей отдаются только персоналу.
+    '''
+    if kind not in INDEXES:
+        raise Http404
+    if kind in STAFF_ONLY and not request.user.is_staff:
+        raise PermissionDenied
+    term = request.GET.get('term', '').strip()
+    found = INDEXES[kind].search(term) if term else []
+    return JsonResponse({
+        'results': [{'id': pk, 'text': label} for pk, label in found]
+    })
+
+
+@rate_limit('post_create')
 @login_required
 def post_create(request):
     '''Создать новый пост.'''
@@ -94,9 +351,18 @@ def post_create(request):
         'username': request.user,
     }
     if form.is_valid():
+        verdict = spam.check_text(form.cleaned_data['text'], request.user)
+        if verdict.rejected:
+            form.add_error('text', spam.REJECT_MESSAGE)
+            return render(request, template, context)
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        spam.save_text_hash(verdict, request.user, post=post)
+        if 'image' in form.changed_data:
+            tasks.image_changed(post)
+        tags.update_post_tags(post)
+        tasks.notify_followers.delay(post.pk)
         return redirect('posts:profile', username=post.author)
     return render(request, template, context)
 
@@ -114,8 +380,25 @@ def post_edit(request, post_id):
         files=request.FILES or None,
         instance=post
     )
+    old_group_id = post.group_id
+    verdict = None
+    if form.is_valid() and 'text' in form.changed_data:
+        verdict = spam.check_text(
+            form.cleaned_data['text'], request.user, exclude={'post': post}
+        )
+        if verdict.rejected:
+            form.add_error('text', spam.REJECT_MESSAGE)
     if form.is_valid():
         form.save()
+        if verdict is not None:
+            spam.save_text_hash(verdict, request.user, post=post)
+        if 'image' in form.changed_data:
+            tasks.image_changed(post)
+        if 'group' in form.changed_data:
+            post_moved(post, old_group_id)
+            archive.post_moved(post, old_group_id)
+        if 'text' in form.changed_data:
+            tags.update_post_tags(post)
         return redirect('posts:post_detail', post_id=post.id)
     context = {
         'title': title,
@@ -126,16 +409,45 @@ def post_edit(request, post_id):
     return render(request, template, context)
 
 
+@rate_limit('add_comment')
 @login_required
 def add_comment(request, post_id):
-    '''Добавить комментарий.'''
+    '''Добавить комментарий.
+
+    На запрос скрипта из includes/comment.html отвечает JSON с разметкой
+    нового комментария вместо перехода на страницу поста. Причина отказа
+    показывается сообщением на странице поста после перехода.
+    '''
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+        verdict = spam.check_text(form.cleaned_data['text'], request.user)
+        if verdict.rejected:
+            form.add_error('text', spam.REJECT_MESSAGE)
+        else:
+            comment = form.save(commit=False)
+            comment.author = request.user
+            comment.post = post
+            reply_to = reply_to_id(request.POST)
+            if reply_to is not None:
+                comment.parent = threads.reply_parent(
+                    Comment.objects.filter(pk=reply_to, post=post).first()
+                )
+            comment.save()
+            spam.save_text_hash(verdict, request.user, comment=comment)
+            if request.is_ajax():
+                html = render_to_string(
+                    'includes/comment_item.html', {'comment': comment},
+                    request=request
+                )
+                return JsonResponse({'html': html}, status=201)
+    if request.is_ajax():
+        return JsonResponse(
+            {'errors': form.errors.get('text', ['Пустой комментарий.'])},
+            status=400
+        )
+    for error in form.errors.get('text', []):
+        messages.error(request, error)
     return redirect('posts:post_detail', post_id=post_id)
 
 
@@ -148,23 +460,49 @@ def follow_index(request):
     template = 'posts/follow.html'
     context = {
         'title': title,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'follow': True,
+        'suggestions': suggested_authors(request.user),
     }
     return render(request, template, context)
 
 
+def follow_response(request, author, following):
+    '''JSON для скрипта кнопки подписки, переход в ленту для ссылки.'''
+    if request.method == 'POST' or request.is_ajax():
+        return JsonResponse(
+            {'username': author.username, 'following': following}
+        )
+    return redirect('posts:follow_index')
+
+
+@rate_limit('profile_follow', methods=None)
 @login_required
 def profile_follow(request, username):
-    '''Подписаться на автора.'''
+    '''Подписаться на автора.
+
+    Повторная подписка ничего не меняет, подписка на себя игнорируется.
+    '''
     author = get_object_or_404(User, username=username)
-    if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
-    return redirect('posts:follow_index')
+    follows.follow(request.user, [author.pk])
+    return follow_response(request, author, author != request.user)
 
 
 @login_required
 def profile_unfollow(request, username):
-    '''Отписаться от автора.'''
+    '''Отписаться от автора, даже если подписки уже нет.'''
     author = get_object_or_404(User, username=username)
-    Follow.objects.get(user=request.user, author=author).delete()
-    return redirect('posts:follow_index')
+    follows.unfollow(request.user, author.pk)
+    return follow_response(request, author, False)
+
+
+@rate_limit('profile_follow')
+@login_required
+@require_POST
+def bulk_follow(request):
+    '''Подписаться на несколько авторов из списка username.'''
+    author_ids = follows.author_ids(request.POST.getlist('username'))
+    follows.follow(request.user, author_ids)
+    return JsonResponse(
+        {'following': len(set(author_ids) - {request.user.pk})}
+    )
@@ -1,8 +1,11 @@
+from django.utils.decorators import method_decorator
 from django.views.generic import CreateView
 from django.urls import reverse_lazy
+from core.ratelimit import rate_limit
 from .forms import CreationForm
 
 
+@method_decorator(rate_limit('signup'), name='dispatch')
 class SignUp(CreateView):
     '''Зарегистрировать пользователя'''
     form_class = CreationForm
@@ -133,6 +133,20 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+
+# collectstatic writes content-hashed names, a manifest and .gz/.br copies
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+# A name missing from the manifest fails the page in production; with DEBUG
+# and in the project's tests the unhashed name is used instead
+STATIC_MANIFEST_STRICT = not DEBUG
+
+# Browser cache lifetime for static files without a content hash
+STATIC_MAX_AGE = 60 * 60
+
+# Internal nginx location aliased to STATIC_ROOT for X-Accel-Redirect
+STATIC_ACCEL_PREFIX = '/internal-static/'
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
@@ -144,14 +158,81 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Absolute links in emails
+SITE_URL = 'http://localhost:8000'
+# New-post emails to followers wait this many seconds, so posts published
+# meanwhile reach each follower as one email
+NOTIFY_DELAY = 5 * 60
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Browser cache lifetime for media files and sorl thumbnails alike:
+# thumbnail names follow the source name, not its content
+MEDIA_MAX_AGE = 60 * 60 * 24
+# Hand media and static transfers to the front proxy: 'X-Accel-Redirect'
+# (nginx) or 'X-Sendfile' (Apache, lighttpd); None streams files from Django
+SENDFILE = None
+# Internal nginx location aliased to MEDIA_ROOT for X-Accel-Redirect
+MEDIA_ACCEL_PREFIX = '/internal-media/'
+
+# Thumbnail sizes rendered in templates (see includes/image.html);
+# `manage.py rebuild_thumbnails` builds every size listed here
+POST_THUMBNAILS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+# Near-duplicate posts and comments (simhash). Action: 'flag' only marks
+# them for review in the admin, 'reject' refuses them, 'rate-limit' refuses
+# them once the author sent SPAM_TEXT_RATE[0] duplicates in SPAM_TEXT_RATE[1]
+# seconds
+SPAM_TEXT_ACTION = 'flag'
+SPAM_TEXT_DISTANCE = 3
+SPAM_TEXT_RATE = (3, 60 * 60)
+
+# Post page views are buffered in each process (posts.counters) and added
+# to Post.view_count by a daemon thread every VIEW_COUNT_FLUSH_INTERVAL
+# seconds, once VIEW_COUNT_BUFFER_SIZE posts are pending, and on a clean
+# exit; a crash loses at most the last interval of views
+VIEW_COUNT_FLUSH_INTERVAL = 10
+VIEW_COUNT_BUFFER_SIZE = 1000
+VIEW_COUNT_FLUSH_THREAD = True
+
+# Background jobs (core.jobs): 'database' stores them for
+# `manage.py run_jobs`, 'thread' runs them after commit in a pool of
+# JOBS_THREADS threads (lost on restart), 'eager' runs them inline
+JOBS_BACKEND = 'database'
+JOBS_THREADS = 2
 
 # Connecting the caching backend
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    # Rate limit buckets; with several worker processes this must be a
+    # shared cache (memcached, redis) for the limits to hold
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Token bucket rate limits (core.ratelimit) for write views:
+# (per user, per IP), each (requests, seconds) or None. A bucket holds
+# `requests` tokens and refills completely in `seconds`
+RATE_LIMIT_CACHE = 'ratelimit'
+RATE_LIMITS = {
+    'post_create': ((10, 60 * 10), (30, 60 * 10)),
+    'add_comment': ((20, 60), (60, 60)),
+    'profile_follow': ((60, 60), (120, 60)),
+    'signup': (None, (5, 60 * 60)),
 }
+# META key with the client address behind a proxy, e.g. 'HTTP_X_REAL_IP'
+# set by the proxy; for 'HTTP_X_FORWARDED_FOR' the last entry, appended by
+# a single trusted proxy, is used. None, or a request without the header,
+# uses REMOTE_ADDR
+RATE_LIMIT_IP_HEADER = None
+# The project's own tests run without rate limits, core.tests enables them
+TEST_RUNNER = 'core.testing.DiscoverRunner'